@@ -131,6 +131,7 @@ class Agent:
                 headers['X-Ingest-Token'] = self.token
             
             payload = {
+                "host_id": self.host_id,
                 "events": events
             }
             
@@ -1,33 +1,87 @@
 import json
+import time
+import atexit
 import hashlib
 import socket
 import os
 from datetime import datetime
+from field_extractor import extract_fields
+from log_time import log_time_iso
+from data_store import submit_events, flush_events, dedupe_events
+
+# 攒满多少条事件交给写线程一次
+BATCH_SIZE = 1000
+# 摘要文件的最长刷新间隔（秒）；扫描结束时总会刷新一次
+SUMMARY_FLUSH_SEC = 5.0
+# 每秒最多逐条打印的检测结果，其余只计数
+PRINT_PER_SEC = 20
 
 class ResultManager:
+    """检测结果的缓冲汇集点
+
+    事件攒批后交给写线程，摘要计数先累计在内存中，定期或在 flush() 时合并进
+    summary.json 一次；控制台输出按秒限流。扫描结束（或进程退出）时调用 flush()。
+    """
+
     def __init__(self):
         self.results = []
         self.start_time = None
+        self.data_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+        self.summary_file = os.path.join(self.data_dir, 'summary.json')
+        self._type_counts = {}
+        self._pending = []
+        self._summary_delta = self._empty_delta()
+        self._summary_at = time.time()
+        self._print_window = 0
+        self._printed = 0
+        self._suppressed = 0
+        atexit.register(self.flush)
     
     def start_timer(self):
         """开始计时"""
-        import time
         self.start_time = time.time()
     
     def get_elapsed_time(self):
         """获取经过的时间"""
-        import time
         if self.start_time:
             return time.time() - self.start_time
         return 0
     
     def add_result(self, result):
-        """添加检测结果"""
+        """添加检测结果；被去重丢弃或未能放入写入队列的结果不打印、不计入统计与报告
+
+        计数以放入写入队列为准：写线程之后写入失败时只打印 [WRITER] 错误，不回退已计入的统计。
+        """
+        if not self.handle_detection(result):
+            return
         self.results.append(result)
-        self.handle_detection(result)
+        t = result.get('type')
+        self._type_counts[t] = self._type_counts.get(t, 0) + 1
     
     def handle_detection(self, result):
-        """处理检测结果"""
+        """处理检测结果，返回是否已放入写入队列"""
+        # 持久化存储
+        try:
+            written = self.persist_event(result)
+        except Exception as e:
+            print(f"❌ 数据写入失败: {e}")
+            return False
+        if written:
+            self._print_result(result)
+        return written
+    
+    def _print_result(self, result):
+        """逐条打印检测结果，每秒超过 PRINT_PER_SEC 条后只计数"""
+        now = int(time.time())
+        if now != self._print_window:
+            self._report_suppressed()
+            self._print_window = now
+            self._printed = 0
+        if self._printed >= PRINT_PER_SEC:
+            self._suppressed += 1
+            return
+        self._printed += 1
+        
         # 根据严重级别选择表情符号
         severity_emoji = {
             'critical': '🔥',
@@ -39,26 +93,26 @@ class ResultManager:
         # 截断过长的消息
         message_preview = result['message'][:100] + '...' if len(result['message']) > 100 else result['message']
         print(f"{severity_emoji} [{result['type'].upper()}] {message_preview}")
-        
-        # 持久化存储
-        try:
-            self.persist_event(result)
-        except Exception as e:
-            print(f"❌ 数据写入失败: {e}")
+    
+    def _report_suppressed(self):
+        if self._suppressed:
+            print(f"   ...... 另有 {self._suppressed} 条检测结果未逐条显示")
+            self._suppressed = 0
     
     def persist_event(self, result):
-        """持久化存储事件"""
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
-        os.makedirs(data_dir, exist_ok=True)
-        anomalies = os.path.join(data_dir, 'anomalies.ndjson')
-        summary_file = os.path.join(data_dir, 'summary.json')
+        """构造事件并放入写入缓冲，返回是否被接受
 
-        detected_at = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        与之前的事件重复时丢弃并返回 False。返回 True 只表示事件进入了写入队列，
+        实际写入由写线程异步完成，结果不回传到这里。
+        """
+        scanned_at = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
         source_file = result.get('file', '')
         line_number = result.get('line_number', 0)
         host_id = socket.gethostname()
         msg = result.get('message', '')
-        raw_id = f"{host_id}{source_file}{line_number}{detected_at}{msg}".encode('utf-8')
+        # 优先使用日志自带时间，解析失败时回退到扫描时间
+        detected_at = log_time_iso(source_file, msg, scanned_at)
+        raw_id = f"{host_id}{source_file}{line_number}{scanned_at}{msg}".encode('utf-8')
         eid = hashlib.sha256(raw_id).hexdigest()[:16]
         sev_map = {"critical": "critical", "high": "major", "medium": "minor", "low": "minor"}
         sev = sev_map.get(result.get('severity', 'medium'), 'minor')
@@ -73,25 +127,69 @@ class ResultManager:
             "line_number": line_number,
             "detected_at": detected_at,
             "host_id": host_id,
-            "processed": False
+            "processed": False,
+            "fields": extract_fields(msg)
         }
         
-        # 写入主异常文件
-        with open(anomalies, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(event) + "\n")
+        # 重扫同一日志时内容相同的事件只保留第一次
+        if not dedupe_events([event], scanned_at):
+            return False
         
-        # 按日期存储
-        day_dir = os.path.join(data_dir, 'anomalies')
-        os.makedirs(day_dir, exist_ok=True)
-        day_file = os.path.join(day_dir, datetime.utcnow().strftime('%Y-%m-%d') + '.ndjson')
-        with open(day_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(event) + "\n")
-        
-        # 更新摘要文件
-        self.update_summary(summary_file, event, detected_at, sev)
+        self._pending.append(event)
+        self._count_summary(event)
+        if len(self._pending) >= BATCH_SIZE:
+            self._flush_events()
+        if time.time() - self._summary_at >= SUMMARY_FLUSH_SEC:
+            self._flush_summary()
+        return True
+    
+    def _flush_events(self):
+        """把缓冲的事件整批交给写线程（NDJSON 日分区或 SQLite，由 storage 配置决定）"""
+        if self._pending:
+            batch, self._pending = self._pending, []
+            submit_events(batch)
+    
+    @staticmethod
+    def _empty_delta():
+        return {"total": 0, "by_severity": {}, "by_type": {}, "last_detection": None}
+    
+    def _count_summary(self, event):
+        d = self._summary_delta
+        d["total"] += 1
+        sev = event['severity']
+        d["by_severity"][sev] = d["by_severity"].get(sev, 0) + 1
+        t = event['type']
+        d["by_type"][t] = d["by_type"].get(t, 0) + 1
+        # 日志自带时间不按扫描顺序递增，取最大值
+        ts = event['detected_at']
+        if ts and (d["last_detection"] is None or ts > d["last_detection"]):
+            d["last_detection"] = ts
+    
+    def _flush_summary(self):
+        """把内存中累计的计数合并进摘要文件（读一次、写一次）"""
+        self._summary_at = time.time()
+        d = self._summary_delta
+        if not d["total"]:
+            return
+        self._summary_delta = self._empty_delta()
+        self.update_summary(self.summary_file, d)
+    
+    def flush(self):
+        """扫描结束时调用：写出缓冲事件并落盘、刷新摘要、补打被限流的输出"""
+        self._report_suppressed()
+        try:
+            self._flush_events()
+            flush_events()
+        except Exception as e:
+            print(f"❌ 数据写入失败: {e}")
+        try:
+            self._flush_summary()
+        except Exception as e:
+            print(f"❌ 摘要写入失败: {e}")
     
-    def update_summary(self, summary_file, event, detected_at, severity):
-        """更新摘要文件"""
+    def update_summary(self, summary_file, delta):
+        """把一批计数合并进摘要文件"""
+        os.makedirs(os.path.dirname(summary_file), exist_ok=True)
         if os.path.exists(summary_file):
             with open(summary_file, 'r', encoding='utf-8') as f:
                 s = json.load(f)
@@ -106,15 +204,17 @@ class ResultManager:
                 "trend": []
             }
         
-        s['total_anomalies'] = int(s.get('total_anomalies', 0)) + 1
+        s['total_anomalies'] = int(s.get('total_anomalies', 0)) + delta['total']
         bs = s.get('by_severity', {"critical": 0, "major": 0, "minor": 0})
-        bs[severity] = int(bs.get(severity, 0)) + 1
+        for severity, n in delta['by_severity'].items():
+            bs[severity] = int(bs.get(severity, 0)) + n
         s['by_severity'] = bs
         bt = s.get('by_type', {})
-        t = event['type']
-        bt[t] = int(bt.get(t, 0)) + 1
+        for t, n in delta['by_type'].items():
+            bt[t] = int(bt.get(t, 0)) + n
         s['by_type'] = bt
-        s['last_detection'] = detected_at
+        if delta['last_detection'] and delta['last_detection'] > (s.get('last_detection') or ''):
+            s['last_detection'] = delta['last_detection']
         
         with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(s, f)
@@ -123,8 +223,7 @@ class ResultManager:
         """获取统计信息"""
         stats = {}
         for detector_type in detector_names:
-            count = len([r for r in self.results if r['type'] == detector_type])
-            stats[detector_type] = count
+            stats[detector_type] = self._type_counts.get(detector_type, 0)
         return stats
     
     def show_statistics(self, detector_names):
@@ -14,11 +14,16 @@ from detective.deadlock_detector import DeadlockDetector
 from detective.fs_exception_detector import FSExceptionDetector
 
 class DetectorManager:
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, verbose=True):
         self.config_manager = config_manager
+        self.verbose = verbose
         self.detectors = []
         self.setup_detectors()
     
+    def _log(self, msg):
+        if self.verbose:
+            print(msg)
+    
     def setup_detectors(self):
         """初始化检测器"""
         detector_classes = {
@@ -30,7 +35,7 @@ class DetectorManager:
             'fs_exception': FSExceptionDetector
         }
         
-        print("🔧 正在初始化检测器...")
+        self._log("🔧 正在初始化检测器...")
         
         for detector_name, detector_class in detector_classes.items():
             config = self.config_manager.get_detector_config(detector_name)
@@ -39,11 +44,11 @@ class DetectorManager:
                     detector = detector_class(config)
                     self.detectors.append(detector)
                     keyword_count = len(config.get('keywords', []))
-                    print(f"   ✅ {detector_name.upper()}检测器已加载 ({keyword_count}个关键词)")
+                    self._log(f"   ✅ {detector_name.upper()}检测器已加载 ({keyword_count}个关键词)")
                 except Exception as e:
                     print(f"   ❌ {detector_name.upper()}检测器加载失败: {e}")
             else:
-                print(f"   ⚠️  {detector_name.upper()}检测器已禁用")
+                self._log(f"   ⚠️  {detector_name.upper()}检测器已禁用")
     
     def analyze_line(self, line):
         """分析单行日志"""
@@ -1,6 +1,7 @@
 # llm_analyzer.py
 import json
 import os
+import gzip
 from openai import OpenAI
 
 class LLMAnalyzer:
@@ -21,9 +22,18 @@ class LLMAnalyzer:
         anomalies = []
         summary = {}
         
-        # 读取异常记录
+        # 读取异常记录：日分区 data/anomalies/YYYY-MM-DD.ndjson，兼容旧版单文件
+        day_dir = os.path.join(data_dir, 'anomalies')
+        files = []
+        if os.path.isdir(day_dir):
+            files = [os.path.join(day_dir, n) for n in sorted(os.listdir(day_dir))
+                     if n.endswith('.ndjson') or n.endswith('.ndjson.gz')]
         if os.path.exists(anomalies_file):
-            with open(anomalies_file, 'r', encoding='utf-8') as f:
+            files.append(anomalies_file)
+        for fp in files:
+            # 早期日分区会被压缩为 .ndjson.gz 冷段
+            opener = gzip.open if fp.endswith('.gz') else open
+            with opener(fp, 'rt', encoding='utf-8') as f:
                 for line in f:
                     if line.strip():
                         anomalies.append(json.loads(line.strip()))
@@ -63,6 +63,9 @@ class ExceptionMonitor:
             print("📖 正在读取: systemd journalctl")
             total_detections += self.journal_scanner.scan_journal()
         
+        # 缓冲的事件与摘要计数在扫描结束时统一写出
+        self.result_manager.flush()
+        
         # 输出扫描统计
         elapsed_time = self.result_manager.get_elapsed_time()
         print(f"\n📊 扫描完成!")
@@ -150,8 +153,42 @@ def parse_args():
                        choices=['keyword', 'regex', 'mixed'],
                        help='指定检测模式: keyword(纯关键字), regex(纯正则), mixed(混合模式)')
     
+    # 规则回测（回放）模式参数
+    parser.add_argument('--replay', nargs='+', metavar='PATH',
+                       help='回放模式: 在指定的归档日志文件/目录上运行规则，不写入事件存储')
+    
+    parser.add_argument('--rules',
+                       help='回放模式下使用的候选规则文件（默认使用 --config）')
+    
+    parser.add_argument('--diff', action='store_true',
+                       help='回放模式下与 --config 指定的当前规则进行对比')
+    
+    parser.add_argument('--workers', type=int, default=None,
+                       help='回放模式下的并行进程数（默认CPU核数）')
+    
+    parser.add_argument('--samples', type=int, default=5,
+                       help='回放模式下每个检测器保留的样例行数')
+    
+    parser.add_argument('--replay-output',
+                       help='回放模式下将报告另存为 JSON 文件')
+    
     return parser.parse_args()
 
+def run_replay(args):
+    """规则回放入口"""
+    from replay.replay_runner import ReplayRunner
+    runner = ReplayRunner(
+        args.rules or args.config,
+        baseline_path=args.config if args.diff else None,
+        detection_mode=args.detection_mode,
+        workers=args.workers,
+        sample_size=args.samples
+    )
+    report = runner.run(args.replay)
+    runner.print_report(report)
+    if args.replay_output:
+        runner.save_report(args.replay_output, report)
+
 def main():
     """主程序入口"""
     print("=" * 60)
@@ -163,6 +200,10 @@ def main():
     # 解析命令行参数
     args = parse_args()
     
+    if args.replay:
+        run_replay(args)
+        return
+    
     # 创建监控实例并执行扫描
     monitor = ExceptionMonitor(args.config, args.detection_mode)
     monitor.scan_logs()
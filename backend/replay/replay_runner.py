@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import gzip
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomaly_config.config_master import ConfigManager
+from detective.detector_ctrl import DetectorManager
+from log.file_scanner import FileScanner
+
+# 大文件按字节区间切分，交给多个进程并行回放
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# 每个工作进程内缓存已构建的检测器，避免每个分片重复加载规则
+_detector_cache = {}
+
+def _load_detectors(rules_path, detection_mode):
+    key = (rules_path, detection_mode)
+    if key not in _detector_cache:
+        cm = ConfigManager(rules_path)
+        if detection_mode:
+            cm.config['detection_mode'] = detection_mode
+        _detector_cache[key] = DetectorManager(cm, verbose=False).detectors
+    return _detector_cache[key]
+
+def _open_chunk(path, start):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    f = open(path, 'rb')
+    if start > 0:
+        # 从上一个换行之后开始，保证分片边界对齐到整行
+        f.seek(start - 1)
+        f.readline()
+    return f
+
+def _new_side():
+    return {"hits": {}, "cpu_sec": {}, "samples": {}}
+
+def _replay_chunk(task):
+    """回放单个分片：对每一行分别运行每组规则的每个检测器
+
+    :param task: (path, start, end, rule_paths, detection_mode, sample_size)
+    :return: 分片统计结果（可在父进程中合并）
+    """
+    path, start, end, rule_paths, detection_mode, sample_size = task
+    sets = [_load_detectors(p, detection_mode) for p in rule_paths]
+    sides = [_new_side() for _ in sets]
+    diff = {"gained": {}, "lost": {}, "gained_samples": {}, "lost_samples": {}}
+    lines = 0
+    nbytes = 0
+    clock = time.process_time
+    try:
+        f = _open_chunk(path, start)
+    except (OSError, PermissionError) as e:
+        return {"lines": 0, "bytes": 0, "sides": sides, "diff": diff, "errors": [f"{path}: {e}"]}
+    with f:
+        pos = f.tell() if end is not None else 0
+        for raw in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(raw)
+            nbytes += len(raw)
+            lines += 1
+            line = raw.decode('utf-8', 'ignore')
+            matched = []
+            for side, detectors in zip(sides, sets):
+                names = set()
+                for d in detectors:
+                    t0 = clock()
+                    try:
+                        r = d.detect(line)
+                    except Exception:
+                        r = None
+                    side["cpu_sec"][d.name] = side["cpu_sec"].get(d.name, 0.0) + (clock() - t0)
+                    if r:
+                        names.add(d.name)
+                        side["hits"][d.name] = side["hits"].get(d.name, 0) + 1
+                        samples = side["samples"].setdefault(d.name, [])
+                        if len(samples) < sample_size:
+                            samples.append({"file": path, "line": line.strip()[:300]})
+                matched.append(names)
+            if len(matched) == 2 and matched[0] != matched[1]:
+                for kind, names in (("gained", matched[0] - matched[1]), ("lost", matched[1] - matched[0])):
+                    for n in names:
+                        diff[kind][n] = diff[kind].get(n, 0) + 1
+                        samples = diff[kind + "_samples"].setdefault(n, [])
+                        if len(samples) < sample_size:
+                            samples.append({"file": path, "line": line.strip()[:300]})
+    return {"lines": lines, "bytes": nbytes, "sides": sides, "diff": diff, "errors": []}
+
+def _merge_counts(dst, src):
+    for k, v in src.items():
+        dst[k] = dst.get(k, 0) + v
+
+def _merge_samples(dst, src, sample_size):
+    for k, v in src.items():
+        cur = dst.setdefault(k, [])
+        cur.extend(v[:max(0, sample_size - len(cur))])
+
+class ReplayRunner:
+    """规则回测：在归档日志上回放候选规则，不写入任何事件存储"""
+
+    def __init__(self, rules_path, baseline_path=None, detection_mode=None, workers=None, sample_size=5):
+        """
+        :param rules_path: 候选规则文件（与 default.yaml 结构相同）
+        :param baseline_path: 可选，当前线上规则文件；给出时输出差异
+        :param detection_mode: 可选，覆盖规则文件中的全局检测模式
+        :param workers: 并行进程数，默认 CPU 核数
+        :param sample_size: 每个检测器保留的样例行数
+        """
+        self.rules_path = os.path.abspath(rules_path)
+        self.baseline_path = os.path.abspath(baseline_path) if baseline_path else None
+        self.detection_mode = detection_mode
+        self.workers = workers or os.cpu_count() or 1
+        self.sample_size = sample_size
+
+    def collect_files(self, paths):
+        """收集待回放的日志文件（目录按日志文件规则展开）"""
+        scanner = FileScanner(ConfigManager(self.rules_path))
+        files = []
+        for p in paths:
+            ap = os.path.abspath(p)
+            if os.path.isfile(ap):
+                files.append(ap)
+            elif os.path.isdir(ap):
+                files.extend(scanner.scan_directory(ap))
+        return files
+
+    def build_tasks(self, files):
+        """按文件与字节区间切分回放任务"""
+        rule_paths = [self.rules_path] + ([self.baseline_path] if self.baseline_path else [])
+        tasks = []
+        for fp in files:
+            try:
+                size = os.path.getsize(fp)
+            except OSError:
+                continue
+            if fp.endswith('.gz') or size <= CHUNK_BYTES:
+                tasks.append((fp, 0, None, rule_paths, self.detection_mode, self.sample_size))
+                continue
+            for start in range(0, size, CHUNK_BYTES):
+                tasks.append((fp, start, min(size, start + CHUNK_BYTES), rule_paths, self.detection_mode, self.sample_size))
+        return tasks
+
+    def run(self, paths):
+        """执行回放并返回报告 dict"""
+        files = self.collect_files(paths)
+        tasks = self.build_tasks(files)
+        started = time.time()
+        sides = [_new_side() for _ in range(2 if self.baseline_path else 1)]
+        diff = {"gained": {}, "lost": {}, "gained_samples": {}, "lost_samples": {}}
+        lines = 0
+        nbytes = 0
+        errors = []
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(_replay_chunk, tasks))
+        else:
+            results = [_replay_chunk(t) for t in tasks]
+        for r in results:
+            lines += r["lines"]
+            nbytes += r["bytes"]
+            errors.extend(r["errors"])
+            for dst, src in zip(sides, r["sides"]):
+                _merge_counts(dst["hits"], src["hits"])
+                _merge_counts(dst["cpu_sec"], src["cpu_sec"])
+                _merge_samples(dst["samples"], src["samples"], self.sample_size)
+            _merge_counts(diff["gained"], r["diff"]["gained"])
+            _merge_counts(diff["lost"], r["diff"]["lost"])
+            _merge_samples(diff["gained_samples"], r["diff"]["gained_samples"], self.sample_size)
+            _merge_samples(diff["lost_samples"], r["diff"]["lost_samples"], self.sample_size)
+        elapsed = max(time.time() - started, 1e-9)
+
+        def side_report(side):
+            names = sorted(set(side["hits"]) | set(side["cpu_sec"]))
+            return {
+                n: {
+                    "hits": side["hits"].get(n, 0),
+                    "cpu_sec": round(side["cpu_sec"].get(n, 0.0), 4),
+                    "us_per_line": round(side["cpu_sec"].get(n, 0.0) * 1e6 / lines, 3) if lines else 0.0,
+                    "samples": side["samples"].get(n, [])
+                } for n in names
+            }
+
+        report = {
+            "rules": self.rules_path,
+            "files": len(files),
+            "tasks": len(tasks),
+            "workers": self.workers,
+            "lines": lines,
+            "bytes": nbytes,
+            "elapsed_sec": round(elapsed, 3),
+            "lines_per_sec": round(lines / elapsed, 1),
+            "mb_per_sec": round(nbytes / elapsed / 1048576, 2),
+            "detectors": side_report(sides[0]),
+            "errors": errors
+        }
+        if self.baseline_path:
+            base = side_report(sides[1])
+            names = sorted(set(report["detectors"]) | set(base))
+            report["baseline"] = {"rules": self.baseline_path, "detectors": base}
+            report["diff"] = {
+                n: {
+                    "candidate_hits": report["detectors"].get(n, {}).get("hits", 0),
+                    "baseline_hits": base.get(n, {}).get("hits", 0),
+                    "gained": diff["gained"].get(n, 0),
+                    "lost": diff["lost"].get(n, 0),
+                    "gained_samples": diff["gained_samples"].get(n, []),
+                    "lost_samples": diff["lost_samples"].get(n, [])
+                } for n in names
+            }
+        return report
+
+    def print_report(self, report):
+        """在控制台输出回放报告"""
+        print("\n📼 规则回放完成（未写入任何事件存储）")
+        print("-" * 60)
+        print(f"   规则文件: {report['rules']}")
+        print(f"   文件数: {report['files']}  分片数: {report['tasks']}  进程数: {report['workers']}")
+        print(f"   总行数: {report['lines']}  耗时: {report['elapsed_sec']:.2f}秒")
+        print(f"   吞吐: {report['lines_per_sec']:.0f} 行/秒, {report['mb_per_sec']:.2f} MB/秒")
+        print("\n📈 检测器命中与开销:")
+        for name, d in sorted(report["detectors"].items(), key=lambda x: x[1]["hits"], reverse=True):
+            print(f"   {name.upper():<14}: {d['hits']:>8} 次  CPU {d['cpu_sec']:.3f}秒  ({d['us_per_line']:.2f} µs/行)")
+            for s in d["samples"]:
+                print(f"      ↳ {s['line'][:120]}")
+        if "diff" in report:
+            print(f"\n🔀 与当前规则对比: {report['baseline']['rules']}")
+            for name, d in report["diff"].items():
+                delta = d["candidate_hits"] - d["baseline_hits"]
+                print(f"   {name.upper():<14}: 候选 {d['candidate_hits']} / 当前 {d['baseline_hits']} "
+                      f"(Δ{delta:+d}, 新增 {d['gained']}, 丢失 {d['lost']})")
+                for s in d["gained_samples"]:
+                    print(f"      + {s['line'][:120]}")
+                for s in d["lost_samples"]:
+                    print(f"      - {s['line'][:120]}")
+        for e in report["errors"]:
+            print(f"   ❌ {e}")
+
+    def save_report(self, output_file, report):
+        """将回放报告保存为 JSON"""
+        directory = os.path.dirname(os.path.abspath(output_file))
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 回放报告已保存至: {os.path.abspath(output_file)}")
@@ -0,0 +1,180 @@
+import os
+import gzip
+import json
+import zlib
+import bisect
+
+# 冷段后缀：YYYY-MM-DD[.N].ndjson.gz，旁边的 .hdr 为 JSON 头信息
+COLD_SUFFIX = '.gz'
+HEADER_SUFFIX = '.hdr'
+
+# 每个 gzip 成员压缩的原始字节数；按偏移读取单条事件时最多解压一个成员
+BLOCK_BYTES = 1024 * 1024
+
+_header_cache = {}
+
+def is_cold(path):
+    return path.endswith(COLD_SUFFIX)
+
+def header_path(path):
+    return path + HEADER_SUFFIX
+
+def read_header(path):
+    """读取冷段头信息（按头文件 mtime 缓存），缺失或损坏时返回 None
+
+    头信息：events、bytes（原始字节数，与热段汇总的字节水位同义）、gz_bytes、
+    first/last（detected_at 范围）、hours（小时汇总）、blocks（[原始偏移, 压缩偏移]）
+    """
+    hp = header_path(path)
+    try:
+        mt = os.path.getmtime(hp)
+    except OSError:
+        _header_cache.pop(path, None)
+        return None
+    cached = _header_cache.get(path)
+    if cached and cached[0] == mt:
+        return cached[1]
+    try:
+        with open(hp, 'r', encoding='utf-8') as f:
+            hdr = json.load(f)
+        if not isinstance(hdr, dict) or 'hours' not in hdr:
+            hdr = None
+    except:
+        hdr = None
+    _header_cache[path] = (mt, hdr)
+    return hdr
+
+def write_header(path, hdr):
+    hp = header_path(path)
+    tmp = hp + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(hdr, f)
+    os.replace(tmp, hp)
+
+def remove(path):
+    """删除冷段及其头信息"""
+    for p in (path, header_path(path)):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    _header_cache.pop(path, None)
+
+def _write_blocks(f, data, raw_base, blocks):
+    """把 data 按 BLOCK_BYTES 在行边界切块，每块写成一个独立的 gzip 成员"""
+    pos = 0
+    while pos < len(data):
+        end = pos + BLOCK_BYTES
+        if end < len(data):
+            nl = data.find(b'\n', end)
+            end = len(data) if nl < 0 else nl + 1
+        else:
+            end = len(data)
+        blocks.append([raw_base + pos, f.tell()])
+        f.write(gzip.compress(data[pos:end], compresslevel=6, mtime=0))
+        pos = end
+
+def compress(src, dst, hdr):
+    """把热段 src 压缩为多成员 gzip 文件 dst 并写出头信息
+
+    压缩期间 src 若又被追加，新增部分作为额外成员接在末尾。调用方负责删除 src。
+
+    :param hdr: 段汇总（events/bytes/hours，可含 first/last），写入头信息
+    :return: 头信息
+    """
+    tmp = dst + '.tmp'
+    blocks = []
+    with open(src, 'rb') as old:
+        data = old.read()
+        with open(tmp, 'wb') as f:
+            _write_blocks(f, data, 0, blocks)
+            extra = os.fstat(old.fileno()).st_size - len(data)
+            if extra > 0:
+                old.seek(len(data))
+                tail = old.read(extra)
+                tail = tail[:tail.rfind(b'\n') + 1]
+                _write_blocks(f, tail, len(data), blocks)
+                data += tail
+            gz_bytes = f.tell()
+    hdr = dict(hdr)
+    hdr['bytes'] = len(data)
+    hdr['gz_bytes'] = gz_bytes
+    hdr['blocks'] = blocks
+    # 先写头信息再改名：读者看到 .gz 时头信息一定已就绪
+    write_header(dst, hdr)
+    os.replace(tmp, dst)
+    return hdr
+
+def raw_size(path):
+    """段的原始（未压缩）字节数；冷段取头信息，头信息缺失时返回 None"""
+    if is_cold(path):
+        hdr = read_header(path)
+        return hdr['bytes'] if hdr else None
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def open_raw(path):
+    """以二进制方式打开段的原始字节流（冷段透明解压）"""
+    if is_cold(path):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def read_range(path, off, length):
+    """读取原始偏移 [off, off+length) 的字节；冷段只解压覆盖该范围的成员"""
+    if not is_cold(path):
+        with open(path, 'rb') as f:
+            f.seek(off)
+            return f.read(length)
+    hdr = read_header(path)
+    blocks = (hdr or {}).get('blocks') or [[0, 0]]
+    i = bisect.bisect_right([b[0] for b in blocks], off) - 1
+    raw_off, gz_off = blocks[max(i, 0)]
+    with open(path, 'rb') as f:
+        f.seek(gz_off)
+        out = b''
+        d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        skip = off - raw_off
+        while len(out) < skip + length:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            out += d.decompress(chunk)
+            # 一个成员结束后从剩余数据开始下一个成员
+            while d.eof and d.unused_data:
+                rest = d.unused_data
+                d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                out += d.decompress(rest)
+            if d.eof and not d.unused_data:
+                d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    return out[skip:skip + length]
+
+def read_ranges(path, locs):
+    """按偏移升序依次读取多段原始字节 [(偏移, 长度)]；冷段每个成员块最多解压一次"""
+    if not is_cold(path):
+        with open(path, 'rb') as f:
+            for off, length in locs:
+                f.seek(off)
+                yield f.read(length)
+        return
+    hdr = read_header(path)
+    blocks = (hdr or {}).get('blocks') or [[0, 0]]
+    raws = [b[0] for b in blocks]
+    cur = -1
+    base = 0
+    data = b''
+    with open(path, 'rb') as f:
+        for off, length in locs:
+            i = max(bisect.bisect_right(raws, off) - 1, 0)
+            if i != cur:
+                # 成员块在行边界切分，一行不会跨块
+                f.seek(blocks[i][1])
+                if i + 1 < len(blocks):
+                    comp = f.read(blocks[i + 1][1] - blocks[i][1])
+                else:
+                    comp = f.read()
+                data = gzip.decompress(comp)
+                base = blocks[i][0]
+                cur = i
+            yield data[off - base:off - base + length]
@@ -7,9 +7,18 @@ WEB_DIR = os.path.join(ROOT, 'web')
 DATA_DIR = os.path.join(ROOT, 'data')
 CONFIG_DIR = os.path.join(ROOT, 'config')
 ANOMALIES_FILE = os.path.join(DATA_DIR, 'anomalies.ndjson')
+ANOMALIES_DIR = os.path.join(DATA_DIR, 'anomalies')
 SUMMARY_FILE = os.path.join(DATA_DIR, 'summary.json')
 CONFIG_FILE = os.path.join(CONFIG_DIR, 'config.json')
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
+SQLITE_FILE = os.path.join(DATA_DIR, 'anomalies.db')
+EVENT_INDEX_FILE = os.path.join(DATA_DIR, 'anomalies.idx')
+SEGMENT_META_DIR = os.path.join(DATA_DIR, 'segment_meta')
+TOKEN_INDEX_DIR = os.path.join(DATA_DIR, 'token_index')
+DEDUPE_FILE = os.path.join(DATA_DIR, 'dedupe.bin')
+GENERATION_FILE = os.path.join(DATA_DIR, 'generation')
+HOSTS_FILE = os.path.join(DATA_DIR, 'hosts.json')
+TOP_K_FILE = os.path.join(DATA_DIR, 'topk.json')
 
 SCHEMA_VERSION = "1.0"
 
@@ -17,6 +26,7 @@ def ensure_dirs():
     """确保必要的目录和文件存在"""
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(CONFIG_DIR, exist_ok=True)
+    os.makedirs(ANOMALIES_DIR, exist_ok=True)
     
     # 初始化异常数据文件
     if not os.path.exists(ANOMALIES_FILE):
@@ -63,6 +73,38 @@ def ensure_dirs():
                 "security": {
                     "ingest_token": "<redacted>",
                     "sse_max_clients": 100
+                },
+                "storage": {
+                    "backend": "ndjson",
+                    "sqlite_path": "",
+                    "segment_max_mb": 64,
+                    "cache_enabled": True,
+                    "cache_max_mb": 64,
+                    "token_index": True,
+                    "token_index_max_mb": 32,
+                    "query_cache_enabled": True,
+                    "query_cache_max_mb": 16,
+                    "query_cache_max_entries": 512,
+                    "top_k_enabled": True,
+                    "top_k_capacity": 64,
+                    "top_k_hours": 192,
+                    "flush_ms": 200,
+                    "batch_size": 1000,
+                    "fsync": "interval",
+                    "fsync_interval_ms": 1000,
+                    "cold_after_days": 7,
+                    "dedupe_enabled": True,
+                    "dedupe_window": 100000,
+                    "dedupe_capacity": 1000000,
+                    "dedupe_fp_rate": 0.001
+                },
+                "syslog": {
+                    "enabled": False,
+                    "host": "0.0.0.0",
+                    "udp_port": 5514,
+                    "tcp_port": 5514,
+                    "batch_size": 1000,
+                    "flush_ms": 200
                 }
             }, f)
     if not os.path.exists(USERS_FILE):
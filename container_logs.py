@@ -0,0 +1,117 @@
+import os
+import re
+import json
+
+# 单个容器日志文件每轮最多读取的字节数，避免个别高产容器拖慢整轮扫描
+MAX_READ_BYTES = 16 * 1024 * 1024
+
+# Kubernetes: /var/log/containers/<pod>_<namespace>_<container>-<64位id>.log
+_RE_K8S_NAME = re.compile(r'^(?P<pod>[^_]+)_(?P<ns>[^_]+)_(?P<name>.+)-(?P<id>[0-9a-f]{64})\.log$')
+# Docker json-file: /var/lib/docker/containers/<id>/<id>-json.log(.N)
+_RE_DOCKER_NAME = re.compile(r'^(?P<id>[0-9a-f]{64})-json\.log(?:\.\d+)?$')
+
+_meta_cache = {}
+
+def is_container_log(path):
+    """判断文件是否为容器日志（docker json-file 或 /var/log/containers 下的链接）"""
+    name = os.path.basename(path)
+    if _RE_DOCKER_NAME.match(name):
+        return True
+    return _RE_K8S_NAME.match(name) is not None
+
+def container_meta(path):
+    """从路径（及 docker 的 config.v2.json）解析容器 ID 与名称，结果按目录缓存"""
+    key = path
+    name = os.path.basename(path)
+    m = _RE_DOCKER_NAME.match(name)
+    if m:
+        key = os.path.dirname(path)
+    meta = _meta_cache.get(key)
+    if meta is not None:
+        return meta
+    meta = {}
+    if m:
+        meta["container_id"] = m.group('id')[:12]
+        try:
+            with open(os.path.join(key, 'config.v2.json'), 'r', encoding='utf-8') as f:
+                cname = (json.load(f).get('Name') or '').lstrip('/')
+            if cname:
+                meta["container_name"] = cname
+        except:
+            pass
+    else:
+        k = _RE_K8S_NAME.match(name)
+        if k:
+            meta["container_id"] = k.group('id')[:12]
+            meta["container_name"] = k.group('name')
+            meta["pod"] = k.group('pod')
+            meta["namespace"] = k.group('ns')
+    _meta_cache[key] = meta
+    return meta
+
+def forget_meta(path):
+    """容器被删除后清理缓存的元数据"""
+    _meta_cache.pop(path, None)
+    _meta_cache.pop(os.path.dirname(path), None)
+
+def _decode_one(raw):
+    """解码单行：docker JSON 信封或 CRI 文本格式（<time> <stream> <P|F> <log>）"""
+    raw = raw.strip()
+    if not raw:
+        return None
+    if raw[:1] == b'{':
+        try:
+            obj = json.loads(raw)
+        except ValueError:
+            return None
+        if isinstance(obj, dict):
+            return obj
+        return None
+    parts = raw.split(b' ', 3)
+    if len(parts) == 4 and parts[1] in (b'stdout', b'stderr'):
+        return {
+            "time": parts[0].decode('ascii', 'ignore'),
+            "stream": parts[1].decode('ascii'),
+            "log": parts[3].decode('utf-8', 'ignore')
+        }
+    return None
+
+def decode_envelopes(lines):
+    """批量解码容器日志信封
+
+    整批拼成一个 JSON 数组交给一次 json.loads，避免逐行调用解析器；
+    整批失败（夹杂 CRI 文本或损坏行）时退回逐行解码。
+
+    :param lines: bytes 行列表（不含换行符）
+    :return: 与输入等长的列表，元素为 dict 或 None
+    """
+    if not lines:
+        return []
+    if all(l[:1] == b'{' for l in lines):
+        try:
+            objs = json.loads(b'[' + b','.join(lines) + b']')
+            if len(objs) == len(lines):
+                return [o if isinstance(o, dict) else None for o in objs]
+        except ValueError:
+            pass
+    return [_decode_one(l) for l in lines]
+
+def read_new_lines(path, offset, size):
+    """从 offset 读取新增的完整行
+
+    :return: (lines, new_offset)；末尾不完整的半行留到下一轮
+    """
+    want = min(size - offset, MAX_READ_BYTES)
+    if want <= 0:
+        return [], offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(want)
+    end = data.rfind(b'\n')
+    if end < 0:
+        if want == MAX_READ_BYTES:
+            # 超长的单行直接跳过，避免卡在同一偏移
+            return [], offset + want
+        return [], offset
+    lines = data[:end].split(b'\n')
+    return [l for l in lines if l.strip()], offset + end + 1
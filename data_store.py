@@ -1,6 +1,91 @@
+import os
 import json
 import time
-from config import ANOMALIES_FILE, SUMMARY_FILE, SCHEMA_VERSION
+import base64
+import atexit
+import calendar
+import threading
+from collections import deque, OrderedDict
+from contextlib import ExitStack
+from config import (DATA_DIR, ANOMALIES_FILE, ANOMALIES_DIR, SUMMARY_FILE, SCHEMA_VERSION, CONFIG_FILE,
+                    SQLITE_FILE, EVENT_INDEX_FILE, SEGMENT_META_DIR, TOKEN_INDEX_DIR, DEDUPE_FILE, GENERATION_FILE,
+                    HOSTS_FILE, TOP_K_FILE, read_config)
+from segment_store import SegmentStore
+from field_extractor import FIELD_TYPES, match_field_filters
+from event_item import event_key, item_json
+
+_storage_cache = {"mtime": None, "cfg": {}}
+_sqlite_store = None
+_sqlite_lock = threading.Lock()
+_segment_store = None
+_segment_lock = threading.Lock()
+_legacy_checked = False
+_event_cache = None
+_cache_lock = threading.Lock()
+_event_writer = None
+_writer_lock = threading.Lock()
+_dedupe = {"filter": None, "params": None, "saved": 0.0}
+# 已通过去重、尚未写入的事件：(id, type) -> (指纹, 登记时间)，写入成功后才记入过滤器
+_dedupe_pending = OrderedDict()
+_dedupe_pending_fps = {}
+# 登记后超过该秒数仍未写入（调用方没有写入或写入线程已丢弃）的指纹不再挡住后续事件
+DEDUPE_PENDING_TTL = 600
+_dedupe_lock = threading.Lock()
+_generation = {"stat": None, "value": 0}
+_generation_lock = threading.Lock()
+# 本进程推进代数的记录 (旧代数, 新代数, 本次写入最早的 detected_at)，保留清理记为 ''
+_generation_log = deque(maxlen=256)
+_query_cache = None
+_query_cache_lock = threading.Lock()
+_host_registry = None
+_host_registry_lock = threading.Lock()
+_heavy_hitters = {"summary": None, "params": None}
+_heavy_hitters_lock = threading.Lock()
+
+def get_segment_store():
+    """NDJSON 后端的段存储（data/anomalies/ 下的日分区）
+
+    首次访问时把旧版单文件 anomalies.ndjson 一次性拆分到日分区。
+    """
+    global _segment_store, _legacy_checked
+    store = _segment_store
+    if store is None:
+        with _segment_lock:
+            if _segment_store is None:
+                cfg = _storage_cfg()
+                try:
+                    seg_mb = float(cfg.get('segment_max_mb', 64))
+                except:
+                    seg_mb = 64
+                try:
+                    tok_mb = float(cfg.get('token_index_max_mb', 32))
+                except:
+                    tok_mb = 32
+                token_dir = TOKEN_INDEX_DIR if cfg.get('token_index', True) else None
+                _segment_store = SegmentStore(ANOMALIES_DIR, DATA_DIR, EVENT_INDEX_FILE, SEGMENT_META_DIR,
+                                              int(seg_mb * 1024 * 1024), token_dir, int(tok_mb * 1024 * 1024))
+                if _segment_store.tokens is not None:
+                    # 倒排表在清理轮次与进程退出时写回
+                    atexit.register(_segment_store.tokens.save)
+            store = _segment_store
+    if not _legacy_checked:
+        with store.lock:
+            if not _legacy_checked:
+                _legacy_checked = True
+                try:
+                    if os.path.getsize(ANOMALIES_FILE) > 0:
+                        n = store.migrate_legacy(ANOMALIES_FILE)
+                        os.replace(ANOMALIES_FILE, ANOMALIES_FILE + '.migrated')
+                        _bump_generation()
+                        open(ANOMALIES_FILE, 'a').close()
+                        print(f"[STORE] 已将 anomalies.ndjson 中 {n} 条事件拆分到日分区")
+                except OSError:
+                    pass
+    return store
+
+def list_segments(start=None, end=None):
+    """返回与 [start, end] 有交集的段文件 [(日期, 路径)]，按时间升序"""
+    return get_segment_store().segments(start, end)
 
 def _get_last_scan():
     """获取最后扫描时间，避免循环导入"""
@@ -20,17 +105,404 @@ def write_summary(s):
     with open(SUMMARY_FILE, 'w', encoding='utf-8') as f:
         json.dump(s, f)
 
-def iter_anomalies():
-    """迭代读取所有异常记录"""
-    with open(ANOMALIES_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
+def _storage_cfg():
+    """读取 storage 配置段（按配置文件 mtime 缓存）"""
+    try:
+        mt = os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        mt = None
+    if mt != _storage_cache["mtime"]:
+        try:
+            cfg = read_config().get('storage', {}) or {}
+        except:
+            cfg = {}
+        _storage_cache["mtime"] = mt
+        _storage_cache["cfg"] = cfg
+    return _storage_cache["cfg"]
+
+def storage_backend():
+    """当前配置的存储后端：ndjson 或 sqlite"""
+    return 'sqlite' if _storage_cfg().get('backend') == 'sqlite' else 'ndjson'
+
+def get_sqlite_store():
+    """配置为 sqlite 后端时返回 SQLiteEventStore，否则返回 None
+
+    首次打开空库时自动从 anomalies.ndjson 做一次性迁移。
+    """
+    global _sqlite_store
+    cfg = _storage_cfg()
+    if cfg.get('backend') != 'sqlite':
+        return None
+    path = cfg.get('sqlite_path') or SQLITE_FILE
+    store = _sqlite_store
+    if store is not None and store.path == path:
+        return store
+    with _sqlite_lock:
+        if _sqlite_store is None or _sqlite_store.path != path:
+            from sqlite_store import SQLiteEventStore
+            store = SQLiteEventStore(path)
+            if store.get_meta('migrated_from') is None and store.count() == 0:
+                try:
+                    n = 0
+                    for _, seg in list_segments():
+                        n += store.migrate_from_ndjson(seg)
+                    print(f"[STORE] 已从 NDJSON 迁移 {n} 条事件到 {path}")
+                except Exception as e:
+                    print(f"[STORE] NDJSON 迁移失败: {e}")
+            _sqlite_store = store
+        return _sqlite_store
+
+def get_event_cache():
+    """NDJSON 后端的列式热缓存；未安装 numpy、使用 sqlite 后端或配置关闭时返回 None"""
+    global _event_cache
+    cfg = _storage_cfg()
+    if cfg.get('backend') == 'sqlite' or not cfg.get('cache_enabled', True):
+        return None
+    import event_cache
+    if not event_cache.available():
+        return None
+    try:
+        max_bytes = int(float(cfg.get('cache_max_mb', 64)) * 1024 * 1024)
+    except:
+        max_bytes = event_cache.DEFAULT_MAX_BYTES
+    if _event_cache is None:
+        with _cache_lock:
+            if _event_cache is None:
+                _event_cache = event_cache.ColumnarEventCache(get_segment_store(), max_bytes)
+    _event_cache.max_bytes = max_bytes
+    return _event_cache
+
+def _save_dedupe():
+    f = _dedupe["filter"]
+    if f is None:
+        return
+    try:
+        f.save(DEDUPE_FILE)
+        _dedupe["saved"] = time.time()
+    except OSError as e:
+        print(f"[DEDUPE] 保存去重状态失败: {e}")
+
+def _close_dedupe():
+    """进程退出时保存去重状态"""
+    with _dedupe_lock:
+        _save_dedupe()
+
+def _get_dedupe_filter():
+    """按 storage.dedupe_* 配置返回去重过滤器；关闭时返回 None，参数变化时重建"""
+    cfg = _storage_cfg()
+    if not cfg.get('dedupe_enabled', True):
+        return None
+    try:
+        params = (int(cfg.get('dedupe_window', 100000)), int(cfg.get('dedupe_capacity', 1000000)),
+                  float(cfg.get('dedupe_fp_rate', 0.001)))
+    except:
+        params = (100000, 1000000, 0.001)
+    if _dedupe["params"] != params:
+        from dedupe import DedupeFilter
+        f = DedupeFilter(*params)
+        if f.load(DEDUPE_FILE):
+            print(f"[DEDUPE] 已加载去重状态（最近 {len(f.recent)} 条指纹）")
+        if _dedupe["filter"] is None:
+            atexit.register(_close_dedupe)
+        _dedupe["filter"] = f
+        _dedupe["params"] = params
+        _dedupe["saved"] = time.time()
+    return _dedupe["filter"]
+
+def _unpend(key):
+    fp, _ = _dedupe_pending.pop(key)
+    n = _dedupe_pending_fps[fp] - 1
+    if n:
+        _dedupe_pending_fps[fp] = n
+    else:
+        del _dedupe_pending_fps[fp]
+    return fp
+
+def dedupe_events(evs, scan_ts=None):
+    """按内容指纹过滤重复事件（重扫、偏移丢失、Agent 重试），返回首次出现的事件
+
+    须在写入、推送与告警之前调用；同一批内的重复也会被去掉。
+    返回的事件先登记为待写入，append_events 写入成功后指纹才记入过滤器，
+    写入失败时撤销登记，重扫或重试时不会被当作重复丢弃。
+
+    :param scan_ts: 构造事件时的扫描/接收时间；detected_at 等于它时不参与指纹
+    """
+    if not evs:
+        return []
+    from dedupe import fingerprint
+    with _dedupe_lock:
+        f = _get_dedupe_filter()
+        if f is None:
+            return list(evs)
+        now = time.time()
+        while _dedupe_pending and next(iter(_dedupe_pending.values()))[1] < now - DEDUPE_PENDING_TTL:
+            _unpend(next(iter(_dedupe_pending)))
+        fresh = []
+        for ev in evs:
+            fp = fingerprint(ev, scan_ts)
+            if fp in _dedupe_pending_fps or fp in f:
+                f.dropped += 1
                 continue
-            try:
-                yield json.loads(line)
-            except:
+            fresh.append(ev)
+            key = (ev.get('id'), ev.get('type'))
+            if key[0] is None or key in _dedupe_pending:
+                # 无法在写入时对应回来的事件直接记录
+                f.add(fp)
                 continue
+            _dedupe_pending[key] = (fp, now)
+            _dedupe_pending_fps[fp] = _dedupe_pending_fps.get(fp, 0) + 1
+        # 状态定期落盘，重启或离线重扫的进程可以接着用
+        if now - _dedupe["saved"] >= 300:
+            _save_dedupe()
+    return fresh
+
+def _settle_dedupe(evs, written):
+    """写入结束后处理待写入的指纹：成功则记入过滤器，失败则撤销"""
+    if not _dedupe_pending:
+        return
+    with _dedupe_lock:
+        f = _dedupe["filter"]
+        for ev in evs:
+            key = (ev.get('id'), ev.get('type'))
+            if key not in _dedupe_pending:
+                continue
+            fp = _unpend(key)
+            if written and f is not None:
+                f.add(fp)
+
+def store_generation():
+    """存储代数：每次写入或保留清理后单调递增，跨进程可见
+
+    代数保存在 data/generation 中，每次推进都原子替换该文件；读取只 stat 一次，
+    inode 与 mtime 未变时直接返回缓存值，不读取任何事件数据。
+    """
+    try:
+        st = os.stat(GENERATION_FILE)
+    except OSError:
+        return 0
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _generation["stat"] != key:
+        try:
+            with open(GENERATION_FILE, 'r', encoding='utf-8') as f:
+                value = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            value = 0
+        _generation["stat"] = key
+        _generation["value"] = value
+    return _generation["value"]
+
+def _bump_generation(low=''):
+    """存储内容变化后推进代数（取纳秒时间，保证大于旧值）
+
+    :param low: 本次写入事件中最早的 detected_at；删除或时间未知时为 ''
+    :return: (旧代数, 新代数)；写入代数文件失败时为 None
+    """
+    with _generation_lock:
+        prev = store_generation()
+        gen = max(prev + 1, time.time_ns())
+        tmp = f"{GENERATION_FILE}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(str(gen))
+            os.replace(tmp, GENERATION_FILE)
+        except OSError:
+            return None
+        _generation_log.append((prev, gen, low))
+        return prev, gen
+
+def unchanged_through(gen, end):
+    """自代数 gen 以来写入的事件是否都晚于 end（即 end 之前的数据未变）
+
+    只认本进程记录的连续写入；中间有保留清理、其他进程写入或记录已被覆盖时返回 False。
+    """
+    cur = store_generation()
+    if gen == cur:
+        return True
+    if not end:
+        return False
+    with _generation_lock:
+        hops = {prev: (nxt, low) for prev, nxt, low in _generation_log}
+    while gen != cur:
+        hop = hops.get(gen)
+        if hop is None or hop[1] <= end:
+            return False
+        gen = hop[0]
+    return True
+
+def get_query_cache():
+    """读接口结果缓存；storage.query_cache_enabled 为 false 时返回 None"""
+    global _query_cache
+    cfg = _storage_cfg()
+    if not cfg.get('query_cache_enabled', True):
+        return None
+    try:
+        max_bytes = int(float(cfg.get('query_cache_max_mb', 16)) * 1024 * 1024)
+        max_entries = int(cfg.get('query_cache_max_entries', 512))
+    except:
+        max_bytes, max_entries = 16 * 1024 * 1024, 512
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                from query_cache import QueryCache
+                _query_cache = QueryCache(max_bytes, max_entries)
+    _query_cache.max_bytes = max_bytes
+    _query_cache.max_entries = max_entries
+    return _query_cache
+
+def cached_query(key, compute, end=None):
+    """按规范化的查询键缓存读接口结果，相同查询并发时只计算一次；未启用缓存时直接计算
+
+    :param end: 查询的结束时间；给出时，之后只写入了更晚事件的旧结果仍然命中
+    """
+    cache = get_query_cache()
+    if cache is None:
+        return compute()
+    valid = (lambda gen: unchanged_through(gen, end)) if end else None
+    return cache.get(key, store_generation(), compute, valid)
+
+def query_cache_stats():
+    cache = get_query_cache()
+    return cache.stats() if cache is not None else None
+
+def append_events(evs):
+    """追加写入一批事件"""
+    if not evs:
+        return
+    # 写入时增量维护的主机登记表与热点统计：持有它们的锁与重建互斥，
+    # 否则重建读到的数据可能已含本批事件而被重复累加
+    observers = [o for o in (_host_registry, _heavy_hitters["summary"]) if o is not None]
+    with ExitStack() as stack:
+        for o in observers:
+            stack.enter_context(o.lock)
+        try:
+            hop = _append(evs)
+        except:
+            _settle_dedupe(evs, False)
+            raise
+        _settle_dedupe(evs, True)
+        if hop is not None:
+            for o in observers:
+                o.note_events(evs, *hop)
+
+def _append(evs):
+    store = get_sqlite_store()
+    if store is not None:
+        store.append(evs)
+    else:
+        get_segment_store().append(evs)
+    return _bump_generation(min(ev.get('detected_at') or '' for ev in evs))
+
+def append_event(ev):
+    """追加写入单个事件"""
+    append_events([ev])
+
+def sync_events():
+    """把已写入的事件刷到磁盘"""
+    store = get_sqlite_store()
+    if store is not None:
+        store.sync()
+        return
+    get_segment_store().sync()
+
+def _writer_cfg():
+    cfg = _storage_cfg()
+    out = {}
+    for key, default in (('flush_ms', 200), ('batch_size', 1000), ('fsync_interval_ms', 1000)):
+        try:
+            out[key] = int(cfg.get(key, default))
+        except:
+            out[key] = default
+    out['fsync'] = cfg.get('fsync', 'interval')
+    return out
+
+def get_event_writer():
+    """本进程的事件写线程（首次使用时创建，进程退出时写出剩余事件）"""
+    global _event_writer
+    if _event_writer is None:
+        with _writer_lock:
+            if _event_writer is None:
+                from event_writer import EventWriter
+                _event_writer = EventWriter(append_events, sync_events, **_writer_cfg())
+                atexit.register(_event_writer.close)
+    else:
+        _event_writer.configure(**_writer_cfg())
+    return _event_writer
+
+def submit_events(evs):
+    """经写线程合并写入一批事件（按 storage.flush_ms / batch_size 成批，fsync 策略见 storage.fsync）"""
+    if evs:
+        get_event_writer().submit(evs)
+
+def submit_event(ev):
+    submit_events([ev])
+
+def flush_events():
+    """立即写出写线程中积压的事件并落盘"""
+    if _event_writer is not None:
+        _event_writer.flush()
+
+def close_event_writer():
+    """进程退出前关闭写线程"""
+    if _event_writer is not None:
+        _event_writer.close()
+
+def count_events():
+    """当前存储的事件条数"""
+    store = get_sqlite_store()
+    if store is not None:
+        return store.count()
+    return get_segment_store().count()
+
+def apply_retention(cutoff, max_events):
+    """按保留天数与保留上限裁剪事件
+
+    :param cutoff: epoch 秒，早于该时间的事件被删除
+    :param max_events: 保留上限，0 表示不限
+    :return: (裁剪前条数, 裁剪后条数)
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        before = store.count()
+        store.delete_before(time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(cutoff)))
+        if max_events:
+            store.trim_to(max_events)
+        res = before, store.count()
+    else:
+        res = get_segment_store().apply_retention(cutoff, max_events)
+    if res[0] != res[1]:
+        hop = _bump_generation()
+        hh = _heavy_hitters["summary"]
+        if hh is not None and hop is not None:
+            hh.note_retention(*hop)
+    return res
+
+def compress_cold_partitions():
+    """把早于 storage.cold_after_days 天的日分区压缩为 .gz 冷段（仅 NDJSON 后端，0 表示关闭）
+
+    :return: [(段名, 原始字节数, 压缩后字节数)]
+    """
+    if get_sqlite_store() is not None:
+        return []
+    try:
+        days = int(_storage_cfg().get('cold_after_days', 7))
+    except:
+        days = 7
+    if days <= 0:
+        return []
+    before = time.strftime('%Y-%m-%d', time.gmtime(time.time() - days * 86400))
+    return get_segment_store().compress_cold(before)
+
+def iter_anomalies(start=None, end=None, keyword=None):
+    """迭代读取异常记录
+
+    给出 start/end 时只读取与时间范围重叠的日分区；给出 keyword 时按倒排索引只读取候选行。
+    分区内仍需调用方逐条过滤。
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        yield from store.iter_events(start, end)
+        return
+    yield from get_segment_store().iter_events(start, end, keyword)
 
 def parse_iso(s):
     """解析 ISO 8601 时间字符串"""
@@ -39,69 +511,407 @@ def parse_iso(s):
     except:
         return None
 
-def compute_stats(window=None, host_id=None):
-    """计算统计信息
-    
-    :param window: 时间窗口，如 'PT24H' 或 '24h'
-    :param host_id: 可选，按主机ID筛选
+def get_event(eid):
+    """按 ID 获取单个事件，不存在时返回 None"""
+    store = get_sqlite_store()
+    if store is not None:
+        return store.get(eid)
+    return get_segment_store().get(eid)
+
+def get_events(eids):
+    """按 ID 批量获取事件 {id: 事件}；不存在的 ID 不出现在结果中"""
+    if not eids:
+        return {}
+    store = get_sqlite_store()
+    if store is not None:
+        return store.get_many(eids)
+    return get_segment_store().get_many(eids)
+
+def _host_rollups(start=None):
+    store = get_sqlite_store()
+    if store is None:
+        store = get_segment_store()
+    return store.host_rollups(start)
+
+def get_host_registry():
+    """与当前存储一致的主机登记表
+
+    首次调用时从 data/hosts.json 加载；登记的代数与存储代数不一致（其他进程写入、保留清理）
+    时按小时汇总重建计数，不读取事件。本进程写入的事件在 append_events 中增量登记。
     """
-    total = 0
-    by_severity = {"critical": 0, "major": 0, "minor": 0}
-    by_type = {}
-    by_host = {}
-    last_detection = None
-    now = time.time()
-    window_sec = None
-    
-    if window:
+    global _host_registry
+    with _host_registry_lock:
+        reg = _host_registry
+        if reg is None:
+            from host_registry import HostRegistry
+            reg = HostRegistry(HOSTS_FILE)
+            if reg.load():
+                print(f"[HOSTS] 已加载主机登记表（{len(reg.hosts)} 台主机）")
+            atexit.register(reg.save)
+            _host_registry = reg
+        with reg.lock:
+            gen = store_generation()
+            if reg.gen != gen:
+                reg.rebuild(_host_rollups(), gen)
+    return reg
+
+def note_agent_heartbeat(host_ids, ts):
+    """记录 Agent 上报时间（/api/v1/ingest 每次请求，含不带事件的上报）"""
+    get_host_registry().note_heartbeat(host_ids, ts)
+
+def host_version():
+    """主机登记表的变化序号（上报时间变化不推进存储代数，ETag 需另行区分）
+
+    先与存储同步：否则首次加载或重建发生在算出 ETag 之后，下一次请求的 ETag 必然不同。
+    """
+    return get_host_registry().version
+
+def _close_heavy_hitters():
+    """进程退出时保存热点统计"""
+    hh = _heavy_hitters["summary"]
+    if hh is not None:
+        hh.save()
+
+def get_heavy_hitters():
+    """按小时分桶的热点统计；storage.top_k_enabled 为 false 时返回 None
+
+    首次调用时从 data/topk.json 加载，参数变化时重建；记录的代数与存储代数不一致
+    （其他进程写入）时重新扫描保留范围内的事件。
+    """
+    cfg = _storage_cfg()
+    if not cfg.get('top_k_enabled', True):
+        return None
+    try:
+        params = (max(1, int(cfg.get('top_k_capacity', 64))), max(1, int(cfg.get('top_k_hours', 192))))
+    except:
+        params = (64, 192)
+    with _heavy_hitters_lock:
+        hh = _heavy_hitters["summary"]
+        if _heavy_hitters["params"] != params:
+            from heavy_hitters import HeavyHitters
+            hh = HeavyHitters(TOP_K_FILE, *params)
+            if hh.load():
+                print(f"[TOPK] 已加载热点统计（{len(hh.buckets)} 个小时桶）")
+            if _heavy_hitters["summary"] is None:
+                atexit.register(_close_heavy_hitters)
+            _heavy_hitters["summary"] = hh
+            _heavy_hitters["params"] = params
+        with hh.lock:
+            gen = store_generation()
+            if hh.gen != gen:
+                t0 = time.time()
+                hh.rebuild(iter_anomalies(hh.cutoff() + ':00:00Z'), gen)
+                print(f"[TOPK] 已重建热点统计（{len(hh.buckets)} 个小时桶，{time.time() - t0:.2f}s）")
+    return hh
+
+def top_values(dim, window=None, limit=10):
+    """某维度（message_template/source_file/host_id）在窗口内的热点，近似值带误差上界
+
+    窗口起点按整小时对齐；未给出或超出 storage.top_k_hours 时取保留的全部小时桶。
+    未启用时返回 None。
+    """
+    hh = get_heavy_hitters()
+    if hh is None:
+        return None
+    window_sec = _window_seconds(window)
+    start = None
+    if window_sec is not None:
+        start = time.strftime('%Y-%m-%dT%H:00:00Z', time.gmtime(time.time() - window_sec))
+    res = hh.top(dim, start, limit)
+    res["capacity"] = hh.capacity
+    return res
+
+def list_hosts():
+    """返回出现过的全部 host_id（已排序）"""
+    return get_host_registry().host_ids()
+
+def host_stats(window=None):
+    """按主机统计：[{host_id, total, by_severity, by_type, first_seen, last_seen, last_heartbeat}]
+
+    不给出 window 时直接取登记表；给出时计数来自窗口内的小时汇总（窗口起点按整小时对齐），
+    首次/最近时间与上报时间仍取登记表。窗口内没有事件的主机计数为 0。
+    """
+    items = get_host_registry().items()
+    window_sec = _window_seconds(window)
+    if window_sec is None:
+        return items
+    start = time.strftime('%Y-%m-%dT%H:00:00Z', time.gmtime(time.time() - window_sec))
+    agg = _host_rollups(start)
+    for item in items:
+        rec = agg.get(item["host_id"]) or {}
+        item["total"] = rec.get("total", 0)
+        item["by_severity"] = rec.get("by_severity", {})
+        item["by_type"] = rec.get("by_type", {})
+    return items
+
+def _match(ev, start=None, end=None, severities=None, types=None, keyword=None, host_id=None, field_filters=None):
+    """逐条过滤条件（NDJSON 扫描路径）"""
+    if start and ev.get('detected_at') and ev['detected_at'] < start:
+        return False
+    if end and ev.get('detected_at') and ev['detected_at'] > end:
+        return False
+    if severities and ev.get('severity') not in severities:
+        return False
+    if types and ev.get('type') not in types:
+        return False
+    if keyword:
+        msg = (ev.get('message') or '')
+        src = (ev.get('source_file') or '')
+        if (keyword not in msg) and (keyword not in src):
+            return False
+    if host_id and ev.get('host_id') != host_id:
+        return False
+    if field_filters and not match_field_filters(ev, field_filters):
+        return False
+    return True
+
+def _raw_items(events):
+    """逐行扫描路径已解码的事件转为 [(游标键, 列表项 JSON)]"""
+    return [(event_key(ev), item_json(ev)) for ev in events]
+
+def encode_cursor(key):
+    """游标键（event_key）编码为不透明游标（base64url）"""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor):
+    """解码游标，格式不合法时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw.decode('utf-8'))
+        if isinstance(key, list) and len(key) == 3 and all(isinstance(k, str) for k in key):
+            return tuple(key)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        pass
+    return None
+
+def query_events_keyset(start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+                        field_filters=None, cursor=None, reverse=True, size=20, raw=False):
+    """游标分页：返回按 (detected_at, id, type) 排在 cursor 之后的 size 条
+
+    cursor 为 decode_cursor 的结果；reverse=True 时向更早翻页，False 时取更新的事件（since）。
+    只读取游标附近的数据，翻到多深开销都与页大小相当。
+
+    :param raw: 为 True 时 events 为 [(游标键, 列表项 JSON)]，存储的列表项字节直接拼入响应
+    :return: (events, has_next)
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        return store.keyset(start, end, severities, types, keyword, host_id, field_filters,
+                            cursor, reverse, size, raw)
+    cache = get_event_cache()
+    if cache is not None and not field_filters:
+        res = cache.keyset(start, end, severities, types, keyword, host_id, cursor, reverse, size, raw)
+        if res is not None:
+            return res
+    # 日分区本身按 detected_at 的日期有序：从游标所在日期起逐日读取，凑满一页即停
+    lo, hi = start, end
+    if cursor and cursor[0]:
+        if reverse:
+            hi = min(hi, cursor[0]) if hi else cursor[0]
+        else:
+            lo = max(lo, cursor[0]) if lo else cursor[0]
+    days = sorted(set(day for day, _ in list_segments(lo, hi)), reverse=reverse)
+    items = []
+    for day in days:
+        for ev in get_segment_store().iter_events(day + 'T00:00:00Z', day + 'T23:59:59Z', keyword):
+            if not _match(ev, start, end, severities, types, keyword, host_id, field_filters):
+                continue
+            if cursor and not (event_key(ev) < cursor if reverse else event_key(ev) > cursor):
+                continue
+            items.append(ev)
+        if len(items) > size:
+            break
+    items.sort(key=event_key, reverse=reverse)
+    items = items[:size + 1]
+    if raw:
+        items = _raw_items(items)
+    return items[:size], len(items) > size
+
+def arrival_position():
+    """当前的到达位置，增量同步（since）从这里开始：sqlite 为最大 seq，NDJSON 为各热段的字节水位
+
+    与 detected_at 无关：日志时间较早、迟到写入的事件也排在其后。
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        return store.max_seq()
+    return get_segment_store().positions()
+
+def encode_since_cursor(pos):
+    """到达位置编码为不透明游标（base64url）"""
+    obj = {"seq": pos} if isinstance(pos, int) else {"seg": pos}
+    raw = json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+def decode_since_cursor(cursor):
+    """解码增量同步游标；格式不合法或与当前存储后端不符时返回 None"""
+    try:
+        obj = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if not isinstance(obj, dict):
+        return None
+    if storage_backend() == 'sqlite':
+        seq = obj.get('seq')
+        return seq if isinstance(seq, int) and not isinstance(seq, bool) and seq >= 0 else None
+    marks = obj.get('seg')
+    if isinstance(marks, dict) and all(isinstance(k, str) and isinstance(v, int) and not isinstance(v, bool)
+                                       and v >= 0 for k, v in marks.items()):
+        return marks
+    return None
+
+def query_events_since(pos, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+                       field_filters=None, size=20, raw=False):
+    """增量同步：返回到达位置 pos 之后写入、命中条件的事件（按写入顺序）
+
+    :param pos: decode_since_cursor 的结果
+    :param raw: 为 True 时 events 为 [(游标键, 列表项 JSON)]
+    :return: (events, 新的到达位置, has_next)
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        return store.since(pos, start, end, severities, types, keyword, host_id, field_filters, size, raw)
+    accept = lambda ev: _match(ev, start, end, severities, types, keyword, host_id, field_filters)
+    events, marks, more = get_segment_store().read_since(pos, accept, size)
+    return (_raw_items(events) if raw else events), marks, more
+
+def export_events(start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+                  field_filters=None):
+    """逐条产出全部命中的事件，供导出流式写出
+
+    按存储顺序（sqlite 为写入顺序，NDJSON 为日分区顺序，大致按时间升序）读取，
+    不排序、不缓存结果，内存占用与命中条数无关。
+    """
+    store = get_sqlite_store()
+    if store is not None:
+        yield from store.iter_events(start, end, severities, types, keyword, host_id, field_filters)
+        return
+    for ev in get_segment_store().iter_events(start, end, keyword):
+        if _match(ev, start, end, severities, types, keyword, host_id, field_filters):
+            yield ev
+
+def query_events(start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+                 field_filters=None, sort='detected_at:desc', page=1, size=20, raw=False):
+    """按条件过滤、排序并分页
+
+    :param raw: 为 True 时当前页为 [(游标键, 列表项 JSON)]
+    :return: (当前页事件列表, 命中总数)
+    """
+    reverse = True
+    key = 'detected_at'
+    if sort:
         try:
-            if window.startswith('PT') and window.endswith('H'):
-                window_sec = int(window[2:-1]) * 3600
-            elif window.endswith('h'):
-                window_sec = int(window[:-1]) * 3600
+            key, order = sort.split(':')
+            reverse = order == 'desc'
         except:
-            window_sec = None
+            reverse = True
+    store = get_sqlite_store()
+    if store is not None:
+        return store.query(start, end, severities, types, keyword, host_id, field_filters,
+                           key, reverse, page, size, raw)
+    cache = get_event_cache()
+    if cache is not None and not field_filters:
+        res = cache.query(start, end, severities, types, keyword, host_id, key, reverse, page, size, raw)
+        if res is not None:
+            return res
     
-    for ev in iter_anomalies():
-        # 按 host_id 筛选
+    items = [ev for ev in iter_anomalies(start, end, keyword)
+             if _match(ev, start, end, severities, types, keyword, host_id, field_filters)]
+    
+    if size > 0:
+        # 按时间排序时与游标分页的顺序一致
+        items.sort(key=event_key if key == 'detected_at' else (lambda x: x.get(key) or ''), reverse=reverse)
+    start_idx = (page - 1) * size
+    page_items = items[start_idx:start_idx + size]
+    return (_raw_items(page_items) if raw else page_items), len(items)
+
+def _window_seconds(window):
+    if not window:
+        return None
+    try:
+        if window.startswith('PT') and window.endswith('H'):
+            return int(window[2:-1]) * 3600
+        elif window.endswith('h'):
+            return int(window[:-1]) * 3600
+    except:
+        return None
+    return None
+
+def _trend_series(trend, start=None):
+    """小时桶转为趋势数组；给出窗口时补齐无事件的小时"""
+    hours = sorted(trend)
+    if start:
+        t = calendar.timegm(time.strptime(start[:13], '%Y-%m-%dT%H'))
+        end = time.time()
+        if trend:
+            # 日志自带时间可能略超前于本机时钟
+            end = max(end, calendar.timegm(time.strptime(max(trend), '%Y-%m-%dT%H')))
+        hours = []
+        while t <= end:
+            hours.append(time.strftime('%Y-%m-%dT%H', time.gmtime(t)))
+            t += 3600
+    return [{"timestamp": h + ":00:00Z", "count": trend.get(h, 0)} for h in hours]
+
+def _field_counts(start, host_id, group_fields):
+    """结构化字段分组计数（不在小时汇总中，需读取事件）"""
+    store = get_sqlite_store()
+    if store is not None:
+        return store.field_counts(start, host_id, group_fields)
+    by_field = {g: {} for g in group_fields}
+    for ev in iter_anomalies(start):
         if host_id and ev.get('host_id') != host_id:
             continue
-        
-        try:
-            ts = time.strptime(ev.get('detected_at'), '%Y-%m-%dT%H:%M:%SZ')
-            ts_epoch = time.mktime(ts)
-        except:
-            ts_epoch = None
-        
-        if window_sec is not None and ts_epoch is not None:
-            if (now - ts_epoch) > window_sec:
-                continue
-        
-        total += 1
-        sev = ev.get('severity')
-        if sev in by_severity:
-            by_severity[sev] += 1
-        
-        t = ev.get('type')
-        if t:
-            by_type[t] = by_type.get(t, 0) + 1
-        
-        h = ev.get('host_id')
-        if h:
-            by_host[h] = by_host.get(h, 0) + 1
-        
-        if ev.get('detected_at'):
-            if not last_detection or ev['detected_at'] > last_detection:
-                last_detection = ev['detected_at']
+        if start and ev.get('detected_at') and ev['detected_at'] < start:
+            continue
+        fields = ev.get('fields') or {}
+        for g in group_fields:
+            v = fields.get(g)
+            if v is not None:
+                k = str(v)
+                by_field[g][k] = by_field[g].get(k, 0) + 1
+    return by_field
+
+def compute_stats(window=None, host_id=None, group_by=None):
+    """计算统计信息
+    
+    优先使用列式热缓存做向量化计数；未启用或窗口超出缓存范围时，
+    基于按小时维护的汇总（主机 × 类型 × 级别）求和。窗口起点按整小时对齐。
     
-    ls = _get_last_scan()
-    return {
+    :param window: 时间窗口，如 'PT24H' 或 '24h'
+    :param host_id: 可选，按主机ID筛选
+    :param group_by: 可选，逗号分隔的结构化字段名，如 'comm,device'
+    """
+    group_fields = []
+    if group_by:
+        group_fields = [g.strip() for g in group_by.split(',') if g.strip() in FIELD_TYPES]
+    window_sec = _window_seconds(window)
+    start = None
+    if window_sec is not None:
+        start = time.strftime('%Y-%m-%dT%H:00:00Z', time.gmtime(time.time() - window_sec))
+    agg = None
+    cache = get_event_cache()
+    if cache is not None:
+        agg = cache.stats(start, host_id)
+    if agg is None:
+        store = get_sqlite_store()
+        if store is None:
+            store = get_segment_store()
+        agg = store.rollup_stats(start, host_id)
+    by_severity = {"critical": 0, "major": 0, "minor": 0}
+    for k, n in agg["by_severity"].items():
+        if k in by_severity:
+            by_severity[k] = n
+    res = {
         "schema_version": SCHEMA_VERSION,
-        "total_anomalies": total,
+        "total_anomalies": agg["total"],
         "by_severity": by_severity,
-        "by_type": by_type,
-        "by_host": by_host,
-        "trend": [],
-        "last_detection": last_detection,
-        "last_scan": ls
-    }
\ No newline at end of file
+        "by_type": agg["by_type"],
+        "by_host": agg["by_host"],
+        "trend": _trend_series(agg["trend"], start),
+        "last_detection": agg["last_detection"],
+        "last_scan": _get_last_scan()
+    }
+    if group_fields:
+        res["by_field"] = _field_counts(start, host_id, group_fields)
+    return res
@@ -0,0 +1,168 @@
+import os
+import math
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+def fingerprint(ev, scan_ts=None):
+    """事件内容指纹：主机 + 来源文件 + 类型 + 消息 + 日志时间，不含扫描时间
+
+    detected_at 取自日志本身时参与指纹；等于 scan_ts（解析失败时回退的扫描/接收时间）时不能用它区分，
+    否则同一行在不同时间重扫会得到不同指纹。这时改用行号（同一文件重扫时不变、之后再出现的同样消息不同），
+    没有行号时用扫描时间所在的小时，避免之后真正重复发生的同一消息被当作重复丢弃。
+    """
+    ts = ev.get('detected_at') or ''
+    if scan_ts and ts == scan_ts:
+        ln = ev.get('line_number')
+        ts = f"#{ln}" if ln else f"@{scan_ts[:13]}"
+    key = "\x1f".join((ev.get('host_id') or '', ev.get('source_file') or '', ev.get('type') or '',
+                       ev.get('message') or '', ts))
+    return hashlib.blake2b(key.encode('utf-8', 'ignore'), digest_size=16).digest()
+
+class RotatingBloom:
+    """两代轮换的 Bloom 过滤器
+
+    新指纹写入当前代，当前代写满 capacity 条后成为上一代、旧的上一代丢弃；
+    查询同时检查两代，因此至少记住最近 capacity 条、至多 2 × capacity 条。
+    """
+
+    def __init__(self, capacity=1000000, fp_rate=0.001):
+        self.capacity = max(1000, int(capacity))
+        fp_rate = min(max(float(fp_rate), 1e-6), 0.1)
+        self.bits = int(math.ceil(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+        self.current = bytearray((self.bits + 7) // 8)
+        self.previous = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fp):
+        h1 = int.from_bytes(fp[:8], 'little')
+        h2 = int.from_bytes(fp[8:16], 'little') | 1
+        m = self.bits
+        return [(h1 + i * h2) % m for i in range(self.hashes)]
+
+    @staticmethod
+    def _has(arr, positions):
+        for p in positions:
+            if not arr[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def __contains__(self, fp):
+        pos = self._positions(fp)
+        return self._has(self.current, pos) or self._has(self.previous, pos)
+
+    def add(self, fp):
+        if self.count >= self.capacity:
+            self.previous = self.current
+            self.current = bytearray(len(self.previous))
+            self.count = 0
+        for p in self._positions(fp):
+            self.current[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+class DedupeFilter:
+    """写入前的重复事件过滤
+
+    最近 window 条指纹保存在精确集合中；更早的由 Bloom 过滤器记忆，
+    命中时按重复处理（误判率即 fp_rate）。状态可保存到文件，重启后继续生效。
+    """
+
+    def __init__(self, window=100000, capacity=1000000, fp_rate=0.001):
+        self.window = max(1, int(window))
+        self.recent = OrderedDict()
+        self.bloom = RotatingBloom(capacity, fp_rate)
+        self.dropped = 0
+
+    def __contains__(self, fp):
+        return fp in self.recent or fp in self.bloom
+
+    def add(self, fp):
+        """记录一个指纹（事件已写入之后调用）"""
+        if fp in self.recent:
+            self.recent.move_to_end(fp)
+            return
+        self.recent[fp] = None
+        if len(self.recent) > self.window:
+            self.recent.popitem(last=False)
+        self.bloom.add(fp)
+
+    def seen(self, fp):
+        """返回指纹是否出现过，并记录本次出现"""
+        if fp in self:
+            self.dropped += 1
+            if fp in self.recent:
+                self.recent.move_to_end(fp)
+            return True
+        self.add(fp)
+        return False
+
+    def _read(self, path):
+        """读取文件中的状态：(条数, 当前代位图, 上一代位图, 精确集合指纹)；参数不一致或文件损坏时返回 None"""
+        try:
+            with open(path, 'rb') as f:
+                head = json.loads(f.readline())
+                b = self.bloom
+                if head.get('bits') != b.bits or head.get('hashes') != b.hashes:
+                    return None
+                n = len(b.current)
+                current = f.read(n)
+                previous = f.read(n)
+                if len(current) != n or len(previous) != n:
+                    return None
+                rest = f.read()
+        except (OSError, ValueError):
+            return None
+        recent = [rest[i:i + 16] for i in range(0, len(rest) - 15, 16)]
+        return int(head.get('count', 0)), current, previous, recent
+
+    def _merge(self, state):
+        """并入其他进程保存的状态：两代位图按位或，条数取两者之和（上限 capacity），
+        宁可提前轮换也不让误判率超出预期；精确集合取并集，本进程的排在后面"""
+        count, current, previous, recent = state
+        b = self.bloom
+        n = len(b.current)
+        b.current = bytearray((int.from_bytes(b.current, 'little') | int.from_bytes(current, 'little')).to_bytes(n, 'little'))
+        b.previous = bytearray((int.from_bytes(b.previous, 'little') | int.from_bytes(previous, 'little')).to_bytes(n, 'little'))
+        b.count = min(b.capacity, b.count + count)
+        merged = OrderedDict((fp, None) for fp in recent if fp not in self.recent)
+        merged.update(self.recent)
+        while len(merged) > self.window:
+            merged.popitem(last=False)
+        self.recent = merged
+
+    def save(self, path):
+        """保存为：一行 JSON 头 + 当前代位图 + 上一代位图 + 精确集合指纹
+
+        服务端与离线检测等多个进程共用同一文件：保存前先并入文件中其他进程保存的状态，
+        不互相覆盖，本进程也因此看到其他进程记录的指纹。
+        """
+        state = self._read(path)
+        if state is not None:
+            self._merge(state)
+        b = self.bloom
+        head = {"bits": b.bits, "hashes": b.hashes, "capacity": b.capacity, "count": b.count,
+                "recent": len(self.recent), "saved_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(head).encode('utf-8') + b"\n")
+            f.write(b.current)
+            f.write(b.previous)
+            f.write(b"".join(self.recent))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """从文件恢复；参数（位数、哈希数）与当前配置不一致时忽略"""
+        state = self._read(path)
+        if state is None:
+            return False
+        count, current, previous, recent = state
+        b = self.bloom
+        b.current = bytearray(current)
+        b.previous = bytearray(previous)
+        b.count = count
+        self.recent = OrderedDict((fp, None) for fp in recent)
+        while len(self.recent) > self.window:
+            self.recent.popitem(last=False)
+        return True
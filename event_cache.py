@@ -0,0 +1,522 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import cold_tier
+from event_item import event_key, item_prefix_len, item_json, raw_item
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 默认内存预算（设计约束：Web 服务 + 检测引擎 < 100MB）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 列表查询支持在缓存中排序的字段
+SORT_KEYS = {'detected_at', 'type', 'severity', 'host_id', 'source_file', 'line_number'}
+
+def available():
+    """NumPy 可用时才启用列式缓存"""
+    return np is not None
+
+def _epoch(ts):
+    """ISO8601 转 epoch 秒；缺失或无法解析时返回 -1"""
+    if not ts:
+        return -1
+    try:
+        return int(datetime.fromisoformat(ts.replace('Z', '+00:00')).timestamp())
+    except (ValueError, TypeError):
+        return -1
+
+def _raw_key(item):
+    return item[0]
+
+def _id_prefix(eid):
+    """id 前 8 字节（UTF-8，大端）转 uint64：前缀不同时大小关系与字符串比较一致"""
+    return int.from_bytes((eid or '').encode('utf-8')[:8].ljust(8, b'\0'), 'big')
+
+def _iso(epoch):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(int(epoch)))
+
+def _ino(path):
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+class _Dict:
+    """字符串字典编码：值 → 连续整数编码"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, v):
+        v = v or ''
+        c = self.codes.get(v)
+        if c is None:
+            c = len(self.values)
+            self.codes[v] = c
+            self.values.append(v)
+        return c
+
+    def lookup(self, values):
+        return [self.codes[v] for v in values if v in self.codes]
+
+    def ranks(self):
+        """按字符串排序后的名次，用于按编码列排序"""
+        order = sorted(range(len(self.values)), key=lambda i: self.values[i])
+        r = np.empty(len(self.values), dtype=np.int64)
+        r[order] = np.arange(len(self.values))
+        return r
+
+class _Column:
+    """按容量倍增的 NumPy 列"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.arr = np.empty(1024, dtype=dtype)
+        self.n = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        need = self.n + len(values)
+        if need > len(self.arr):
+            grown = np.empty(max(need, len(self.arr) * 2), dtype=self.dtype)
+            grown[:self.n] = self.arr[:self.n]
+            self.arr = grown
+        self.arr[self.n:need] = values
+        self.n = need
+
+    def view(self):
+        return self.arr[:self.n]
+
+    def fit(self, count):
+        """字典编码数超出当前整型范围时扩宽（uint16 → uint32）"""
+        if count - 1 > np.iinfo(self.dtype).max:
+            self.dtype = np.uint32 if count - 1 <= np.iinfo(np.uint32).max else np.uint64
+            self.arr = self.arr.astype(self.dtype)
+
+    def keep(self, mask):
+        kept = self.view()[mask]
+        self.arr = np.empty(max(1024, len(kept)), dtype=self.dtype)
+        self.arr[:len(kept)] = kept
+        self.n = len(kept)
+
+    def nbytes(self):
+        return self.arr.nbytes
+
+class ColumnarEventCache:
+    """NDJSON 段存储之上的列式热缓存
+
+    每个事件只保留定长列：epoch（int64）、id 前缀、类型/级别/主机/来源文件的字典编码、行号、
+    所在段与字节位置、对外字段前缀长度，以及消息文本在连续字节块中的偏移。过滤用 NumPy 掩码，
+    分组计数用 bincount；列表只对当前页按字节位置回读原始事件，规范布局的行直接切出列表项。
+
+    缓存覆盖最新的若干个完整段（按各列与消息块实际占用的内存计入预算），查询范围涉及未覆盖的段时
+    返回 None，由调用方回退到逐行扫描。
+    """
+
+    def __init__(self, store, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param store: SegmentStore
+        :param max_bytes: 各列与消息块占用内存的上限
+        """
+        self.store = store
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.epoch = _Column(np.int64)
+        # 同秒内游标分页的粗筛键，见 _id_prefix；canon 标记 detected_at 是否为规范的秒级格式
+        self.idk = _Column(np.uint64)
+        self.canon = _Column(np.bool_)
+        self.type = _Column(np.uint16)
+        self.sev = _Column(np.uint16)
+        self.host = _Column(np.uint16)
+        self.src = _Column(np.uint32)
+        self.line = _Column(np.int64)
+        self.seg = _Column(np.uint16)
+        self.off = _Column(np.int64)
+        self.length = _Column(np.int32)
+        # 对外字段前缀长度（见 event_item），早期布局的行为 -1
+        self.item_len = _Column(np.int32)
+        self.msg_off = _Column(np.int64)
+        self.msg_len = _Column(np.int32)
+        self.blob = bytearray()
+        self.types = _Dict()
+        self.sevs = _Dict()
+        self.hosts = _Dict()
+        self.srcs = _Dict()
+        self.segs = _Dict()
+        self.watermarks = {}
+        # 已缓存段的文件 inode：保留清理改写段（写临时文件后改名）时 inode 变化，即使大小没有变小
+        self.inodes = {}
+        # 因超出预算移出的段：不再加载，直到段被删除或改写、预算变化
+        self.evicted = set()
+        self.budget = None
+        self.uncovered_until = None
+
+    def _columns(self):
+        return (self.epoch, self.idk, self.canon, self.type, self.sev, self.host, self.src, self.line,
+                self.seg, self.off, self.length, self.item_len, self.msg_off, self.msg_len)
+
+    # ---------- 维护 ----------
+    def _drop(self, rels):
+        """移除若干段的全部行（段被删除、压缩或超出预算）"""
+        codes = [self.segs.codes[r] for r in rels if r in self.segs.codes]
+        for r in rels:
+            self.watermarks.pop(r, None)
+            self.inodes.pop(r, None)
+        if not codes or self.seg.n == 0:
+            return
+        keep = ~np.isin(self.seg.view(), codes)
+        lengths = self.msg_len.view()
+        blob = np.frombuffer(bytes(self.blob), dtype=np.uint8)
+        self.blob = bytearray(blob[np.repeat(keep, lengths)].tobytes())
+        for col in self._columns():
+            col.keep(keep)
+        # 消息块已压紧，偏移按剩余长度重新累加
+        kept_len = self.msg_len.view()
+        if len(kept_len):
+            self.msg_off.arr[0] = 0
+            np.cumsum(kept_len[:-1], out=self.msg_off.arr[1:len(kept_len)])
+
+    def _load(self, rel, path, start):
+        """把段中 start 之后新增的完整行追加到各列，返回新的字节水位"""
+        try:
+            with cold_tier.open_raw(path) as f:
+                f.seek(start)
+                data = f.read()
+        except (OSError, EOFError):
+            return start
+        end = data.rfind(b'\n')
+        if end < 0:
+            return start
+        seg_code = self.segs.code(rel)
+        cols = ([], [], [], [], [], [], [], [], [], [], [], [], [])
+        epochs, idks, canons, types, sevs, hosts, srcs, lines, offs, lens, item_lens, msg_offs, msg_lens = cols
+        base = len(self.blob)
+        pos = start
+        chunks = []
+        for raw in data[:end].split(b'\n'):
+            n = len(raw) + 1
+            if raw.strip():
+                try:
+                    ev = json.loads(raw)
+                except ValueError:
+                    ev = None
+                if isinstance(ev, dict):
+                    msg = (ev.get('message') or '').encode('utf-8')
+                    ts = ev.get('detected_at')
+                    epochs.append(_epoch(ts))
+                    idks.append(_id_prefix(ev.get('id')))
+                    canons.append(epochs[-1] >= 0 and ts == _iso(epochs[-1]))
+                    types.append(self.types.code(ev.get('type')))
+                    sevs.append(self.sevs.code(ev.get('severity')))
+                    hosts.append(self.hosts.code(ev.get('host_id')))
+                    srcs.append(self.srcs.code(ev.get('source_file')))
+                    ln = ev.get('line_number')
+                    lines.append(ln if isinstance(ln, int) else -1)
+                    offs.append(pos)
+                    lens.append(n)
+                    item_lens.append(item_prefix_len(raw, ev))
+                    msg_offs.append(base)
+                    msg_lens.append(len(msg))
+                    chunks.append(msg)
+                    base += len(msg)
+            pos += n
+        self.blob += b"".join(chunks)
+        for col, d in ((self.type, self.types), (self.sev, self.sevs), (self.host, self.hosts),
+                       (self.src, self.srcs), (self.seg, self.segs)):
+            col.fit(len(d.values))
+        for col, values in zip((self.epoch, self.idk, self.canon, self.type, self.sev, self.host, self.src, self.line,
+                                self.off, self.length, self.item_len, self.msg_off, self.msg_len), cols):
+            col.extend(values)
+        self.seg.extend([seg_code] * len(epochs))
+        return start + end + 1
+
+    def refresh(self):
+        """与段存储同步：删除/压缩过的段重载，新增字节增量解码，超出预算时移出最旧的段"""
+        segs = self.store.segments()
+        rels = [os.path.relpath(path, self.store.data_dir) for _, path in segs]
+        sizes = {rel: cold_tier.raw_size(path) or 0 for rel, (_, path) in zip(rels, segs)}
+        inodes = {rel: _ino(path) for rel, (_, path) in zip(rels, segs)}
+        stale = [rel for rel, wm in self.watermarks.items()
+                 if sizes.get(rel, -1) < wm or inodes.get(rel) != self.inodes.get(rel)]
+        if stale or self.budget != self.max_bytes:
+            # 释放了内存或预算变化：之前移出的段重新尝试加载
+            self.evicted = set()
+            self.budget = self.max_bytes
+        self._drop(stale)
+        pos = {rel: i for i, rel in enumerate(rels)}
+        uncovered = None
+        # 从最新的段往前增量加载；加载后实际内存超出预算时移出最旧的已缓存段
+        for i in range(len(segs) - 1, -1, -1):
+            rel = rels[i]
+            if rel in self.evicted:
+                uncovered = i
+                break
+            wm = self.watermarks.get(rel, 0)
+            if sizes[rel] > wm:
+                self.watermarks[rel] = self._load(rel, segs[i][1], wm)
+                self.inodes[rel] = inodes[rel]
+            while self.watermarks and self.memory_bytes() > self.max_bytes:
+                oldest = min(self.watermarks, key=pos.get)
+                self._drop([oldest])
+                self.evicted.add(oldest)
+            if rel in self.evicted:
+                uncovered = i
+                break
+        self.uncovered_until = segs[uncovered][0] if uncovered is not None else None
+
+    def covers(self, start=None):
+        """查询范围（从 start 起）是否全部落在已缓存的段内"""
+        if self.uncovered_until is None:
+            return True
+        return bool(start) and start[:10] > self.uncovered_until
+
+    def memory_bytes(self):
+        return len(self.blob) + sum(col.nbytes() for col in self._columns())
+
+    # ---------- 查询 ----------
+    def _keyword_mask(self, keyword):
+        """消息或来源文件包含关键字的行"""
+        n = self.epoch.n
+        mask = np.zeros(n, dtype=bool)
+        kw = keyword.encode('utf-8')
+        if n and kw:
+            starts = self.msg_off.view()
+            ends = starts + self.msg_len.view()
+            blob = self.blob
+            hits = []
+            i = blob.find(kw)
+            while i >= 0:
+                hits.append(i)
+                i = blob.find(kw, i + 1)
+            if hits:
+                hits = np.asarray(hits, dtype=np.int64)
+                rows = np.searchsorted(starts, hits, side='right') - 1
+                ok = (rows >= 0) & (hits + len(kw) <= ends[np.maximum(rows, 0)])
+                mask[rows[ok]] = True
+        src_codes = [c for v, c in self.srcs.codes.items() if keyword in v]
+        if src_codes:
+            mask |= np.isin(self.src.view(), src_codes)
+        return mask
+
+    def _mask(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None):
+        epoch = self.epoch.view()
+        mask = np.ones(len(epoch), dtype=bool)
+        # 与逐行扫描一致：缺少 detected_at 的事件不受时间范围约束
+        if start:
+            mask &= (epoch < 0) | (epoch >= _epoch(start))
+        if end:
+            mask &= (epoch < 0) | (epoch <= _epoch(end))
+        if severities:
+            mask &= np.isin(self.sev.view(), self.sevs.lookup(severities))
+        if types:
+            mask &= np.isin(self.type.view(), self.types.lookup(types))
+        if host_id:
+            mask &= self.host.view() == self.hosts.codes.get(host_id, -1)
+        if keyword:
+            mask &= self._keyword_mask(keyword)
+        return mask
+
+    def query(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+              sort_key='detected_at', reverse=True, page=1, size=20, raw=False):
+        """过滤、排序并分页；范围未被缓存覆盖或排序字段不支持时返回 None
+
+        raw=True 时返回的 events 为 [(游标键, 列表项 JSON)]（见 _read）
+        """
+        if sort_key not in SORT_KEYS:
+            return None
+        with self.lock:
+            self.refresh()
+            if not self.covers(start):
+                return None
+            rows = np.nonzero(self._mask(start, end, severities, types, keyword, host_id))[0]
+            total = len(rows)
+            if sort_key == 'detected_at':
+                key = self.epoch.view()[rows]
+            elif sort_key == 'line_number':
+                key = self.line.view()[rows]
+            else:
+                col, d = {'type': (self.type, self.types), 'severity': (self.sev, self.sevs),
+                          'host_id': (self.host, self.hosts), 'source_file': (self.src, self.srcs)}[sort_key]
+                key = d.ranks()[col.view()[rows]]
+            # 稳定排序；降序时相等元素保持原有顺序，与 list.sort(reverse=True) 一致
+            skey = -key if reverse else key
+            order = np.argsort(skey, kind='stable')
+            lo = max(0, (page - 1) * size)
+            hi = min(lo + size, total)
+            a, b = lo, hi
+            if sort_key == 'detected_at' and lo < hi:
+                # 与游标分页一致按完整键 (detected_at, id, type) 排序：缓存只有秒级 epoch，
+                # 页边界所在秒的行全部回读后再排序截取
+                skey = skey[order]
+                a = int(np.searchsorted(skey, skey[lo], side='left'))
+                b = int(np.searchsorted(skey, skey[hi - 1], side='right'))
+            locs = self._locs(rows[order[a:b]])
+        events = self._read(locs, raw)
+        if events is None:
+            return None
+        if (a, b) != (lo, hi):
+            events.sort(key=_raw_key if raw else event_key, reverse=reverse)
+            events = events[lo - a:hi - a]
+        return events, total
+
+    def keyset(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+               cursor=None, reverse=True, size=20, raw=False):
+        """游标分页：按 (detected_at, id, type) 顺序返回游标之后的 size 条
+
+        缓存只有秒级 epoch：先用掩码与 partition 选出候选（含与游标、与第 size 条同秒的行，
+        同秒的行再按 id 前缀截取），再回读这些行按完整键排序。范围未被缓存覆盖时返回 None。
+
+        :return: (events, has_next)
+        """
+        with self.lock:
+            self.refresh()
+            if not self.covers(start):
+                return None
+            mask = self._mask(start, end, severities, types, keyword, host_id)
+            epoch = self.epoch.view()
+            ties = np.empty(0, dtype=np.int64)
+            if cursor:
+                ce = _epoch(cursor[0])
+                tie = mask & (epoch == ce)
+                same = np.empty(0, dtype=np.int64)
+                if ce >= 0 and cursor[0] == _iso(ce):
+                    # 规范格式的行与游标的 detected_at 相同，按 id 前缀只取游标之后的；
+                    # 前缀与游标相同的行可能在游标之前，全部回读且不计入截取的条数
+                    idk = self.idk.view()
+                    ck = np.uint64(_id_prefix(cursor[1]))
+                    canon = self.canon.view()
+                    tie &= ~canon | ((idk < ck) if reverse else (idk > ck))
+                    same = np.nonzero(mask & (epoch == ce) & canon & (idk == ck))[0]
+                ties = np.concatenate([same, self._first_ids(np.nonzero(tie)[0], reverse, size + 1)])
+                mask &= (epoch < ce) if reverse else (epoch > ce)
+            rows = np.nonzero(mask)[0]
+            if len(rows) > size + 1:
+                ep = epoch[rows]
+                if reverse:
+                    kth = -np.partition(-ep, size)[size]
+                    rows = rows[ep >= kth]
+                else:
+                    kth = np.partition(ep, size)[size]
+                    rows = rows[ep <= kth]
+                edge = epoch[rows] == kth
+                rows = np.concatenate([rows[~edge], self._first_ids(rows[edge], reverse, size + 1)])
+            locs = self._locs(np.concatenate([ties, rows]))
+        events = self._read(locs, raw)
+        if events is None:
+            return None
+        key_fn = _raw_key if raw else event_key
+        if cursor:
+            events = [ev for ev in events if (key_fn(ev) < cursor if reverse else key_fn(ev) > cursor)]
+        events.sort(key=key_fn, reverse=reverse)
+        return events[:size], len(events) > size
+
+    def _first_ids(self, rows, reverse, limit):
+        """同一秒内的候选行：detected_at 为规范格式的行彼此相同、按 id 排序，
+        只保留 id 前缀排在前面的 limit 个（前缀相同的一并保留）；其余格式的行全部保留"""
+        if len(rows) <= limit:
+            return rows
+        canon = self.canon.arr[rows]
+        k = self.idk.arr[rows[canon]]
+        if len(k) <= limit:
+            return rows
+        j = len(k) - limit if reverse else limit - 1
+        kth = np.partition(k, j)[j]
+        keep = (k >= kth) if reverse else (k <= kth)
+        return np.concatenate([rows[~canon], rows[canon][keep]])
+
+    def _locs(self, rows):
+        seg_names = self.segs.values
+        return [(seg_names[self.seg.arr[r]], int(self.off.arr[r]), int(self.length.arr[r]),
+                 int(self.item_len.arr[r])) for r in rows]
+
+    def _read(self, locs, raw=False):
+        """按 (段, 偏移, 长度) 回读原始事件；段在读取间隙被压缩改写时返回 None
+
+        raw=True 时不解码整行：规范布局的行直接切出列表项，只取游标键，返回 [(游标键, 列表项 JSON)]。
+        同一段的行按偏移升序一次读出，每段只打开一次。
+        """
+        by_seg = {}
+        for i, (rel, off, length, n) in enumerate(locs):
+            by_seg.setdefault(rel, []).append((off, length, n, i))
+        events = [None] * len(locs)
+        for rel, rows in by_seg.items():
+            rows.sort()
+            try:
+                lines = cold_tier.read_ranges(os.path.join(self.store.data_dir, rel), [(off, length) for off, length, _, _ in rows])
+                for (_, _, n, i), line in zip(rows, lines):
+                    if not raw:
+                        events[i] = json.loads(line)
+                        continue
+                    item = raw_item(line, n) if n >= 0 else None
+                    if item is None:
+                        ev = json.loads(line)
+                        item = (event_key(ev), item_json(ev))
+                    events[i] = item
+            except (OSError, ValueError, EOFError):
+                return None
+        if any(ev is None for ev in events):
+            return None
+        return events
+
+    def _last_detection(self, mask, top):
+        """时间最晚的一行的原始 detected_at（保留小数秒、时区等写法，不截断到秒）
+
+        规范格式的行即 _iso(top)；同一秒内其他写法的行回读原文按精确时间比较，回读失败时退回秒级时间。
+        """
+        tie = mask & (self.epoch.view() == top)
+        canon = self.canon.view()
+        rows = np.nonzero(tie & ~canon)[0]
+        if not len(rows):
+            return _iso(top)
+        events = self._read(self._locs(rows))
+        if events is None:
+            return _iso(top)
+        best, best_t = (_iso(top), float(top)) if (tie & canon).any() else (None, None)
+        for ev in events:
+            ts = ev.get('detected_at')
+            try:
+                t = datetime.fromisoformat(ts.replace('Z', '+00:00')).timestamp()
+            except (ValueError, TypeError, AttributeError):
+                continue
+            if best is None or t > best_t:
+                best, best_t = ts, t
+        return best or _iso(top)
+
+    def stats(self, start=None, host_id=None):
+        """用掩码与 bincount 聚合，返回结构同 SegmentStore.rollup_stats；未覆盖时返回 None"""
+        with self.lock:
+            self.refresh()
+            if not self.covers(start):
+                return None
+            epoch = self.epoch.view()
+            mask = np.ones(len(epoch), dtype=bool)
+            if start:
+                mask &= epoch >= _epoch(start)
+            if host_id:
+                mask &= self.host.view() == self.hosts.codes.get(host_id, -1)
+            res = {"total": int(mask.sum()), "by_severity": {}, "by_type": {}, "by_host": {},
+                   "last_detection": None, "trend": {}}
+            for col, d, key in ((self.sev, self.sevs, "by_severity"), (self.type, self.types, "by_type"),
+                                (self.host, self.hosts, "by_host")):
+                counts = np.bincount(col.view()[mask], minlength=len(d.values))
+                for c in np.nonzero(counts)[0]:
+                    if d.values[c]:
+                        res[key][d.values[c]] = int(counts[c])
+            ep = epoch[mask]
+            ep = ep[ep >= 0]
+            if len(ep):
+                res["last_detection"] = self._last_detection(mask, ep.max())
+                hours, counts = np.unique(ep // 3600, return_counts=True)
+                for h, c in zip(hours, counts):
+                    res["trend"][_iso(h * 3600)[:13]] = int(c)
+            return res
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import threading
+
+import cold_tier
+
+# 事件行由 json.dumps 生成，"id" 是第一个（早期数据为第二个）键；直接用正则取出，避免整行解码
+_RE_ID = re.compile(rb'"id":\s*"([^"\\]+)"')
+
+def _line_id(raw):
+    m = _RE_ID.search(raw)
+    if m:
+        return m.group(1).decode('utf-8', 'ignore')
+    try:
+        return json.loads(raw).get('id')
+    except:
+        return None
+
+class EventIndex:
+    """事件 ID → (段文件, 字节偏移, 长度) 的持久化索引
+
+    索引文件为追加写的文本行 ``id\\t段\\t偏移\\t长度``，段名是相对 data 目录的路径。
+    写入时同步追加；其他进程追加到段文件的数据在查询时按各段已索引的水位补扫；
+    整段删除或压缩改写只处理受影响的段，段被其他进程重写时整体重建。
+    偏移均为原始（未压缩）字节偏移，段转为冷段后索引项只改段名。
+    """
+
+    def __init__(self, path, data_dir, segments_fn):
+        """
+        :param path: 索引文件路径
+        :param data_dir: 段文件所在根目录
+        :param segments_fn: 返回当前全部段名（相对 data_dir）的函数
+        """
+        self.path = path
+        self.data_dir = data_dir
+        self.segments_fn = segments_fn
+        self._lock = threading.RLock()
+        self._entries = None
+        self._watermarks = {}
+
+    def _seg_path(self, seg):
+        return os.path.join(self.data_dir, seg)
+
+    def _load(self):
+        entries = {}
+        watermarks = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 4:
+                        continue
+                    try:
+                        off = int(parts[2])
+                        length = int(parts[3])
+                    except ValueError:
+                        continue
+                    entries[parts[0]] = (parts[1], off, length)
+                    if off + length > watermarks.get(parts[1], 0):
+                        watermarks[parts[1]] = off + length
+        except OSError:
+            pass
+        self._entries = entries
+        self._watermarks = watermarks
+        # 索引记录超出段文件长度说明段已被重写，整体重建
+        for seg, wm in watermarks.items():
+            size = cold_tier.raw_size(self._seg_path(seg))
+            if size is None and cold_tier.is_cold(seg):
+                continue
+            if size is None or size < wm:
+                self.rebuild()
+                return
+
+    def _ensure_loaded(self):
+        if self._entries is None:
+            self._load()
+
+    def _append_lines(self, seg, items):
+        if not items:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(f"{eid}\t{seg}\t{off}\t{length}\n" for eid, off, length in items))
+        except OSError:
+            pass
+
+    def note_appended(self, seg, items):
+        """记录刚追加到段 seg 的事件
+
+        :param items: [(id, 偏移, 长度)]
+        """
+        with self._lock:
+            self._ensure_loaded()
+            for eid, off, length in items:
+                self._entries[eid] = (seg, off, length)
+                if off + length > self._watermarks.get(seg, 0):
+                    self._watermarks[seg] = off + length
+            self._append_lines(seg, items)
+
+    def _scan_segment(self, seg, start):
+        """从 start 开始为段中的完整行建立索引，返回 [(id, 偏移, 长度)]"""
+        items = []
+        try:
+            with cold_tier.open_raw(self._seg_path(seg)) as f:
+                f.seek(start)
+                off = start
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    length = len(raw)
+                    if raw.strip():
+                        eid = _line_id(raw)
+                        if eid:
+                            items.append((eid, off, length))
+                    off += length
+                self._watermarks[seg] = off
+        except (OSError, EOFError):
+            pass
+        return items
+
+    def catch_up(self):
+        """补扫其他写入方追加、尚未进入索引的数据"""
+        with self._lock:
+            self._ensure_loaded()
+            for seg in self.segments_fn():
+                # 冷段不再追加，已索引过的无需检查
+                if cold_tier.is_cold(seg) and seg in self._watermarks:
+                    continue
+                size = cold_tier.raw_size(self._seg_path(seg))
+                if size is None:
+                    if not cold_tier.is_cold(seg):
+                        continue
+                    size = self._watermarks.get(seg, 0) + 1
+                wm = self._watermarks.get(seg, 0)
+                if size < wm:
+                    self.rebuild()
+                    return
+                if size > wm:
+                    items = self._scan_segment(seg, wm)
+                    for eid, off, length in items:
+                        self._entries[eid] = (seg, off, length)
+                    self._append_lines(seg, items)
+
+    def _write_all(self):
+        """按内存中的索引项重写索引文件（写临时文件后原子替换）"""
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write("".join(f"{eid}\t{seg}\t{off}\t{length}\n"
+                                for eid, (seg, off, length) in self._entries.items()))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def rebuild(self):
+        """段文件被重写后整体重建索引"""
+        with self._lock:
+            self._entries = {}
+            self._watermarks = {}
+            for seg in self.segments_fn():
+                for eid, off, length in self._scan_segment(seg, 0):
+                    self._entries[eid] = (seg, off, length)
+            self._write_all()
+
+    def drop_segments(self, segs):
+        """段文件被整体删除后移除其索引项，无需重扫其余段"""
+        if not segs:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            segs = set(segs)
+            self._entries = {k: v for k, v in self._entries.items() if v[0] not in segs}
+            for seg in segs:
+                self._watermarks.pop(seg, None)
+            self._write_all()
+
+    def reindex_segments(self, segs):
+        """段文件被压缩改写后只重扫这些段"""
+        if not segs:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            segs = set(segs)
+            self._entries = {k: v for k, v in self._entries.items() if v[0] not in segs}
+            for seg in segs:
+                self._watermarks.pop(seg, None)
+                for eid, off, length in self._scan_segment(seg, 0):
+                    self._entries[eid] = (seg, off, length)
+            self._write_all()
+
+    def rename_segment(self, old, new):
+        """段被压缩为冷段：偏移不变，只替换段名"""
+        with self._lock:
+            self._ensure_loaded()
+            for eid, (seg, off, length) in list(self._entries.items()):
+                if seg == old:
+                    self._entries[eid] = (new, off, length)
+            if old in self._watermarks:
+                self._watermarks[new] = self._watermarks.pop(old)
+            self._write_all()
+
+    def _read_at(self, loc):
+        seg, off, length = loc
+        try:
+            return json.loads(cold_tier.read_range(self._seg_path(seg), off, length))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def read(self, eid):
+        """按 ID 读取事件：一次 seek + 一次 read；不存在时返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            loc = self._entries.get(eid)
+            if loc is None:
+                self.catch_up()
+                loc = self._entries.get(eid)
+                if loc is None:
+                    return None
+        ev = self._read_at(loc)
+        if ev is not None and ev.get('id') == eid:
+            return ev
+        # 偏移失效（段被其他进程重写），重建后再试一次
+        with self._lock:
+            self.rebuild()
+            loc = self._entries.get(eid)
+        if loc is None:
+            return None
+        ev = self._read_at(loc)
+        if ev is not None and ev.get('id') == eid:
+            return ev
+        return None
+
+    def read_many(self, eids):
+        """按 ID 批量读取：{id: 事件}，不存在的 ID 不出现在结果中
+
+        位置按段分组、段内按偏移升序读取，每段只打开一次，冷段每个成员块最多解压一次。
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if any(eid not in self._entries for eid in eids):
+                self.catch_up()
+            by_seg = {}
+            for eid in set(eids):
+                loc = self._entries.get(eid)
+                if loc is not None:
+                    by_seg.setdefault(loc[0], []).append((loc[1], loc[2], eid))
+        found = {}
+        stale = []
+        for seg, locs in by_seg.items():
+            locs.sort()
+            try:
+                raws = list(cold_tier.read_ranges(self._seg_path(seg), [(off, length) for off, length, _ in locs]))
+            except (OSError, EOFError):
+                raws = []
+            for i, (_, _, eid) in enumerate(locs):
+                try:
+                    ev = json.loads(raws[i])
+                except (IndexError, ValueError):
+                    ev = None
+                if ev is not None and ev.get('id') == eid:
+                    found[eid] = ev
+                else:
+                    stale.append(eid)
+        # 偏移失效的逐个读取（read 会重建索引后再试）
+        for eid in stale:
+            ev = self.read(eid)
+            if ev is not None:
+                found[eid] = ev
+        return found
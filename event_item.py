@@ -0,0 +1,81 @@
+import re
+import json
+
+from response_utils import RawJSON
+
+# 事件列表与导出的对外字段（按输出顺序）
+ITEM_KEYS = ('id', 'type', 'severity', 'message', 'source_file', 'line_number', 'detected_at', 'host_id', 'fields')
+_ITEM_KEY_SET = frozenset(ITEM_KEYS)
+
+# 规范布局的行以 id、type 开头；detected_at 之前只有字符串与行号，第一处匹配即顶层字段
+_JSON_STR = rb'"(?:[^"\\]|\\.)*"|null'
+_RE_HEAD = re.compile(rb'\{"id": (' + _JSON_STR + rb'), "type": (' + _JSON_STR + rb'), ')
+_RE_DETECTED = re.compile(rb', "detected_at": (' + _JSON_STR + rb'), "host_id": ')
+
+def event_key(ev):
+    """游标分页的全序键：(detected_at, id, type)；同一行命中多个类型时 id 相同"""
+    return (ev.get('detected_at') or '', ev.get('id') or '', ev.get('type') or '')
+
+def event_item(ev):
+    """事件列表与导出的对外字段"""
+    return {
+        "id": ev.get('id'),
+        "type": ev.get('type'),
+        "severity": ev.get('severity'),
+        "message": ev.get('message'),
+        "source_file": ev.get('source_file'),
+        "line_number": ev.get('line_number'),
+        "detected_at": ev.get('detected_at'),
+        "host_id": ev.get('host_id'),
+        "fields": ev.get('fields') or {}
+    }
+
+def encode_event(ev):
+    """按规范布局编码为存储用的 JSON 文本：对外字段在前，其余字段（schema_version 等）在后
+
+    :return: (JSON 文本, 对外字段前缀长度 n)；text[:n] + '}' 即列表项的 JSON
+    """
+    item = json.dumps(event_item(ev))
+    n = len(item) - 1
+    extra = {k: v for k, v in ev.items() if k not in _ITEM_KEY_SET}
+    if not extra:
+        return item, n
+    return item[:n] + ', ' + json.dumps(extra)[1:], n
+
+def item_prefix_len(raw, ev):
+    """已解码的存储行 raw（bytes）是否为规范布局：是则返回对外字段前缀长度，否则 -1"""
+    item = json.dumps(event_item(ev)).encode('utf-8')
+    n = len(item) - 1
+    if raw[n:n + 1] in (b'}', b',') and raw.startswith(item[:n]):
+        return n
+    return -1
+
+def item_json(ev):
+    """由已解码的事件编码列表项"""
+    return RawJSON(json.dumps(event_item(ev)).encode('utf-8'))
+
+def _token(tok):
+    if tok == b'null':
+        return ''
+    if b'\\' not in tok:
+        return tok[1:-1].decode('utf-8')
+    return json.loads(tok) or ''
+
+def raw_item(raw, n):
+    """从规范布局的存储行切出列表项，只解码游标需要的 detected_at、id、type
+
+    :param raw: 存储行（bytes，可带换行）
+    :param n: 对外字段前缀长度
+    :return: ((detected_at, id, type), RawJSON)；行不符合规范布局时返回 None
+    """
+    # fields 总是对象，前缀以 } 结束，后面紧跟整行的 } 或其余字段
+    if raw[n - 1:n + 1] not in (b'}}', b'},'):
+        return None
+    head = _RE_HEAD.match(raw)
+    if head is None:
+        return None
+    m = _RE_DETECTED.search(raw, head.end(), n)
+    if m is None:
+        return None
+    key = (_token(m.group(1)), _token(head.group(1)), _token(head.group(2)))
+    return key, RawJSON(raw[:n] + b'}')
@@ -0,0 +1,131 @@
+import time
+import threading
+
+FSYNC_POLICIES = ('none', 'interval', 'always')
+
+class EventWriter:
+    """进程内单写线程：把各处提交的事件合并成批写入存储（group commit）
+
+    提交方只把事件放入队列；写线程在攒满 batch_size 条或距第一条待写事件
+    flush_ms 毫秒后一次写入。落盘策略：
+    - none：不主动 fsync，交给操作系统回写
+    - interval：距上次 fsync 超过 fsync_interval_ms 时在写入后 fsync
+    - always：每批写入后 fsync，提交方阻塞到所在批次落盘后返回，
+      并发提交的事件共享同一次 fsync
+    """
+
+    def __init__(self, write_fn, sync_fn, flush_ms=200, batch_size=1000, fsync='interval',
+                 fsync_interval_ms=1000):
+        """
+        :param write_fn: 写入一批事件的函数
+        :param sync_fn: 把已写入的数据刷到磁盘的函数
+        """
+        self.write_fn = write_fn
+        self.sync_fn = sync_fn
+        self.configure(flush_ms, batch_size, fsync, fsync_interval_ms)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._submitted = 0
+        self._written = 0
+        self._flush_wanted = False
+        self._stopping = False
+        self._last_sync = time.time()
+        self._unsynced = False
+        self._thread = None
+
+    def configure(self, flush_ms=200, batch_size=1000, fsync='interval', fsync_interval_ms=1000):
+        self.flush_sec = max(0, flush_ms) / 1000.0
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync if fsync in FSYNC_POLICIES else 'interval'
+        self.fsync_interval_sec = max(0, fsync_interval_ms) / 1000.0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, evs):
+        """提交一批事件；fsync=always 时等待落盘"""
+        if not evs:
+            return
+        with self._cond:
+            if self._stopping:
+                # 关闭后到达的事件直接同步写入
+                self.write_fn(list(evs))
+                return
+            self._ensure_thread()
+            first = not self._pending
+            self._pending.extend(evs)
+            self._submitted += 1
+            ticket = self._submitted
+            # 第一条待写事件开始计时；攒满一批立即写
+            if first or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+            if self.fsync == 'always':
+                self._flush_wanted = True
+                self._cond.notify_all()
+                while self._written < ticket and self._thread is not None:
+                    self._cond.wait(1.0)
+
+    def flush(self, timeout=10.0):
+        """立即写出已提交的事件并 fsync，等待完成"""
+        with self._cond:
+            if self._thread is None:
+                return
+            ticket = self._submitted
+            self._flush_wanted = True
+            self._cond.notify_all()
+            deadline = time.time() + timeout
+            while self._written < ticket and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+
+    def close(self, timeout=10.0):
+        """关闭写线程：写出剩余事件并 fsync"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _take(self):
+        """等待一批待写事件；返回 (事件列表, 批次内最后的提交序号, 是否强制 fsync)"""
+        with self._cond:
+            while not self._pending and not self._stopping and not self._flush_wanted:
+                self._cond.wait()
+            deadline = time.time() + self.flush_sec
+            while (len(self._pending) < self.batch_size and not self._stopping
+                   and not self._flush_wanted):
+                left = deadline - time.time()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch, self._pending = self._pending, []
+            forced = self._flush_wanted or self._stopping
+            self._flush_wanted = False
+            return batch, self._submitted, forced
+
+    def _run(self):
+        while True:
+            batch, ticket, forced = self._take()
+            if batch:
+                try:
+                    self.write_fn(batch)
+                    self._unsynced = True
+                except Exception as e:
+                    print(f"[WRITER] 写入 {len(batch)} 条事件失败: {e}")
+            now = time.time()
+            if self._unsynced and (forced or self.fsync == 'always' or (
+                    self.fsync == 'interval' and now - self._last_sync >= self.fsync_interval_sec)):
+                try:
+                    self.sync_fn()
+                except Exception as e:
+                    print(f"[WRITER] fsync 失败: {e}")
+                self._unsynced = False
+                self._last_sync = now
+            with self._cond:
+                self._written = ticket
+                self._cond.notify_all()
+                if self._stopping and not self._pending:
+                    self._thread = None
+                    return
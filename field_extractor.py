@@ -0,0 +1,173 @@
+import re
+
+# 可提取的结构化字段及其类型，供过滤与分组使用
+FIELD_TYPES = {
+    "pid": int,
+    "comm": str,
+    "total_vm_kb": int,
+    "rss_kb": int,
+    "cgroup": str,
+    "device": str,
+    "sector": int,
+    "cpu": int,
+    "stuck_seconds": int,
+    # 容器日志来源附带的元数据
+    "container_id": str,
+    "container_name": str,
+    "pod": str,
+    "namespace": str,
+}
+
+# OOM 受害进程：Killed process 1234 (python) total-vm:123456kB, anon-rss:1024kB, file-rss:0kB
+_RE_KILLED = re.compile(r"Kill(?:ed)?\s+process\s+(\d+)\s+\(([^)]*)\)", re.IGNORECASE)
+_RE_TOTAL_VM = re.compile(r"total-vm:\s*(\d+)\s*kB", re.IGNORECASE)
+_RE_RSS = re.compile(r"(anon|file|shmem)-rss:\s*(\d+)\s*kB", re.IGNORECASE)
+# oom-kill:constraint=...,oom_memcg=/kubepods/pod1,task_memcg=/kubepods/pod1/c1,task=java,pid=5678,uid=0
+_RE_OOM_KILL_KV = re.compile(r"\b(task_memcg|oom_memcg|task|pid)=([^,\s]+)")
+# Task in /docker/abc killed as a result of limit of /docker/abc
+_RE_TASK_IN = re.compile(r"Task in (\S+) killed as a result of limit", re.IGNORECASE)
+_RE_MEMCG = re.compile(r"Memory cgroup (?:stats|out of memory).*?(?:for|limit of)\s+(/\S+)", re.IGNORECASE)
+
+# 块设备：blk_update_request: I/O error, dev sda, sector 123456
+_RE_DEV_SECTOR = re.compile(r"\bdev\s+([\w\-.:]+?),?\s+sector\s+(\d+)", re.IGNORECASE)
+_RE_DEV = re.compile(r"(?:\bon dev\s+|\bdev\s+|\(device\s+|\bXFS\s+\()([\w\-.]+)", re.IGNORECASE)
+_RE_SECTOR = re.compile(r"\bsector\s+(\d+)", re.IGNORECASE)
+
+# CPU：soft lockup - CPU#3 stuck for 22s! / WARNING: CPU: 1 PID: 1234 at ...
+_RE_CPU_HASH = re.compile(r"CPU#(\d+)")
+_RE_CPU_COLON = re.compile(r"\bCPU:\s*(\d+)\s+PID:\s*(\d+)(?:\s+Comm:\s*(\S+))?")
+_RE_STUCK = re.compile(r"stuck for\s+(\d+)s", re.IGNORECASE)
+_RE_LOCKUP_TASK = re.compile(r"stuck for\s+\d+s!\s*\[([^\]]+):(\d+)\]", re.IGNORECASE)
+# INFO: task jbd2/sda1-8:123 blocked for more than 120 seconds.
+_RE_HUNG_TASK = re.compile(r"task\s+(\S+):(\d+)\s+blocked for more than\s+(\d+)\s+seconds", re.IGNORECASE)
+
+def _extract_oom(line, out):
+    m = _RE_KILLED.search(line)
+    if m:
+        out["pid"] = int(m.group(1))
+        out["comm"] = m.group(2)
+    m = _RE_TOTAL_VM.search(line)
+    if m:
+        out["total_vm_kb"] = int(m.group(1))
+    rss = 0
+    found = False
+    for m in _RE_RSS.finditer(line):
+        rss += int(m.group(2))
+        found = True
+    if found:
+        out["rss_kb"] = rss
+    if "oom-kill:" in line:
+        kv = dict(_RE_OOM_KILL_KV.findall(line))
+        if "pid" in kv and kv["pid"].isdigit():
+            out.setdefault("pid", int(kv["pid"]))
+        if "task" in kv:
+            out.setdefault("comm", kv["task"])
+        cg = kv.get("task_memcg") or kv.get("oom_memcg")
+        if cg and cg != "(null)":
+            out["cgroup"] = cg
+    if "cgroup" not in out:
+        m = _RE_TASK_IN.search(line) or _RE_MEMCG.search(line)
+        if m:
+            out["cgroup"] = m.group(1).rstrip(",")
+
+def _extract_block(line, out):
+    m = _RE_DEV_SECTOR.search(line)
+    if m:
+        out["device"] = m.group(1)
+        out["sector"] = int(m.group(2))
+        return
+    m = _RE_DEV.search(line)
+    if m:
+        out["device"] = m.group(1)
+    m = _RE_SECTOR.search(line)
+    if m:
+        out["sector"] = int(m.group(1))
+
+def _extract_cpu(line, out):
+    m = _RE_CPU_HASH.search(line)
+    if m:
+        out["cpu"] = int(m.group(1))
+    else:
+        m = _RE_CPU_COLON.search(line)
+        if m:
+            out["cpu"] = int(m.group(1))
+            out.setdefault("pid", int(m.group(2)))
+            if m.group(3):
+                out.setdefault("comm", m.group(3))
+    m = _RE_STUCK.search(line)
+    if m:
+        out["stuck_seconds"] = int(m.group(1))
+        m = _RE_LOCKUP_TASK.search(line)
+        if m:
+            out.setdefault("comm", m.group(1))
+            out.setdefault("pid", int(m.group(2)))
+        return
+    m = _RE_HUNG_TASK.search(line)
+    if m:
+        out.setdefault("comm", m.group(1))
+        out.setdefault("pid", int(m.group(2)))
+        out["stuck_seconds"] = int(m.group(3))
+
+def extract_fields(line):
+    """从异常日志行中提取结构化字段
+
+    只有命中的字段才会出现在结果中；先用廉价的子串判断决定
+    是否执行对应的正则，避免每行跑全部模式。
+
+    :param line: 日志原始行
+    :return: dict，例如 {"pid": 1234, "comm": "python", "rss_kb": 1024}
+    """
+    out = {}
+    if not line:
+        return out
+    s = line.lower()
+    if "kill" in s or "oom" in s or "memory cgroup" in s:
+        _extract_oom(line, out)
+    if "dev " in s or "device " in s or "xfs (" in s or "sector" in s:
+        _extract_block(line, out)
+    if "cpu" in s or "stuck for" in s or "blocked for" in s:
+        _extract_cpu(line, out)
+    return out
+
+def coerce_field(name, value):
+    """按字段类型转换查询参数值，无法转换时返回 None"""
+    typ = FIELD_TYPES.get(name)
+    if typ is None:
+        return None
+    try:
+        return typ(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_field_filters(qs):
+    """从查询参数中解析字段过滤条件
+
+    支持 ``?comm=java&device=sda``，同一字段可重复给出多个取值。
+
+    :param qs: parse_qs 的结果
+    :return: {name: set(values)}
+    :raises ValueError: 取值无法按字段类型转换（如 ``?pid=abc``），异常参数为字段名
+    """
+    filters = {}
+    for name in FIELD_TYPES:
+        vals = qs.get(name)
+        if not vals:
+            continue
+        coerced = set()
+        for v in vals:
+            c = coerce_field(name, v)
+            if c is None:
+                raise ValueError(name)
+            coerced.add(c)
+        filters[name] = coerced
+    return filters
+
+def match_field_filters(ev, filters):
+    """判断事件是否满足全部字段过滤条件"""
+    if not filters:
+        return True
+    fields = ev.get('fields') or {}
+    for name, vals in filters.items():
+        if fields.get(name) not in vals:
+            return False
+    return True
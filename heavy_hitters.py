@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import time
+import heapq
+import threading
+
+# 支持的统计维度
+DIMENSIONS = ('message_template', 'source_file', 'host_id')
+
+# 每个小时桶、每个维度的计数器个数
+DEFAULT_CAPACITY = 64
+# 保留的小时桶数（覆盖最近一周再多一天）
+DEFAULT_HOURS = 8 * 24
+
+# 消息模板的最大长度
+TEMPLATE_MAX_CHARS = 200
+
+# 有改动时距上次保存超过该秒数即写回文件
+SAVE_INTERVAL_SEC = 60
+
+# 十六进制常量、含数字的十六进制词（PID、地址、扇区号、时间戳等）与带单位的数值（123456kB、120s）
+_RE_VAR = re.compile(r'0x[0-9a-fA-F]+|\b[0-9a-fA-F]*\d[0-9a-fA-F]*\b|\b\d+(?:[kKmMgG]?[bB]|ms|us|ns|s)\b')
+
+def message_template(msg):
+    """消息模板：数字与十六进制替换为 ``<*>``，如 ``Kill process <*> (java)``"""
+    return _RE_VAR.sub('<*>', (msg or '')[:TEMPLATE_MAX_CHARS * 2])[:TEMPLATE_MAX_CHARS]
+
+def dim_value(ev, dim):
+    if dim == 'message_template':
+        return message_template(ev.get('message'))
+    return ev.get(dim) or ''
+
+class SpaceSaving:
+    """Space-Saving 频繁项摘要：最多 capacity 个计数器
+
+    计数器满时新项顶替计数最小的项，并继承其计数作为可能的高估量；
+    任何项的估计值减去高估量不超过真实次数，未被跟踪的项真实次数不超过最小计数（floor）。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        # (计数, 项) 小顶堆，计数增加后旧条目作废，弹出时跳过
+        self._heap = []
+        self.n = 0
+
+    def add(self, item, c=1):
+        self.n += c
+        rec = self.counts.get(item)
+        if rec is not None:
+            rec[0] += c
+        elif len(self.counts) < self.capacity:
+            rec = self.counts[item] = [c, 0]
+        else:
+            floor = self._pop_min()
+            rec = self.counts[item] = [floor + c, floor]
+        heapq.heappush(self._heap, (rec[0], item))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._compact()
+
+    def _pop_min(self):
+        while True:
+            cnt, item = heapq.heappop(self._heap)
+            rec = self.counts.get(item)
+            if rec is not None and rec[0] == cnt:
+                del self.counts[item]
+                return cnt
+
+    def _compact(self):
+        self._heap = [(rec[0], item) for item, rec in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def floor(self):
+        """未被跟踪的项真实次数的上界；计数器未满时为 0（结果精确）"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(rec[0] for rec in self.counts.values())
+
+    def dump(self):
+        return {"n": self.n, "items": [[item, c, e] for item, (c, e) in self.counts.items()]}
+
+    @classmethod
+    def load(cls, capacity, data):
+        s = cls(capacity)
+        s.n = int(data["n"])
+        for item, c, e in data["items"][:capacity]:
+            s.counts[item] = [int(c), int(e)]
+        s._compact()
+        return s
+
+def merge_top(summaries, limit):
+    """合并多个摘要取前 limit 项
+
+    某项在未跟踪它的摘要中最多出现该摘要 floor 次，计入估计值与高估量。
+    :return: ([(项, 估计次数, 最大高估量)], 事件总数, 未被任何摘要跟踪的项的次数上界)
+    """
+    floors = [s.floor() for s in summaries]
+    total_floor = sum(floors)
+    est = {}
+    for s, fl in zip(summaries, floors):
+        for item, (c, e) in s.counts.items():
+            r = est.get(item)
+            if r is None:
+                r = est[item] = [0, 0, 0]
+            r[0] += c
+            r[1] += e
+            r[2] += fl
+    items = []
+    for item, (c, e, tracked_floor) in est.items():
+        missing = total_floor - tracked_floor
+        items.append((item, c + missing, e + missing))
+    items.sort(key=lambda x: (-x[1], x[0]))
+    return items[:limit], sum(s.n for s in summaries), total_floor
+
+class HeavyHitters:
+    """按小时分桶的热点统计：每个桶、每个维度一个 Space-Saving 摘要，写入时更新
+
+    内存上限为 小时桶数 × 维度数 × capacity 个计数器。与主机登记表一样记录对应的存储代数，
+    本进程的写入与保留清理随之推进；代数对不上（其他进程写入）时由调用方扫描最近的事件重建。
+    保留清理删除的事件不扣减，统计的是写入量。
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, hours=DEFAULT_HOURS):
+        self.path = path
+        self.capacity = capacity
+        self.hours = hours
+        self.lock = threading.RLock()
+        self.buckets = {}
+        self.gen = None
+        self.dirty = False
+        self.saved = time.time()
+
+    def cutoff(self):
+        """最早保留的小时桶（YYYY-MM-DDTHH）"""
+        return time.strftime('%Y-%m-%dT%H', time.gmtime(time.time() - (self.hours - 1) * 3600))
+
+    def _trim(self):
+        cut = self.cutoff()
+        for hour in [h for h in self.buckets if h < cut]:
+            del self.buckets[hour]
+
+    def _add(self, ev, cut):
+        hour = (ev.get('detected_at') or '')[:13]
+        if len(hour) != 13 or hour < cut:
+            return
+        bucket = self.buckets.get(hour)
+        if bucket is None:
+            bucket = self.buckets[hour] = {d: SpaceSaving(self.capacity) for d in DIMENSIONS}
+        for d in DIMENSIONS:
+            bucket[d].add(dim_value(ev, d))
+
+    def note_events(self, evs, prev_gen, gen):
+        """登记刚写入的一批事件；写入前的代数对不上时等待重建"""
+        with self.lock:
+            if self.gen != prev_gen:
+                return
+            cut = self.cutoff()
+            for ev in evs:
+                self._add(ev, cut)
+            self.gen = gen
+            self._changed()
+
+    def note_retention(self, prev_gen, gen):
+        """保留清理推进了代数：不扣减计数，只跟上代数"""
+        with self.lock:
+            if self.gen == prev_gen:
+                self.gen = gen
+                self._trim()
+                self._changed()
+
+    def rebuild(self, events, gen):
+        """由事件重建（调用方只需给出 cutoff() 之后的事件）"""
+        with self.lock:
+            self.buckets = {}
+            cut = self.cutoff()
+            for ev in events:
+                self._add(ev, cut)
+            self.gen = gen
+            self._changed()
+
+    def _changed(self):
+        self.dirty = True
+        if time.time() - self.saved >= SAVE_INTERVAL_SEC:
+            self.save()
+
+    def top(self, dim, start=None, limit=10):
+        """窗口内某维度的热点
+
+        :param start: 可选，ISO8601；按整小时对齐，早于保留范围时从最早的桶开始
+        :return: {items, total, max_error, start, complete}
+        """
+        cut = self.cutoff()
+        start_hour = start[:13] if start else cut
+        with self.lock:
+            self._trim()
+            summaries = [b[dim] for h, b in self.buckets.items() if h >= start_hour]
+            items, total, floor = merge_top(summaries, limit)
+        return {
+            "items": [{"value": v, "count": c, "error": e} for v, c, e in items],
+            "total": total,
+            "max_error": floor,
+            "start": max(start_hour, cut) + ':00:00Z',
+            "complete": start_hour >= cut,
+        }
+
+    def load(self):
+        """从文件恢复；文件不存在、损坏或计数器个数与配置不同时返回 False"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('capacity') != self.capacity:
+                return False
+            buckets = {}
+            for hour, dims in data['buckets'].items():
+                buckets[hour] = {d: SpaceSaving.load(self.capacity, dims[d]) for d in DIMENSIONS}
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        with self.lock:
+            self.buckets = buckets
+            self.gen = data.get('generation')
+            self._trim()
+        return True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self._trim()
+            data = {"generation": self.gen, "capacity": self.capacity,
+                    "saved_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    "buckets": {h: {d: s.dump() for d, s in b.items()} for h, b in self.buckets.items()}}
+            tmp = self.path + '.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"[TOPK] 保存热点统计失败: {e}")
+            self.saved = time.time()
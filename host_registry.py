@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+
+# 有改动时距上次保存超过该秒数即写回文件
+SAVE_INTERVAL_SEC = 60
+
+def _new_host():
+    return {"first_seen": None, "last_seen": None, "last_heartbeat": None,
+            "total": 0, "by_severity": {}, "by_type": {}}
+
+class HostRegistry:
+    """主机登记表：每台主机的首次/最近事件时间、最近一次 Agent 上报时间与按级别、类型的事件数
+
+    写入事件时增量更新，主机列表与主机维度统计只需遍历主机，不读取事件。登记表记录其计数
+    对应的存储代数，代数对不上（其他进程写入、保留清理删除事件）时由调用方按小时汇总重建。
+    保存为 JSON 文件，启动时加载。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.hosts = {}
+        self.gen = None
+        # 上报时间等不改变存储代数的变化也要让 ETag 变化
+        self.version = 0
+        self.dirty = False
+        self.saved = time.time()
+
+    def load(self):
+        """从文件恢复；文件不存在或损坏时返回 False"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            hosts = {}
+            for h, rec in data['hosts'].items():
+                r = _new_host()
+                r.update(rec)
+                hosts[h] = r
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return False
+        with self.lock:
+            self.hosts = hosts
+            self.gen = data.get('generation')
+        return True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {"generation": self.gen, "saved_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    "hosts": self.hosts}
+            tmp = self.path + '.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"[HOSTS] 保存主机登记表失败: {e}")
+            self.saved = time.time()
+
+    def _changed(self):
+        self.version += 1
+        self.dirty = True
+        if time.time() - self.saved >= SAVE_INTERVAL_SEC:
+            self.save()
+
+    def note_events(self, evs, prev_gen, gen):
+        """登记刚写入的一批事件；写入前的代数与登记表一致时增量累加，否则等待重建
+
+        :param prev_gen: 本次写入前的存储代数
+        :param gen: 本次写入后的存储代数
+        """
+        with self.lock:
+            if self.gen != prev_gen:
+                return
+            for ev in evs:
+                h = ev.get('host_id')
+                if not h:
+                    continue
+                rec = self.hosts.get(h)
+                if rec is None:
+                    rec = self.hosts[h] = _new_host()
+                ts = ev.get('detected_at')
+                if ts:
+                    if rec["first_seen"] is None or ts < rec["first_seen"]:
+                        rec["first_seen"] = ts
+                    if rec["last_seen"] is None or ts > rec["last_seen"]:
+                        rec["last_seen"] = ts
+                rec["total"] += 1
+                sev = ev.get('severity')
+                if sev:
+                    rec["by_severity"][sev] = rec["by_severity"].get(sev, 0) + 1
+                typ = ev.get('type')
+                if typ:
+                    rec["by_type"][typ] = rec["by_type"].get(typ, 0) + 1
+            self.gen = gen
+            self._changed()
+
+    def note_heartbeat(self, host_ids, ts):
+        """记录 Agent 上报时间（含不带事件的上报）"""
+        with self.lock:
+            for h in host_ids:
+                if not h:
+                    continue
+                rec = self.hosts.get(h)
+                if rec is None:
+                    rec = self.hosts[h] = _new_host()
+                rec["last_heartbeat"] = ts
+            self._changed()
+
+    def rebuild(self, per_host, gen):
+        """按小时汇总得到的各主机计数重建登记表
+
+        :param per_host: {host_id: {total, by_severity, by_type, first_seen, last_seen}}；
+            first_seen 只精确到小时，已登记的同一小时内或更早的时间保留
+        """
+        with self.lock:
+            hosts = {}
+            for h, agg in per_host.items():
+                old = self.hosts.get(h) or _new_host()
+                rec = _new_host()
+                rec.update(agg)
+                if old["first_seen"] and (rec["first_seen"] is None or old["first_seen"][:13] <= rec["first_seen"][:13]):
+                    rec["first_seen"] = old["first_seen"]
+                rec["last_heartbeat"] = old["last_heartbeat"]
+                hosts[h] = rec
+            # 事件已被清理但仍在上报的主机保留
+            for h, old in self.hosts.items():
+                if h not in hosts and old["last_heartbeat"]:
+                    rec = _new_host()
+                    rec["first_seen"] = old["first_seen"]
+                    rec["last_heartbeat"] = old["last_heartbeat"]
+                    hosts[h] = rec
+            self.hosts = hosts
+            self.gen = gen
+            self._changed()
+
+    def host_ids(self):
+        with self.lock:
+            return sorted(self.hosts)
+
+    def items(self):
+        """全部主机的登记信息（副本），按 host_id 排序"""
+        with self.lock:
+            return [dict(self.hosts[h], host_id=h, by_severity=dict(self.hosts[h]["by_severity"]),
+                         by_type=dict(self.hosts[h]["by_type"])) for h in sorted(self.hosts)]
@@ -7,9 +7,15 @@ import smtplib
 import threading
 import re
 from email.message import EmailMessage
-from config import DATA_DIR, CONFIG_FILE, ANOMALIES_FILE, SCHEMA_VERSION, read_config
+from config import DATA_DIR, CONFIG_FILE, SCHEMA_VERSION, read_config
+from data_store import (submit_event, submit_events, flush_events, count_events, apply_retention,
+                        compress_cold_partitions, dedupe_events)
+from field_extractor import extract_fields
+from log_time import default_parser, log_time_iso
+from container_logs import is_container_log, container_meta, forget_meta, decode_envelopes, read_new_lines
 
 OFFSETS_FILE = os.path.join(DATA_DIR, 'ingest_offsets.json')
+CONTAINER_OFFSETS_FILE = os.path.join(DATA_DIR, 'container_offsets.json')
 ALERT_STATE_FILE = os.path.join(DATA_DIR, 'alert_state.json')
 
 ingest_started = False
@@ -45,6 +51,24 @@ REGEX_PATTERNS = {
     ],
 }
 
+def _compile_patterns(patterns):
+    """每种类型的多条正则合并为一条预编译的交替式，匹配时只扫描一遍"""
+    compiled = {}
+    for t, pats in patterns.items():
+        ok = []
+        for pat in pats:
+            try:
+                re.compile(pat)
+                ok.append(f"(?:{pat})")
+            except re.error:
+                # 正则错误时跳过该模式
+                continue
+        if ok:
+            compiled[t] = re.compile("|".join(ok), re.IGNORECASE)
+    return compiled
+
+_COMPILED_PATTERNS = _compile_patterns(REGEX_PATTERNS)
+
 def _load_offsets():
     """加载文件偏移量"""
     try:
@@ -61,6 +85,22 @@ def _save_offsets(o):
     except:
         pass
 
+def _load_container_offsets():
+    """加载容器日志偏移量（按 设备号:inode 记录，轮转改名后仍能续读）"""
+    try:
+        with open(CONTAINER_OFFSETS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return {}
+
+def _save_container_offsets(o):
+    """保存容器日志偏移量"""
+    try:
+        with open(CONTAINER_OFFSETS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(o, f)
+    except:
+        pass
+
 def _load_alert_state():
     """加载告警状态"""
     try:
@@ -199,15 +239,10 @@ def _match_types(line, enabled, mode: str):
     # 正则模式：使用更复杂的模式匹配，精度更高
     if use_regex:
         for t in enabled:
-            if t in REGEX_PATTERNS and t not in types:
-                for pat in REGEX_PATTERNS[t]:
-                    try:
-                        if re.search(pat, line, re.IGNORECASE):
-                            types.append(t)
-                            break
-                    except re.error:
-                        # 正则错误时跳过该模式
-                        continue
+            if t not in types:
+                rx = _COMPILED_PATTERNS.get(t)
+                if rx is not None and rx.search(line):
+                    types.append(t)
 
     return types
 
@@ -222,11 +257,44 @@ def _severity_for(t):
         'deadlock': 'major'
     }.get(t, 'minor')
 
+def _build_events(line, types, source_file, line_number, host_id, detected_at, scan_ts):
+    """按命中的异常类型为一行日志构造事件
+
+    :param scan_ts: 扫描/接收时间，参与事件 ID 计算
+    """
+    fields = extract_fields(line)
+    raw = (host_id + source_file + str(line_number) + scan_ts + line).encode('utf-8', 'ignore')
+    eid = hashlib.sha256(raw).hexdigest()[:16]
+    events = []
+    for t in types:
+        events.append({
+            "schema_version": SCHEMA_VERSION,
+            "id": eid,
+            "type": t,
+            "severity": _severity_for(t),
+            "message": line.strip(),
+            "source_file": source_file,
+            "line_number": line_number,
+            "detected_at": detected_at,
+            "host_id": host_id,
+            "processed": False,
+            "fields": dict(fields)
+        })
+    return events
+
 def _write_event(ev):
-    """写入事件"""
+    """写入事件（交给写线程合并成批）"""
+    try:
+        submit_event(ev)
+    except:
+        pass
+
+def _write_events(evs):
+    """批量写入事件"""
+    if not evs:
+        return
     try:
-        with open(ANOMALIES_FILE, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(ev) + "\n")
+        submit_events(evs)
     except:
         pass
 
@@ -270,6 +338,126 @@ def _collect_paths(paths):
                         files.append(os.path.join(root, name))
     return files
 
+def _scan_container_files(files, state, enabled, search_mode, scan_ts, cfg):
+    """扫描容器 JSON 日志
+
+    只对信封中的 log 字段做匹配；未变化的文件只做一次 stat，
+    新增内容整段读取后批量解码。state 中不再出现的文件（已轮转删除）会被清理。
+    """
+    host_id = socket.gethostname()
+    seen = set()
+    for fp in files:
+        try:
+            st = os.stat(fp)
+        except OSError:
+            continue
+        key = f"{st.st_dev}:{st.st_ino}"
+        seen.add(key)
+        ent = state.get(key)
+        if ent is None:
+            ent = {"offset": 0, "lines": 0}
+            state[key] = ent
+        ent["path"] = fp
+        off = int(ent.get("offset", 0))
+        if off > st.st_size:
+            # copytruncate 方式轮转：从头读取
+            off = 0
+            ent["lines"] = 0
+        if off == st.st_size:
+            continue
+        try:
+            lines, new_off = read_new_lines(fp, off, st.st_size)
+        except OSError:
+            continue
+        base_line = int(ent.get("lines", 0))
+        ent["offset"] = new_off
+        ent["lines"] = base_line + len(lines)
+        if not lines:
+            continue
+        meta = container_meta(fp)
+        events = []
+        for idx, env in enumerate(decode_envelopes(lines), 1):
+            if not env:
+                continue
+            msg = env.get('log')
+            if not isinstance(msg, str) or not msg:
+                continue
+            types = _match_types(msg, enabled, search_mode)
+            if not types:
+                continue
+            detected_at = log_time_iso("container://", env.get('time') or '', scan_ts)
+            for ev in _build_events(msg, types, fp, base_line + idx, host_id, detected_at, scan_ts):
+                ev["fields"].update(meta)
+                events.append(ev)
+        events = dedupe_events(events, scan_ts)
+        if events:
+            _write_events(events)
+            for ev in events:
+                try:
+                    _handle_alert(ev, cfg)
+                except:
+                    pass
+    for key in list(state.keys()):
+        if key not in seen:
+            forget_meta(state[key].get("path", ""))
+            del state[key]
+
+def _count_lines(fp, end):
+    """文件前 end 字节中的行数"""
+    n = 0
+    with open(fp, 'rb') as f:
+        while end > 0:
+            chunk = f.read(min(end, 1024 * 1024))
+            if not chunk:
+                break
+            n += chunk.count(b'\n')
+            end -= len(chunk)
+    return n
+
+def _scan_file(fp, offsets, enabled, search_mode, scan_ts, cfg):
+    """从上次的偏移续读一个日志文件，命中的行去重后写入并告警
+
+    offsets[fp] 记录 {"offset": 字节偏移, "lines": 此前的行数}，事件的 line_number 是文件内的
+    绝对行号：每轮续读接着计数，偏移丢失后从头重扫时行号不变，去重指纹（无日志时间时按行号）保持稳定。
+    旧版只记录字节偏移，首次续读时数一遍此前的行数。
+    """
+    sz = os.path.getsize(fp)
+    ent = offsets.get(fp)
+    if isinstance(ent, dict):
+        off = int(ent.get("offset", 0))
+        line_no = ent.get("lines")
+    else:
+        off = int(ent or 0)
+        line_no = None
+    if off > sz or off < 0:
+        off = 0
+        line_no = 0
+        # 文件被截断或轮转，重新探测时间戳格式
+        default_parser.forget(fp)
+    if line_no is None:
+        line_no = _count_lines(fp, off)
+    host_id = socket.gethostname()
+    with open(fp, 'r', errors='ignore') as f:
+        f.seek(off)
+        ln = off
+        for line in f:
+            line_no += 1
+            ln += len(line.encode('utf-8', 'ignore'))
+            types = _match_types(line, enabled, search_mode)
+            if not types:
+                continue
+            # 优先使用日志自带时间，解析失败时回退到扫描时间
+            detected_at = log_time_iso(fp, line, scan_ts)
+            # 重扫（偏移丢失、文件轮转）产生的重复行在写入与告警前丢弃
+            evs = _build_events(line, types, fp, line_no, host_id, detected_at, scan_ts)
+            for ev in dedupe_events(evs, scan_ts):
+                _write_event(ev)
+                try:
+                    _handle_alert(ev, cfg)
+                except:
+                    pass
+    offsets[fp] = {"offset": ln, "lines": line_no}
+
 def ingest_loop():
     """日志摄取循环（本地检测模式）
     
@@ -281,6 +469,7 @@ def ingest_loop():
         return
     ingest_started = True
     offsets = _load_offsets()
+    container_offsets = _load_container_offsets()
     # 初始化最后扫描时间
     last_scan_ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
     
@@ -304,7 +493,14 @@ def ingest_loop():
         enabled = det.get('enabled_detectors', [])
         # 从 config/config.json 中读取搜索 / 检测模式，默认 mixed
         search_mode = det.get('search_mode', 'mixed')
-        files = _collect_paths(paths)
+        container_paths = det.get('container_log_paths', [])
+        files = []
+        container_files = []
+        for fp in _collect_paths(list(paths) + list(container_paths)):
+            if is_container_log(fp):
+                container_files.append(fp)
+            else:
+                files.append(fp)
         # 在每次扫描开始时更新最后扫描时间
         try:
             last_scan_ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
@@ -314,51 +510,26 @@ def ingest_loop():
             try:
                 if fp.endswith('.gz'):
                     continue
-                sz = os.path.getsize(fp)
-                off = int(offsets.get(fp, 0))
-                if off > sz or off < 0:
-                    off = 0
-                with open(fp, 'r', errors='ignore') as f:
-                    f.seek(off)
-                    ln = off
-                    line_no = 0
-                    for line in f:
-                        line_no += 1
-                        ln += len(line.encode('utf-8', 'ignore'))
-                        ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
-                        types = _match_types(line, enabled, search_mode)
-                        for t in types:
-                            raw = (socket.gethostname() + fp + str(line_no) + ts + line).encode('utf-8', 'ignore')
-                            eid = hashlib.sha256(raw).hexdigest()[:16]
-                            ev = {
-                                "schema_version": SCHEMA_VERSION,
-                                "id": eid,
-                                "type": t,
-                                "severity": _severity_for(t),
-                                "message": line.strip(),
-                                "source_file": fp,
-                                "line_number": line_no,
-                                "detected_at": ts,
-                                "host_id": socket.gethostname(),
-                                "processed": False
-                            }
-                            _write_event(ev)
-                            try:
-                                _handle_alert(ev, cfg)
-                            except:
-                                pass
-                    offsets[fp] = ln
+                _scan_file(fp, offsets, enabled, search_mode, last_scan_ts, cfg)
             except:
                 continue
+        # 偏移量只在本轮事件落盘后保存，崩溃时最多重复检测而不丢事件
+        try:
+            flush_events()
+        except:
+            pass
         _save_offsets(offsets)
+        if container_files or container_offsets:
+            try:
+                _scan_container_files(container_files, container_offsets, enabled, search_mode, last_scan_ts, cfg)
+                flush_events()
+            except:
+                pass
+            _save_container_offsets(container_offsets)
         try:
             rmax_now = int(det.get('retention_max_events', 0))
             if rmax_now:
-                try:
-                    with open(ANOMALIES_FILE, 'r', encoding='utf-8') as f:
-                        total_lines = sum(1 for _ in f)
-                except:
-                    total_lines = 0
+                total_lines = count_events()
                 if total_lines > rmax_now:
                     try:
                         cleanup_once(cfg, "超过保留上限")
@@ -383,11 +554,11 @@ def ingest_loop():
             except:
                 cur_interval = start
             
-            cur_paths = det2.get('log_paths', [])
+            cur_paths = det2.get('log_paths', []) + det2.get('container_log_paths', [])
             cur_enabled = det2.get('enabled_detectors', [])
 
             # 如果间隔、路径或启用的检测器发生变化，立即中断等待
-            if cur_interval != start or cur_paths != paths or cur_enabled != enabled:
+            if cur_interval != start or cur_paths != list(paths) + list(container_paths) or cur_enabled != enabled:
                 break
             
             time.sleep(1)
@@ -414,68 +585,22 @@ def cleanup_loop():
         except:
             pass
         try:
-            events = []
-            total_before = 0
-            with open(ANOMALIES_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    s = line.strip()
-                    if not s:
-                        continue
-                    total_before += 1
-                    try:
-                        ev = json.loads(s)
-                    except:
-                        continue
-                    ts = ev.get('detected_at')
-                    try:
-                        t = time.strptime(ts, '%Y-%m-%dT%H:%M:%SZ') if ts else None
-                        te = time.mktime(t) if t else None
-                    except:
-                        te = None
-                    if te is None or te >= cutoff:
-                        events.append((te or 0, s))
-            events.sort(key=lambda x: x[0])
-            if rmax and len(events) > rmax:
-                events = events[-rmax:]
+            total_before, total_after = apply_retention(cutoff, rmax)
             try:
-                with open(ANOMALIES_FILE, 'r+', encoding='utf-8') as f:
-                    f.seek(0)
-                    for _, s in events:
-                        f.write(s + "\n")
-                    f.truncate()
-                try:
-                    total_after = len(events)
-                    removed = max(0, total_before - total_after)
-                    print(f"[CLEANUP] 事件保留: 原={total_before}, 新={total_after}, 删除={removed}")
-                except:
-                    pass
+                removed = max(0, total_before - total_after)
+                print(f"[CLEANUP] 事件保留: 原={total_before}, 新={total_after}, 删除={removed}")
             except:
                 pass
         except:
             pass
         try:
-            day_dir = os.path.join(DATA_DIR, 'anomalies')
-            if os.path.isdir(day_dir):
-                for name in os.listdir(day_dir):
-                    if not name.endswith('.ndjson'):
-                        continue
-                    base = name[:-7]
-                    try:
-                        t = time.strptime(base, '%Y-%m-%d')
-                        te = time.mktime(t)
-                    except:
-                        continue
-                    if te < cutoff:
-                        try:
-                            os.remove(os.path.join(day_dir, name))
-                        except:
-                            pass
-            try:
-                print("[CLEANUP] 日归档清理完成")
-            except:
-                pass
-        except:
-            pass
+            done = compress_cold_partitions()
+            if done:
+                raw = sum(r for _, r, _ in done)
+                gz = sum(g for _, _, g in done)
+                print(f"[CLEANUP] 冷段压缩: {len(done)} 个分区, {raw} -> {gz} 字节")
+        except Exception as e:
+            print(f"[CLEANUP] 冷段压缩失败: {e}")
         try:
             offsets = _load_offsets()
             changed = False
@@ -513,62 +638,15 @@ def cleanup_once(cfg, reason=None):
     except:
         pass
     try:
-        events = []
-        total_before = 0
-        with open(ANOMALIES_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                s = line.strip()
-                if not s:
-                    continue
-                total_before += 1
-                try:
-                    ev = json.loads(s)
-                except:
-                    continue
-                ts = ev.get('detected_at')
-                try:
-                    t = time.strptime(ts, '%Y-%m-%dT%H:%M:%SZ') if ts else None
-                    te = time.mktime(t) if t else None
-                except:
-                    te = None
-                if te is None or te >= cutoff:
-                    events.append((te or 0, s))
-        events.sort(key=lambda x: x[0])
-        if rmax and len(events) > rmax:
-            events = events[-rmax:]
         try:
-            with open(ANOMALIES_FILE, 'r+', encoding='utf-8') as f:
-                f.seek(0)
-                for _, s in events:
-                    f.write(s + "\n")
-                f.truncate()
+            total_before, total_after = apply_retention(cutoff, rmax)
             try:
-                total_after = len(events)
                 removed = max(0, total_before - total_after)
                 print(f"[CLEANUP] 事件保留: 原={total_before}, 新={total_after}, 删除={removed}")
             except:
                 pass
         except:
             pass
-        try:
-            day_dir = os.path.join(DATA_DIR, 'anomalies')
-            if os.path.isdir(day_dir):
-                for name in os.listdir(day_dir):
-                    if not name.endswith('.ndjson'):
-                        continue
-                    base = name[:-7]
-                    try:
-                        t = time.strptime(base, '%Y-%m-%d')
-                        te = time.mktime(t)
-                    except:
-                        continue
-                    if te < cutoff:
-                        try:
-                            os.remove(os.path.join(day_dir, name))
-                        except:
-                            pass
-        except:
-            pass
         try:
             offsets = _load_offsets()
             changed = False
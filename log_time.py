@@ -0,0 +1,181 @@
+import re
+import time
+import calendar
+import threading
+
+_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+# 2025-11-18T10:00:00.000000+08:00 / 2025-11-18T10:00:00Z / journalctl short-iso: 2025-11-18T10:00:00+0800
+# 也兼容 RFC5424 前缀 "<34>1 2025-11-18T10:00:00Z"
+_RE_ISO = re.compile(
+    r'(?:<\d{1,3}>\d?\s*)?(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,]\d+)?(Z|[+-]\d{2}:?\d{2})?'
+)
+# 传统 syslog：Nov 18 10:00:00（无年份、本地时区）
+_RE_SYSLOG = re.compile(r'(?:<\d{1,3}>)?([A-Za-z]{3})\s+(\d{1,2})\s+(\d{2}):(\d{2}):(\d{2})\b')
+# dmesg：[  123.456789] 相对开机时间
+_RE_DMESG = re.compile(r'\[\s*(\d+)\.(\d+)\]')
+# dmesg -T：[Mon Nov 18 10:00:00 2025]
+_RE_DMESG_CTIME = re.compile(r'\[[A-Za-z]{3}\s+([A-Za-z]{3})\s+(\d{1,2})\s+(\d{2}):(\d{2}):(\d{2})\s+(\d{4})\]')
+
+_boot_time = None
+
+def _get_boot_time():
+    """获取本机开机时间（epoch 秒），用于换算 dmesg 相对时间"""
+    global _boot_time
+    if _boot_time is not None:
+        return _boot_time
+    bt = None
+    try:
+        with open('/proc/stat', 'r') as f:
+            for line in f:
+                if line.startswith('btime'):
+                    bt = float(line.split()[1])
+                    break
+    except:
+        bt = None
+    if bt is None:
+        try:
+            with open('/proc/uptime', 'r') as f:
+                bt = time.time() - float(f.read().split()[0])
+        except:
+            bt = 0.0
+    _boot_time = bt
+    return bt
+
+def _parse_iso(line):
+    m = _RE_ISO.match(line)
+    if not m:
+        return None
+    y, mo, d, h, mi, s, tz = m.groups()
+    try:
+        fields = (int(y), int(mo), int(d), int(h), int(mi), int(s), 0, 0, -1)
+        if not tz:
+            return time.mktime(fields)
+        epoch = calendar.timegm(fields)
+    except (ValueError, OverflowError):
+        return None
+    if tz != 'Z':
+        sign = -1 if tz[0] == '+' else 1
+        tz = tz[1:].replace(':', '')
+        epoch += sign * (int(tz[:2]) * 3600 + int(tz[2:]) * 60)
+    return epoch
+
+def _parse_syslog(line):
+    m = _RE_SYSLOG.match(line)
+    if not m:
+        return None
+    mon = _MONTHS.get(m.group(1).lower())
+    if not mon:
+        return None
+    now = time.time()
+    year = time.localtime(now).tm_year
+    try:
+        fields = [year, mon, int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), 0, 0, -1]
+        epoch = time.mktime(tuple(fields))
+        # 没有年份的日志跨年时会落到未来，回退一年
+        if epoch > now + 86400:
+            fields[0] -= 1
+            epoch = time.mktime(tuple(fields))
+    except (ValueError, OverflowError):
+        return None
+    return epoch
+
+def _parse_dmesg(line):
+    m = _RE_DMESG.match(line)
+    if not m:
+        return None
+    return _get_boot_time() + int(m.group(1)) + float('0.' + m.group(2))
+
+def _parse_dmesg_ctime(line):
+    m = _RE_DMESG_CTIME.match(line)
+    if not m:
+        return None
+    mon = _MONTHS.get(m.group(1).lower())
+    if not mon:
+        return None
+    try:
+        return time.mktime((int(m.group(6)), mon, int(m.group(2)), int(m.group(3)),
+                            int(m.group(4)), int(m.group(5)), 0, 0, -1))
+    except (ValueError, OverflowError):
+        return None
+
+# 探测顺序：越具体的格式越靠前
+FORMATS = (
+    ('iso', _parse_iso),
+    ('dmesg_ctime', _parse_dmesg_ctime),
+    ('dmesg', _parse_dmesg),
+    ('syslog', _parse_syslog),
+)
+_PARSERS = dict(FORMATS)
+
+class LogTimeParser:
+    """按文件缓存时间戳格式的日志时间解析器
+
+    每个来源第一次遇到可解析的行时依次尝试全部格式，命中后缓存
+    格式名；此后该来源的每一行只执行一次对应格式的解析。
+    """
+
+    def __init__(self):
+        self._formats = {}
+        self._lock = threading.Lock()
+
+    def detect(self, line):
+        """探测一行日志的时间戳格式，返回格式名或 None"""
+        s = line.lstrip()
+        for name, fn in FORMATS:
+            if fn(s) is not None:
+                return name
+        return None
+
+    def parse(self, source, line):
+        """解析日志行自带的时间
+
+        :param source: 来源标识（文件路径、'journalctl' 等），用于缓存格式
+        :param line: 日志原始行
+        :return: epoch 秒，无法解析时返回 None
+        """
+        if not line:
+            return None
+        s = line.lstrip()
+        fmt = self._formats.get(source)
+        if fmt is None:
+            fmt = self.detect(s)
+            if fmt is None:
+                return None
+            with self._lock:
+                self._formats[source] = fmt
+        epoch = _PARSERS[fmt](s)
+        if epoch is None:
+            # 混合格式的文件（如 dmesg 片段夹在 syslog 中）：单行回退全量探测，不改缓存
+            fb = self.detect(s)
+            if fb is not None:
+                epoch = _PARSERS[fb](s)
+        return epoch
+
+    def forget(self, source):
+        """文件轮转或截断后清除缓存的格式"""
+        with self._lock:
+            self._formats.pop(source, None)
+
+    def format_of(self, source):
+        """返回已缓存的格式名"""
+        return self._formats.get(source)
+
+default_parser = LogTimeParser()
+
+def format_iso(epoch):
+    """epoch 秒转为 ISO8601 UTC 字符串"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
+
+def log_time_iso(source, line, fallback=None):
+    """返回日志行自带时间的 ISO8601 字符串，无法解析时返回 fallback"""
+    epoch = default_parser.parse(source, line)
+    if epoch is None:
+        return fallback
+    try:
+        return format_iso(epoch)
+    except (ValueError, OverflowError, OSError):
+        return fallback
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from response_utils import encode_json
+
+# 默认内存预算与条目上限
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 512
+
+class _Flight:
+    """一次进行中的计算；相同查询的并发请求等待它的结果"""
+
+    def __init__(self, gen):
+        self.gen = gen
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class QueryCache:
+    """读接口结果的 LRU 缓存，按存储代数失效，相同查询并发时只计算一次
+
+    每个结果记录计算时的存储代数：代数未变时直接命中；代数变了但调用方给出的
+    valid(旧代数) 判断结果不受影响时也命中（如结束时间早于新写入事件的历史查询）。
+    同一查询、同一代数的并发请求合并为一次计算（single-flight），其余请求等待结果。
+    结果按 JSON 长度计入内存预算，超出预算或条目上限时淘汰最久未用的结果。
+    缓存的结果由多个请求共享，调用方不得修改。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key, gen, compute, valid=None):
+        """返回查询结果：命中缓存、等待进行中的相同计算，或调用 compute() 计算并缓存
+
+        :param key: 规范化的查询键（可哈希）
+        :param gen: 当前存储代数
+        :param valid: 可选，valid(旧代数) 为 True 表示旧代数下的结果仍然有效
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] == gen or (valid is not None and valid(entry[0]))):
+                self._entries.move_to_end(key)
+                if entry[0] != gen:
+                    # 确认仍有效后记为当前代数，下次不必再判断
+                    self._entries[key] = (gen,) + entry[1:]
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None or flight.gen != gen
+            if leader:
+                # 旧代数的计算结果可能已过期，不合并
+                flight = self._inflight[key] = _Flight(gen)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is None:
+                return flight.value
+            return compute()
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
+        self._put(key, gen, flight.value)
+        return flight.value
+
+    def _put(self, key, gen, value):
+        try:
+            nbytes = len(encode_json(value))
+        except (TypeError, ValueError):
+            return
+        # 单个结果不超过预算的四分之一，避免一次大查询冲掉全部缓存
+        if nbytes > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (gen, value, nbytes)
+            self.bytes += nbytes
+            while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def stats(self):
+        """命中率等计数"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
@@ -1,14 +1,105 @@
+import gzip
 import json
 
-def json_response(handler, obj, status=200):
-    """发送 JSON 响应"""
-    body = json.dumps(obj).encode('utf-8')
+# 超过该大小的 JSON 响应在客户端接受时 gzip 压缩
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+class RawJSON(bytes):
+    """已编码好的 JSON 值（UTF-8），encode_json 原样拼入，不再解码、编码"""
+    __slots__ = ()
+
+# RawJSON 在 json.dumps 中先编码为占位字符串，再整体替换
+_RAW_MARK = '\x00raw\x00'
+_RAW_TOKEN = json.dumps(_RAW_MARK).encode('ascii')
+
+def _encode_slow(obj):
+    if isinstance(obj, RawJSON):
+        return bytes(obj)
+    if isinstance(obj, dict):
+        return b'{' + b', '.join(json.dumps(str(k)).encode('utf-8') + b': ' + _encode_slow(v)
+                                 for k, v in obj.items()) + b'}'
+    if isinstance(obj, (list, tuple)):
+        return b'[' + b', '.join(_encode_slow(v) for v in obj) + b']'
+    return json.dumps(obj).encode('utf-8')
+
+def encode_json(obj):
+    """编码为 UTF-8 JSON，其中的 RawJSON 原样拼接；其余部分与 json.dumps 输出一致"""
+    raws = []
+    def default(o):
+        if isinstance(o, RawJSON):
+            raws.append(o)
+            return _RAW_MARK
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+    body = json.dumps(obj, default=default).encode('utf-8')
+    if not raws:
+        return body
+    parts = body.split(_RAW_TOKEN)
+    if len(parts) != len(raws) + 1:
+        # 数据本身含有占位字符串：逐层拼接
+        return _encode_slow(obj)
+    out = [parts[0]]
+    for raw, part in zip(raws, parts[1:]):
+        out.append(raw)
+        out.append(part)
+    return b"".join(out)
+
+def accepts_gzip(handler):
+    """请求头 Accept-Encoding 是否接受 gzip（q=0 表示拒绝）"""
+    for part in (handler.headers.get('Accept-Encoding') or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            q = params.strip()
+            if q.startswith('q='):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+def json_response(handler, obj, status=200, etag=None):
+    """发送 JSON 响应；较大的响应按 Accept-Encoding 协商 gzip；给出 etag 时附带 ETag，并要求客户端每次重新验证"""
+    body = encode_json(obj)
+    compressible = len(body) >= GZIP_MIN_BYTES
+    encoded = compressible and accepts_gzip(handler)
+    if encoded:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
     handler.send_response(status)
     handler.send_header('Content-Type', 'application/json; charset=utf-8')
     handler.send_header('Content-Length', str(len(body)))
+    if compressible:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if encoded:
+        handler.send_header('Content-Encoding', 'gzip')
+    if etag:
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', 'no-cache')
     handler.end_headers()
     handler.wfile.write(body)
 
+def not_modified(handler, etag, cache_control='no-cache', vary=None):
+    """请求的 If-None-Match 与 etag 相符时发送 304 并返回 True
+
+    :param cache_control: 304 中的 Cache-Control，与 200 响应一致
+    :param vary: 可选，200 响应带有的 Vary，304 中一并发送
+    """
+    inm = handler.headers.get('If-None-Match')
+    if not inm or not etag:
+        return False
+    # 弱比较：忽略 W/ 前缀
+    tags = [t.strip()[2:] if t.strip().startswith('W/') else t.strip() for t in inm.split(',')]
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    if '*' not in tags and opaque not in tags:
+        return False
+    handler.send_response(304)
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', cache_control)
+    if vary:
+        handler.send_header('Vary', vary)
+    handler.end_headers()
+    return True
+
 def error_response(handler, status, code, message, details=None):
     """发送错误响应"""
     json_response(handler, {
@@ -17,4 +108,4 @@ def error_response(handler, status, code, message, details=None):
         "message": message,
         "trace_id": "",
         "details": details or {}
-    }, status=status)
\ No newline at end of file
+    }, status=status)
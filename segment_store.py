@@ -0,0 +1,757 @@
+import os
+import gzip
+import json
+import time
+import threading
+
+import cold_tier
+from event_index import EventIndex
+from token_index import TokenIndex
+from event_item import encode_event
+
+# 单个段文件的默认大小上限，超过后当天的写入滚动到下一个段
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+def day_of(ev):
+    """事件所属的日分区（detected_at 的 UTC 日期，缺失时取当天）"""
+    ts = ev.get('detected_at') or ''
+    if len(ts) >= 10 and ts[4] == '-' and ts[7] == '-':
+        return ts[:10]
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+def parse_segment_name(name):
+    """解析段文件名 YYYY-MM-DD.ndjson / YYYY-MM-DD.N.ndjson（冷段另有 .gz 后缀），返回 (日期, 序号) 或 None"""
+    if name.endswith('.ndjson' + cold_tier.COLD_SUFFIX):
+        name = name[:-len(cold_tier.COLD_SUFFIX)]
+    if not name.endswith('.ndjson'):
+        return None
+    base = name[:-7]
+    day = base[:10]
+    if len(day) != 10 or day[4] != '-' or day[7] != '-':
+        return None
+    rest = base[10:]
+    if not rest:
+        return day, 0
+    if rest[0] == '.' and rest[1:].isdigit():
+        return day, int(rest[1:])
+    return None
+
+def iter_file(path):
+    """逐行解码一个 NDJSON 文件（冷段透明解压），文件不存在时不产出"""
+    try:
+        if cold_tier.is_cold(path):
+            f = gzip.open(path, 'rt', encoding='utf-8')
+        else:
+            f = open(path, 'r', encoding='utf-8')
+    except OSError:
+        return
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ev = json.loads(line)
+            except:
+                continue
+            yield ev
+
+def hour_of(ev):
+    """事件所属的小时桶（detected_at 前 13 位，如 2025-01-19T14）"""
+    ts = ev.get('detected_at') or ''
+    return ts[:13] if len(ts) >= 13 else ''
+
+def rollup_key(ev):
+    return f"{ev.get('host_id') or ''}\t{ev.get('type') or ''}\t{ev.get('severity') or ''}"
+
+def add_rollup(hours, ev):
+    """把一条事件计入小时汇总 {小时: {"主机\t类型\t级别": [条数, 最新 detected_at]}}"""
+    bucket = hours.setdefault(hour_of(ev), {})
+    key = rollup_key(ev)
+    ts = ev.get('detected_at') or ''
+    cur = bucket.get(key)
+    if cur is None:
+        bucket[key] = [1, ts]
+    else:
+        cur[0] += 1
+        if ts > cur[1]:
+            cur[1] = ts
+
+def add_host_rollup(res, host, hour, typ, sev, n, last):
+    """把一个小时桶计数累加到按主机的汇总 {host_id: {total, by_severity, by_type, first_seen, last_seen}}"""
+    rec = res.get(host)
+    if rec is None:
+        rec = res[host] = {"total": 0, "by_severity": {}, "by_type": {}, "first_seen": None, "last_seen": None}
+    rec["total"] += n
+    if sev:
+        rec["by_severity"][sev] = rec["by_severity"].get(sev, 0) + n
+    if typ:
+        rec["by_type"][typ] = rec["by_type"].get(typ, 0) + n
+    first = hour + ':00:00Z' if hour else None
+    if first and (rec["first_seen"] is None or first < rec["first_seen"]):
+        rec["first_seen"] = first
+    if last and (rec["last_seen"] is None or last > rec["last_seen"]):
+        rec["last_seen"] = last
+
+def time_range(hours):
+    """由小时汇总推出 (最早, 最晚) detected_at；最早值精确到小时，含无时间事件时为 None"""
+    first = None
+    last = None
+    for hour, bucket in hours.items():
+        if not hour:
+            first = ''
+        elif first != '' and (first is None or hour < first):
+            first = hour
+        for n, ts in bucket.values():
+            if ts and (last is None or ts > last):
+                last = ts
+    if first:
+        first += ':00:00Z'
+    return first or None, last
+
+def _scan_from(path, start, hours):
+    """解码 start 之后的完整行（以换行结尾）并计入 hours，返回 (条数, 最后一个换行之后的位置)"""
+    n = 0
+    pos = start
+    with cold_tier.open_raw(path) as f:
+        f.seek(start)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            pos += len(raw)
+            if not raw.strip():
+                continue
+            try:
+                ev = json.loads(raw)
+            except ValueError:
+                continue
+            n += 1
+            add_rollup(hours, ev)
+    return n, pos
+
+def _line_end(path):
+    """热段中最后一个完整行的结束位置"""
+    try:
+        with open(path, 'rb') as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(pos, 64 * 1024)
+                f.seek(pos - step)
+                i = f.read(step).rfind(b'\n')
+                if i >= 0:
+                    return pos - step + i + 1
+                pos -= step
+    except OSError:
+        pass
+    return 0
+
+class SegmentStore:
+    """NDJSON 事件存储：按日分区、按大小封顶的只追加段文件
+
+    段文件名为 ``YYYY-MM-DD.ndjson``、``YYYY-MM-DD.1.ndjson`` ……，同一天的写入只追加到
+    序号最大的段，超过大小上限后滚动到新段。每段在元数据目录中有一个同名汇总文件，
+    记录事件数、字节水位和按小时 × 主机 × 类型 × 级别的计数；以字节水位校验，
+    其他进程追加的数据只增量解码。保留清理整段删除过期数据（汇总随段一起删除），
+    只有边界段需要压缩：新内容写入临时文件后原子改名替换，已打开旧段的读者
+    继续读取自己的快照。
+
+    早于冷却天数的段在后台压缩为 ``.ndjson.gz``（冷段），旁边的 ``.hdr`` 头信息记录
+    事件数、时间范围、小时汇总和成员块表：统计与计数只读头信息，时间范围外的冷段
+    不解压即可跳过，按 ID 读取只解压一个成员块。
+
+    启用倒排索引时，关键字查询每段先由词元倒排求出候选行，只读取这些行。
+    """
+
+    def __init__(self, root, data_dir, index_path, meta_dir, max_segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 token_dir=None, token_max_bytes=None):
+        """
+        :param root: 段文件目录（data/anomalies）
+        :param data_dir: data 目录，段名以相对它的路径记录在索引中
+        :param index_path: ID 索引文件
+        :param meta_dir: 段汇总文件目录（每段事件数、字节水位与小时汇总）
+        :param max_segment_bytes: 单段大小上限
+        :param token_dir: 可选，关键字倒排索引目录；不给出时关键字查询逐行扫描
+        :param token_max_bytes: 倒排表常驻内存上限
+        """
+        self.root = root
+        self.data_dir = data_dir
+        self.meta_dir = meta_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.lock = threading.RLock()
+        self.index = EventIndex(index_path, data_dir, lambda: [self._rel(p) for _, p in self.segments()])
+        self.tokens = None
+        if token_dir:
+            self.tokens = TokenIndex(token_dir, data_dir, token_max_bytes)
+        self._active = {}
+        self._meta = {}
+        self._dirty = set()
+        self._unsynced = set()
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.data_dir)
+
+    def _segment_path(self, day, seq):
+        if seq == 0:
+            return os.path.join(self.root, day + '.ndjson')
+        return os.path.join(self.root, f"{day}.{seq}.ndjson")
+
+    # ---------- 段列表 ----------
+    def _list(self):
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        segs = {}
+        for name in names:
+            parsed = parse_segment_name(name)
+            if parsed:
+                path = os.path.join(self.root, name)
+                # 压缩中途中断时热段与冷段并存，以热段为准
+                if parsed in segs and cold_tier.is_cold(path):
+                    continue
+                segs[parsed] = path
+        return sorted((day, seq, path) for (day, seq), path in segs.items())
+
+    def segments(self, start=None, end=None):
+        """返回与 [start, end] 有交集的段 [(日期, 路径)]，按日期、序号升序"""
+        lo = start[:10] if start else None
+        hi = end[:10] if end else None
+        return [(day, path) for day, _, path in self._list()
+                if not ((lo and day < lo) or (hi and day > hi))]
+
+    def _active_segment(self, day):
+        """当天可追加的段（超过大小上限时滚动到新段）"""
+        seq = self._active.get(day)
+        if seq is None:
+            seq = 0
+            for d, s, _ in self._list():
+                if d == day and s > seq:
+                    seq = s
+        path = self._segment_path(day, seq)
+        try:
+            if os.path.getsize(path) >= self.max_segment_bytes:
+                seq += 1
+                path = self._segment_path(day, seq)
+        except OSError:
+            # 冷段不再追加，迟到的事件写入新段
+            if os.path.exists(path + cold_tier.COLD_SUFFIX):
+                seq += 1
+                path = self._segment_path(day, seq)
+        self._active[day] = seq
+        return path
+
+    # ---------- 段汇总 ----------
+    def _meta_path(self, path):
+        return os.path.join(self.meta_dir, os.path.basename(path) + '.json')
+
+    def _get_meta(self, path):
+        """读取段汇总（首次访问时从汇总文件加载），不存在时返回 None"""
+        rel = self._rel(path)
+        rec = self._meta.get(rel)
+        if rec is None:
+            try:
+                with open(self._meta_path(path), 'r', encoding='utf-8') as f:
+                    rec = json.load(f)
+                if not isinstance(rec, dict) or 'hours' not in rec:
+                    rec = None
+            except:
+                rec = None
+            if rec is not None:
+                self._meta[rel] = rec
+        return rec
+
+    def _save_meta(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.meta_dir, exist_ok=True)
+        for rel in list(self._dirty):
+            rec = self._meta.get(rel)
+            if rec is None:
+                continue
+            path = self._meta_path(rel)
+            tmp = path + '.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(rec, f)
+                os.replace(tmp, path)
+            except OSError:
+                continue
+            self._dirty.discard(rel)
+
+    def _drop_meta(self, rel):
+        self._meta.pop(rel, None)
+        self._dirty.discard(rel)
+        try:
+            os.remove(self._meta_path(rel))
+        except OSError:
+            pass
+
+    def _segment_meta(self, path):
+        """段汇总：字节水位与文件一致时直接返回，否则只解码新增部分；冷段读取头信息"""
+        if cold_tier.is_cold(path):
+            return self._cold_meta(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        rec = self._get_meta(path)
+        if rec and rec['bytes'] == size:
+            return rec
+        if rec is None or rec['bytes'] > size:
+            rec = {"events": 0, "bytes": 0, "hours": {}}
+        try:
+            n, pos = _scan_from(path, rec['bytes'], rec['hours'])
+        except OSError:
+            return rec
+        rec['events'] += n
+        rec['bytes'] = pos
+        rel = self._rel(path)
+        self._meta[rel] = rec
+        self._dirty.add(rel)
+        return rec
+
+    def _cold_meta(self, path):
+        hdr = cold_tier.read_header(path)
+        if hdr is not None:
+            return hdr
+        # 头信息丢失：完整解压一次重建（没有块表，按 ID 读取时从头解压）
+        hours = {}
+        try:
+            n, pos = _scan_from(path, 0, hours)
+            first, last = time_range(hours)
+            hdr = {"events": n, "bytes": pos, "gz_bytes": os.path.getsize(path),
+                   "first": first, "last": last, "hours": hours}
+            cold_tier.write_header(path, hdr)
+        except (OSError, EOFError):
+            return None
+        return hdr
+
+    def _refresh(self, start=None):
+        """校验并返回与 start 之后重叠的全部段汇总 [(日期, 路径, 汇总)]"""
+        segs = []
+        for day, path in self.segments(start):
+            rec = self._segment_meta(path)
+            if rec is not None:
+                segs.append((day, path, rec))
+        return segs
+
+    def count(self):
+        """当前事件总数（维护的计数，只对新增字节解码）"""
+        with self.lock:
+            segs = self._refresh()
+            live = set(self._rel(path) for _, path, _ in segs)
+            for rel in list(self._meta):
+                if rel not in live:
+                    self._drop_meta(rel)
+            self._save_meta()
+            return sum(rec['events'] for _, _, rec in segs)
+
+    def rollup_stats(self, start=None, host_id=None):
+        """按小时汇总求和，不读取事件本身
+
+        :param start: 可选，ISO8601；按整小时对齐，只累加该小时及之后的桶
+        :return: {total, by_severity, by_type, by_host, last_detection, trend: {小时: 条数}}
+        """
+        start_hour = start[:13] if start else None
+        res = {"total": 0, "by_severity": {}, "by_type": {}, "by_host": {}, "last_detection": None, "trend": {}}
+        with self.lock:
+            segs = self._refresh(start)
+            self._save_meta()
+            for _, _, rec in segs:
+                for hour, bucket in rec['hours'].items():
+                    if start_hour and hour < start_hour:
+                        continue
+                    for key, (n, last) in bucket.items():
+                        host, typ, sev = key.split('\t')
+                        if host_id and host != host_id:
+                            continue
+                        res["total"] += n
+                        if sev:
+                            res["by_severity"][sev] = res["by_severity"].get(sev, 0) + n
+                        if typ:
+                            res["by_type"][typ] = res["by_type"].get(typ, 0) + n
+                        if host:
+                            res["by_host"][host] = res["by_host"].get(host, 0) + n
+                        if hour:
+                            res["trend"][hour] = res["trend"].get(hour, 0) + n
+                        if last and (res["last_detection"] is None or last > res["last_detection"]):
+                            res["last_detection"] = last
+        return res
+
+    def host_rollups(self, start=None):
+        """按主机汇总小时桶：{host_id: {total, by_severity, by_type, first_seen, last_seen}}
+
+        first_seen 取最早有事件的整点，last_seen 取桶内记录的最近事件时间。
+        """
+        start_hour = start[:13] if start else None
+        res = {}
+        with self.lock:
+            segs = self._refresh(start)
+            self._save_meta()
+            for _, _, rec in segs:
+                for hour, bucket in rec['hours'].items():
+                    if start_hour and hour < start_hour:
+                        continue
+                    for key, (n, last) in bucket.items():
+                        host, typ, sev = key.split('\t')
+                        if host:
+                            add_host_rollup(res, host, hour, typ, sev, n, last)
+        return res
+
+    # ---------- 写入 ----------
+    def append(self, evs):
+        """按日分区追加一批事件，并登记到 ID 索引与段清单"""
+        by_day = {}
+        for ev in evs:
+            by_day.setdefault(day_of(ev), []).append(ev)
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            for day, group in by_day.items():
+                self._append_segment(self._active_segment(day), group)
+
+    def _append_segment(self, path, evs):
+        if not evs:
+            return
+        # 规范布局：对外字段在前，列表查询可直接切出列表项（见 event_item）
+        lines = [(encode_event(ev)[0] + "\n").encode('utf-8') for ev in evs]
+        data = b"".join(lines)
+        with open(path, 'ab') as f:
+            off = f.tell()
+            f.write(data)
+        self._unsynced.add(path)
+        rel = self._rel(path)
+        rec = self._get_meta(path)
+        if rec is None and off == 0:
+            rec = {"events": 0, "bytes": 0, "hours": {}}
+            self._meta[rel] = rec
+        if rec is not None and rec['bytes'] == off:
+            rec['events'] += len(evs)
+            rec['bytes'] = off + len(data)
+            for ev in evs:
+                add_rollup(rec['hours'], ev)
+            self._dirty.add(rel)
+        # 其余情况说明有其他进程写过该段，下次读取汇总时从旧水位增量补齐
+        items = []
+        for ev, raw in zip(evs, lines):
+            if ev.get('id'):
+                items.append((ev['id'], off, len(raw)))
+            off += len(raw)
+        self.index.note_appended(rel, items)
+        if self.tokens is not None:
+            pos = off - len(data)
+            rows = []
+            for ev, raw in zip(evs, lines):
+                rows.append((pos, len(raw), ev))
+                pos += len(raw)
+            self.tokens.note_appended(rel, rows)
+
+    def sync(self):
+        """把上次 sync 以来写过的段刷到磁盘"""
+        with self.lock:
+            paths, self._unsynced = self._unsynced, set()
+        for path in paths:
+            try:
+                with open(path, 'ab') as f:
+                    os.fsync(f.fileno())
+            except OSError:
+                pass
+
+    # ---------- 读取 ----------
+    def iter_events(self, start=None, end=None, keyword=None):
+        """按段顺序读取事件；段列表在开始时确定，之后的整段删除不影响已打开的段
+
+        冷段先按头信息中的时间范围判断，不重叠时不解压。给出 keyword 且启用了倒排索引时，
+        每段只读取倒排给出的候选行（可能包含不匹配的行，调用方仍需逐条过滤）。
+        """
+        for _, path in self.segments(start, end):
+            if cold_tier.is_cold(path):
+                hdr = cold_tier.read_header(path)
+                if hdr and hdr.get('first') and hdr.get('last') and (
+                        (end and hdr['first'] > end) or (start and hdr['last'] < start)):
+                    continue
+            locs = None
+            if keyword and self.tokens is not None:
+                locs = self.tokens.lookup(self._rel(path), keyword)
+            if locs is None:
+                yield from iter_file(path)
+                continue
+            try:
+                for raw in cold_tier.read_ranges(path, locs):
+                    try:
+                        yield json.loads(raw)
+                    except ValueError:
+                        continue
+            except (OSError, EOFError):
+                continue
+
+    def get(self, eid):
+        return self.index.read(eid)
+
+    def get_many(self, eids):
+        return self.index.read_many(eids)
+
+    # ---------- 增量同步 ----------
+    def _hot_name(self, path):
+        """段按热段名记录水位：冷段去掉 .gz 后缀即压缩前的热段"""
+        rel = self._rel(path)
+        return rel[:-len(cold_tier.COLD_SUFFIX)] if cold_tier.is_cold(rel) else rel
+
+    def positions(self):
+        """各热段当前已完整写入的字节数 {段名: 字节数}，作为增量同步的到达位置
+
+        其他进程可能正写到一半，水位对齐到最后一个换行。
+        """
+        marks = {}
+        with self.lock:
+            for _, path in self.segments():
+                if not cold_tier.is_cold(path):
+                    marks[self._rel(path)] = _line_end(path)
+        return marks
+
+    def read_since(self, marks, accept, limit):
+        """读取各段在水位 marks 之后追加的完整行（每段内按追加顺序）
+
+        marks 中没有的热段是之后新建的，从头读取；没有的冷段在生成水位时已经压缩，跳过；
+        压缩后仍按原热段名找到水位。段被保留清理改写变短时无法区分新旧，从新的末尾继续。
+
+        :param accept: 过滤函数，参数为解码后的事件
+        :param limit: 最多返回的条数
+        :return: (事件列表, 新水位, 是否还有未读的命中)
+        """
+        hits = []
+        new = {}
+        more = False
+        for _, path in self.segments():
+            name = self._hot_name(path)
+            if name in marks:
+                wm = marks[name]
+            elif cold_tier.is_cold(path):
+                continue
+            else:
+                wm = 0
+            if more:
+                new[name] = wm
+                continue
+            size = cold_tier.raw_size(path)
+            if size is None:
+                continue
+            if size < wm:
+                new[name] = _line_end(path)
+                continue
+            pos = wm
+            try:
+                with cold_tier.open_raw(path) as f:
+                    f.seek(wm)
+                    for raw in f:
+                        if not raw.endswith(b'\n'):
+                            break
+                        if raw.strip():
+                            try:
+                                ev = json.loads(raw)
+                            except ValueError:
+                                ev = None
+                            if isinstance(ev, dict) and accept(ev):
+                                if len(hits) == limit:
+                                    more = True
+                                    break
+                                hits.append(ev)
+                        pos += len(raw)
+            except (OSError, EOFError):
+                pass
+            new[name] = pos
+        return hits, new, more
+
+    # ---------- 保留与压缩 ----------
+    def apply_retention(self, cutoff, max_events):
+        """按保留天数与保留上限裁剪
+
+        过期日期的段与超出上限的最旧段整段删除，只有边界段被压缩，
+        开销与过期数据量成正比，而不是与总量成正比。
+
+        :return: (裁剪前条数, 裁剪后条数)
+        """
+        cutoff_day = time.strftime('%Y-%m-%d', time.gmtime(cutoff))
+        dropped = []
+        compacted = []
+        with self.lock:
+            segs = [(day, path, rec['events']) for day, path, rec in self._refresh()]
+            total_before = sum(c for _, _, c in segs)
+            while segs and segs[0][0] < cutoff_day:
+                dropped.append(segs.pop(0)[1])
+            total = sum(c for _, _, c in segs)
+            if max_events:
+                while segs and total - segs[0][2] >= max_events:
+                    total -= segs[0][2]
+                    dropped.append(segs.pop(0)[1])
+                if segs and total > max_events:
+                    path = segs[0][1]
+                    kept = self._compact(path, segs[0][2] - (total - max_events))
+                    total -= segs[0][2] - kept
+                    compacted.append(path)
+            for path in dropped:
+                if cold_tier.is_cold(path):
+                    cold_tier.remove(path)
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self._drop_meta(self._rel(path))
+            self._active = {}
+            self._save_meta()
+            # 清理其他进程删除段后遗留的汇总文件
+            live = set(os.path.basename(p) + '.json' for _, p in self.segments())
+            try:
+                for name in os.listdir(self.meta_dir):
+                    if name.endswith('.json') and name not in live:
+                        os.remove(os.path.join(self.meta_dir, name))
+            except OSError:
+                pass
+        self.index.drop_segments([self._rel(p) for p in dropped])
+        self.index.reindex_segments([self._rel(p) for p in compacted])
+        if self.tokens is not None:
+            self.tokens.drop_segments([self._rel(p) for p in dropped + compacted])
+            self.tokens.prune(set(self._rel(p) for _, p in self.segments()))
+            self.tokens.save()
+        return total_before, total
+
+    def _compact(self, path, keep):
+        """段只保留 detected_at 最新的 keep 条，写入新文件后原子改名替换
+
+        改名前若旧段又被其他进程追加，把新增部分原样接到新段末尾。
+        :return: 压缩后的条数
+        """
+        if cold_tier.is_cold(path):
+            return self._compact_cold(path, keep)
+        with open(path, 'rb') as old:
+            data = old.read()
+            rows = []
+            for raw in data.split(b'\n'):
+                if not raw.strip():
+                    continue
+                try:
+                    ev = json.loads(raw)
+                except ValueError:
+                    continue
+                rows.append((ev.get('detected_at') or '', raw, ev))
+            rows.sort(key=lambda x: x[0])
+            rows = rows[-keep:] if keep > 0 else []
+            rec = {"events": len(rows), "bytes": 0, "hours": {}}
+            for _, _, ev in rows:
+                add_rollup(rec['hours'], ev)
+            tmp = path + '.compact'
+            with open(tmp, 'wb') as f:
+                f.write(b"".join(r + b"\n" for _, r, _ in rows))
+                rec['bytes'] = f.tell()
+                extra = os.fstat(old.fileno()).st_size - len(data)
+                if extra > 0:
+                    old.seek(len(data))
+                    f.write(old.read(extra))
+        os.replace(tmp, path)
+        # 汇总与新段同步替换；接过来的新增部分在下次读取汇总时按水位补齐
+        rel = self._rel(path)
+        self._meta[rel] = rec
+        self._dirty.add(rel)
+        return rec['events']
+
+    def _compact_cold(self, path, keep):
+        """冷段压缩：解压保留的行写成临时热段，再整体重新压缩替换"""
+        rows = []
+        for ev in iter_file(path):
+            rows.append((ev.get('detected_at') or '', ev))
+        rows.sort(key=lambda x: x[0])
+        rows = rows[-keep:] if keep > 0 else []
+        rec = {"events": len(rows), "bytes": 0, "hours": {}}
+        for _, ev in rows:
+            add_rollup(rec['hours'], ev)
+        rec['first'], rec['last'] = time_range(rec['hours'])
+        tmp = path[:-len(cold_tier.COLD_SUFFIX)] + '.compact'
+        with open(tmp, 'wb') as f:
+            f.write(b"".join((encode_event(ev)[0] + "\n").encode('utf-8') for _, ev in rows))
+        try:
+            cold_tier.compress(tmp, path, rec)
+        finally:
+            os.remove(tmp)
+        return rec['events']
+
+    # ---------- 冷热分层 ----------
+    def compress_cold(self, before_day, limit=None):
+        """把日期早于 before_day 的热段压缩为冷段
+
+        :param before_day: YYYY-MM-DD
+        :param limit: 可选，本轮最多压缩的段数（后台分批进行）
+        :return: [(段名, 原始字节数, 压缩后字节数)]
+        """
+        done = []
+        for day, path in self.segments(None, None):
+            if day >= before_day or (limit is not None and len(done) >= limit):
+                break
+            if cold_tier.is_cold(path):
+                continue
+            with self.lock:
+                rec = self._segment_meta(path)
+                if rec is None:
+                    continue
+                self._save_meta()
+                hdr = json.loads(json.dumps(rec))
+            base_bytes = hdr['bytes']
+            hdr['first'], hdr['last'] = time_range(hdr['hours'])
+            cold = path + cold_tier.COLD_SUFFIX
+            # 压缩在锁外进行，不阻塞写入；热段与冷段并存期间读者仍读热段
+            try:
+                hdr = cold_tier.compress(path, cold, hdr)
+            except OSError as e:
+                print(f"[STORE] 冷段压缩失败 {os.path.basename(path)}: {e}")
+                continue
+            with self.lock:
+                try:
+                    grown = os.path.getsize(path) != hdr['bytes']
+                except OSError:
+                    grown = True
+                if grown:
+                    # 压缩期间又有写入，放弃本次结果，下一轮重试
+                    cold_tier.remove(cold)
+                    continue
+                os.remove(path)
+                # 压缩时接上的尾部未计入汇总，重建头信息
+                if hdr['bytes'] != base_bytes:
+                    hours = {}
+                    n, _ = _scan_from(cold, 0, hours)
+                    hdr['events'] = n
+                    hdr['hours'] = hours
+                    hdr['first'], hdr['last'] = time_range(hours)
+                    cold_tier.write_header(cold, hdr)
+                rel = self._rel(path)
+                self._drop_meta(rel)
+                self._active.pop(day, None)
+                self.index.rename_segment(rel, self._rel(cold))
+                if self.tokens is not None:
+                    self.tokens.rename_segment(rel, self._rel(cold))
+            done.append((os.path.basename(path), hdr['bytes'], hdr['gz_bytes']))
+        return done
+
+    # ---------- 迁移 ----------
+    def migrate_legacy(self, path):
+        """把旧版单文件 anomalies.ndjson 拆分到日分区（按 id + type 去重：同一行命中多个类型时 id 相同），返回导入条数"""
+        by_day = {}
+        for ev in iter_file(path):
+            by_day.setdefault(day_of(ev), []).append(ev)
+        n = 0
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            for day, evs in sorted(by_day.items()):
+                seen = set()
+                for d, p in self.segments(day, day):
+                    seen.update((ev.get('id'), ev.get('type')) for ev in iter_file(p))
+                fresh = []
+                for ev in evs:
+                    key = (ev.get('id'), ev.get('type'))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    fresh.append(ev)
+                self._append_segment(self._active_segment(day), fresh)
+                n += len(fresh)
+            self._save_meta()
+        return n
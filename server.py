@@ -1,16 +1,50 @@
+import io
+import os
+import csv
 import json
 import time
+import signal
 import threading
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 
-from config import WEB_DIR, ensure_dirs, read_config, write_config, USERS_FILE
+from config import WEB_DIR, ensure_dirs, read_config, write_config, USERS_FILE, SCHEMA_VERSION
 sessions = {}
-from data_store import read_summary, compute_stats, iter_anomalies, parse_iso
+from data_store import (read_summary, compute_stats, parse_iso, get_event, query_events, list_hosts, close_event_writer,
+                        query_events_keyset, encode_cursor, decode_cursor, export_events,
+                        query_events_since, arrival_position, encode_since_cursor, decode_since_cursor,
+                        store_generation, storage_backend, cached_query, query_cache_stats, host_stats, get_events,
+                        host_version, note_agent_heartbeat, top_values)
+from heavy_hitters import DIMENSIONS as TOP_DIMENSIONS
+from event_item import event_item
+from field_extractor import parse_field_filters
 from sse_manager import add_client, remove_client, heartbeat_loop, tailer_loop
 from ai_provider import ai_provider
-from response_utils import json_response, error_response
-from ingest_manager import ingest_loop, cleanup_loop, init_alert_state
+from response_utils import json_response, error_response, not_modified, accepts_gzip
+from static_cache import StaticCache, STATIC_TYPES, IMMUTABLE_MAX_AGE
+from ingest_manager import ingest_loop, cleanup_loop, init_alert_state, get_last_scan_ts
+from syslog_receiver import start_syslog_receiver
+
+# 导出格式 → Content-Type
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+EXPORT_COLUMNS = ['id', 'detected_at', 'host_id', 'type', 'severity', 'source_file', 'line_number', 'message', 'fields']
+# 导出时攒够这么多字节写出一个分块
+EXPORT_CHUNK_BYTES = 64 * 1024
+# events:batchGet 单次最多的 ID 数
+BATCH_GET_MAX = 100
+
+static_files = StaticCache(WEB_DIR)
+
+def _data_etag(*extra):
+    """读接口的弱 ETag：存储代数 + 后端 + 其他影响结果的因素
+
+    在读取数据之前计算：读取期间若有新写入，下一次请求的代数不同，会重新计算。
+    """
+    parts = [str(store_generation()), storage_backend()] + [str(x) for x in extra]
+    return 'W/"' + '-'.join(parts) + '"'
 
 class Handler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
@@ -23,6 +57,10 @@ class Handler(SimpleHTTPRequestHandler):
         if p.startswith('/api/v1/'):
             if p == '/api/v1/stats':
                 return self._handle_stats(parsed)
+            elif p == '/api/v1/stats/top':
+                return self._handle_stats_top(parsed)
+            elif p == '/api/v1/events/export':
+                return self._handle_export_events(parsed)
             elif p.startswith('/api/v1/events/'):
                 return self._handle_get_event(p)
             elif p == '/api/v1/events':
@@ -33,8 +71,14 @@ class Handler(SimpleHTTPRequestHandler):
                 return self._handle_sse_stream()
             elif p == '/api/v1/ai/suggestions':
                 return self._handle_ai_suggestions(parsed)
+            elif p == '/api/v1/cache/stats':
+                return json_response(self, {"query_cache": query_cache_stats()})
             elif p == '/api/v1/hosts':
                 return self._handle_list_hosts()
+            elif p == '/api/v1/hosts/stats':
+                return self._handle_hosts_stats(parsed)
+            elif p == '/api/v1/dashboard':
+                return self._handle_dashboard(parsed)
             elif p == '/api/v1/test-email':
                 return self._handle_test_email()
             elif p == '/api/v1/me':
@@ -48,99 +92,331 @@ class Handler(SimpleHTTPRequestHandler):
                 self.send_header('Location', '/login.html')
                 self.end_headers()
                 return
+        if self._serve_static(parsed):
+            return
         return super().do_GET()
 
+    def _serve_static(self, parsed):
+        """从预压缩缓存返回 HTML/JS/CSS；不支持的文件返回 False 交给默认处理
+
+        引用带当前指纹（?v=）时长期缓存，否则每次按 ETag 重新验证。
+        """
+        path = self.translate_path(parsed.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        entry = static_files.get(path)
+        if entry is None:
+            return False
+        version = parse_qs(parsed.query).get('v', [None])[0]
+        if version == entry.version:
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = 'no-cache'
+        encoded = accepts_gzip(self) and len(entry.gz) < len(entry.body)
+        etag = entry.gz_etag if encoded else entry.etag
+        if not_modified(self, etag, cache_control, 'Accept-Encoding'):
+            return True
+        body = entry.gz if encoded else entry.body
+        self.send_response(200)
+        self.send_header('Content-Type', STATIC_TYPES[os.path.splitext(path)[1]])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoded:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
     def _handle_stats(self, parsed):
         """处理统计信息请求"""
         qs = parse_qs(parsed.query)
         window = qs.get('window', [None])[0]
         host_id = qs.get('host_id', [None])[0]
-        res = compute_stats(window, host_id)
-        return json_response(self, res)
+        group_by = qs.get('group_by', [None])[0]
+        # 窗口起点与趋势补齐按整小时推移；响应体含 last_scan，扫描推进后同样要重新返回
+        last_scan = get_last_scan_ts()
+        etag = _data_etag(time.strftime('%Y%m%d%H', time.gmtime()), last_scan or '')
+        if not_modified(self, etag):
+            return
+        return json_response(self, self._cached_stats(window, host_id, group_by, last_scan), etag=etag)
+
+    def _cached_stats(self, window=None, host_id=None, group_by=None, last_scan=None):
+        """统计响应体，按规范化的查询参数缓存；last_scan 不进缓存，每次填入最新值"""
+        groups = ','.join(sorted(g.strip() for g in (group_by or '').split(',') if g.strip()))
+        key = ('stats', window, host_id, groups, time.strftime('%Y%m%d%H', time.gmtime()))
+        res = dict(cached_query(key, lambda: compute_stats(window, host_id, group_by)))
+        res['last_scan'] = last_scan or get_last_scan_ts()
+        return res
+
+    def _handle_stats_top(self, parsed):
+        """窗口内某维度的热点（近似计数，附误差上界）"""
+        qs = parse_qs(parsed.query)
+        dim = qs.get('dim', ['message_template'])[0]
+        window = qs.get('window', [None])[0]
+        if dim not in TOP_DIMENSIONS:
+            return error_response(self, 400, 'INVALID_ARGUMENT', f"parameter 'dim' must be one of {', '.join(TOP_DIMENSIONS)}", {"param": "dim"})
+        try:
+            limit = int(qs.get('limit', ['10'])[0])
+        except ValueError:
+            limit = 0
+        if not (1 <= limit <= 100):
+            return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'limit' must be an integer in [1,100]", {"param": "limit"})
+        # 窗口起点与保留范围按整小时推移
+        etag = _data_etag(time.strftime('%Y%m%d%H', time.gmtime()))
+        if not_modified(self, etag):
+            return
+        res = top_values(dim, window, limit)
+        if res is None:
+            return error_response(self, 409, 'CONFLICT', 'top-k summary is disabled (storage.top_k_enabled)')
+        body = {"schema_version": SCHEMA_VERSION, "dim": dim, "window": window}
+        body.update(res)
+        return json_response(self, body, etag=etag)
 
     def _handle_get_event(self, path):
         """处理获取单个事件请求"""
         eid = path.split('/')[-1]
-        for ev in iter_anomalies():
-            if ev.get('id') == eid:
+        etag = _data_etag()
+        if not_modified(self, etag):
+            return
+        ev = get_event(eid)
+        if ev is not None:
+            obj = ev.copy()
+            obj.setdefault('raw_excerpt', [])
+            return json_response(self, obj, etag=etag)
+        return error_response(self, 404, 'NOT_FOUND', 'event not found')
+
+    def _handle_batch_get_events(self):
+        """按 ID 批量获取事件：{"ids": [...]}，按请求顺序返回找到的事件与缺失的 ID"""
+        try:
+            length = int(self.headers.get('Content-Length', '0'))
+            data = json.loads(self.rfile.read(length).decode('utf-8')) if length > 0 else None
+        except (ValueError, UnicodeDecodeError):
+            return error_response(self, 400, 'INVALID_ARGUMENT', 'invalid json')
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(i, str) and i for i in ids):
+            return error_response(self, 400, 'INVALID_ARGUMENT', "'ids' must be an array of event ids", {"param": "ids"})
+        if len(ids) > BATCH_GET_MAX:
+            return error_response(self, 400, 'INVALID_ARGUMENT', f"at most {BATCH_GET_MAX} ids per request", {"param": "ids"})
+        ids = list(dict.fromkeys(ids))
+        found = get_events(ids)
+        items = []
+        for eid in ids:
+            ev = found.get(eid)
+            if ev is not None:
                 obj = ev.copy()
                 obj.setdefault('raw_excerpt', [])
-                return json_response(self, obj)
-        return error_response(self, 404, 'NOT_FOUND', 'event not found')
+                items.append(obj)
+        return json_response(self, {
+            "items": items,
+            "missing": [eid for eid in ids if eid not in found]
+        })
 
-    def _handle_list_events(self, parsed):
-        """处理事件列表请求"""
+    def _handle_dashboard(self, parsed):
+        """首页初始化数据：统计、最新事件、主机列表、配置与 AI 建议一次返回
+
+        统计取小时汇总（或列式缓存），最新事件走与 /api/v1/events 相同的缓存与首页游标路径，
+        主机取登记表，都不需要逐条扫描事件。
+        """
         qs = parse_qs(parsed.query)
+        window = qs.get('window', [None])[0]
+        host_id = qs.get('host_id', [None])[0] or None
+        try:
+            size = int(qs.get('size', ['10'])[0])
+        except ValueError:
+            size = 0
+        if not (1 <= size <= 100):
+            return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'size' must be an integer in [1,100]", {"param": "size"})
+        filters = (None, None, [], None, None, host_id, {})
+        try:
+            ai = ai_provider.suggestions('PT24H', None, host_id, 1)
+        except Exception as e:
+            print(f"[DASHBOARD] 读取 AI 建议失败: {e}")
+            ai = None
+        return json_response(self, {
+            "stats": self._cached_stats(window, host_id),
+            "events": self._cached_events(filters, 1, size),
+            "hosts": list_hosts(),
+            "config": read_config(),
+            "ai_suggestions": ai,
+            "generated_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        })
+
+    def _parse_event_filters(self, qs):
+        """解析事件列表与导出共用的过滤参数；不合法时发送 400 并返回 None
+
+        :return: (start, end, severities, types, keyword, host_id, field_filters)
+        """
         start = qs.get('start', [None])[0]
         end = qs.get('end', [None])[0]
         severities = qs.get('severity', [])
         types = qs.get('types', [None])[0]
         keyword = qs.get('keyword', [None])[0]
         host_id = qs.get('host_id', [None])[0]
-        page = int(qs.get('page', ['1'])[0])
-        size = int(qs.get('size', ['20'])[0])
-        sort = qs.get('sort', ['detected_at:desc'])[0]
+        try:
+            field_filters = parse_field_filters(qs)
+        except ValueError as e:
+            # 只有整数字段会转换失败
+            name = e.args[0]
+            error_response(self, 400, 'INVALID_ARGUMENT', f"parameter '{name}' must be an integer", {"param": name})
+            return None
         
         tset = None
         if types:
             tset = set([t.strip() for t in types.split(',') if t.strip()])
         
-        items = []
-        for ev in iter_anomalies():
-            if start and not parse_iso(start):
-                return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'start' must be ISO8601", {"param": "start"})
-            if end and not parse_iso(end):
-                return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'end' must be ISO8601", {"param": "end"})
-            
-            if start and ev.get('detected_at') and ev['detected_at'] < start:
-                continue
-            if end and ev.get('detected_at') and ev['detected_at'] > end:
-                continue
-            if severities and ev.get('severity') not in severities:
-                continue
-            if tset and ev.get('type') not in tset:
-                continue
-            if keyword:
-                msg = (ev.get('message') or '')
-                src = (ev.get('source_file') or '')
-                if (keyword not in msg) and (keyword not in src):
-                    continue
-            if host_id and ev.get('host_id') != host_id:
-                continue
-            
-            items.append({
-                "id": ev.get('id'),
-                "type": ev.get('type'),
-                "severity": ev.get('severity'),
-                "message": ev.get('message'),
-                "source_file": ev.get('source_file'),
-                "line_number": ev.get('line_number'),
-                "detected_at": ev.get('detected_at'),
-                "host_id": ev.get('host_id')
-            })
+        if start and not parse_iso(start):
+            error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'start' must be ISO8601", {"param": "start"})
+            return None
+        if end and not parse_iso(end):
+            error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'end' must be ISO8601", {"param": "end"})
+            return None
+        return start, end, severities, tset, keyword, host_id, field_filters
+
+    def _handle_list_events(self, parsed):
+        """处理事件列表请求"""
+        qs = parse_qs(parsed.query)
+        etag = _data_etag()
+        if not_modified(self, etag):
+            return
+        filters = self._parse_event_filters(qs)
+        if filters is None:
+            return
+        start, end, severities, tset, keyword, host_id, field_filters = filters
+        page = int(qs.get('page', ['1'])[0])
+        size = int(qs.get('size', ['20'])[0])
+        sort = qs.get('sort', ['detected_at:desc'])[0]
+        after = qs.get('after', [None])[0]
+        since = qs.get('since', [None])[0]
         
-        reverse = True
-        key = 'detected_at'
-        if sort:
-            try:
-                key, order = sort.split(':')
-                reverse = order == 'desc'
-            except:
-                reverse = True
+        cursor = None
+        if after and since:
+            return error_response(self, 400, 'INVALID_ARGUMENT', "parameters 'after' and 'since' are exclusive", {"param": "since"})
+        if after:
+            cursor = decode_cursor(after)
+            if cursor is None:
+                return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'after' is not a valid cursor", {"param": "after"})
+            if not sort.startswith('detected_at'):
+                return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'after' requires sort=detected_at", {"param": "sort"})
+        if since:
+            # 增量游标记录到达位置，与 sort 无关；换了存储后端的旧游标同样视为不合法
+            cursor = decode_since_cursor(since)
+            if cursor is None:
+                return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'since' is not a valid cursor", {"param": "since"})
         
-        items.sort(key=lambda x: x.get(key) or '', reverse=reverse)
-        total = len(items)
-        start_idx = (page - 1) * size
-        end_idx = start_idx + size
-        page_items = items[start_idx:end_idx]
+        body = self._cached_events(filters, page, size, sort, after, since, cursor)
+        return json_response(self, body, etag=etag)
+
+    def _cached_events(self, filters, page=1, size=20, sort='detected_at:desc', after=None, since=None, cursor=None):
+        """事件列表响应体，按规范化的查询参数缓存"""
+        start, end, severities, tset, keyword, host_id, field_filters = filters
+        key = ('events', start, end, tuple(sorted(severities)), tuple(sorted(tset or ())), keyword, host_id,
+               tuple(sorted((k, tuple(sorted(map(str, v)))) for k, v in field_filters.items())),
+               sort, page, size, after, since)
+        return cached_query(key, lambda: self._events_body(filters, page, size, sort, after, since, cursor), end)
+
+    def _events_body(self, filters, page, size, sort, after, since, cursor):
+        """按分页方式查询并组装事件列表响应体"""
+        start, end, severities, tset, keyword, host_id, field_filters = filters
+        total = None
+        if since:
+            # 增量同步按写入顺序取游标之后到达的事件，日志时间较早的迟到事件也不会漏掉
+            rows, pos, has_next = query_events_since(cursor, start, end, severities, tset, keyword, host_id,
+                                                     field_filters, size, raw=True)
+            return {"items": [item for _, item in rows], "size": size, "has_next": has_next,
+                    "next_cursor": encode_since_cursor(pos)}
+        # 浏览结果之后到达的事件由 since 增量拉取：到达位置在查询之前取，宁可重复不会遗漏
+        arrival = arrival_position()
+        if after:
+            # 游标分页：按 (detected_at, id, type) 顺序取游标之后的一页
+            rows, has_next = query_events_keyset(start, end, severities, tset, keyword, host_id, field_filters,
+                                                 cursor, not sort.endswith(':asc'), size, raw=True)
+        elif page == 1 and sort.startswith('detected_at'):
+            # 首页按游标顺序取，便于用返回的 next_cursor 继续翻页；total 另行计数
+            rows, has_next = query_events_keyset(start, end, severities, tset, keyword, host_id, field_filters,
+                                                 None, not sort.endswith(':asc'), size, raw=True)
+            _, total = query_events(start, end, severities, tset, keyword, host_id, field_filters, sort, 1, 0)
+        else:
+            rows, total = query_events(start, end, severities, tset, keyword, host_id, field_filters, sort, page, size,
+                                       raw=True)
+            has_next = page * size < total
+        # 列表项是存储时保留的 JSON 字节，原样拼入响应；游标只用到各行的 (detected_at, id, type)
+        keys = [key for key, _ in rows]
         
-        return json_response(self, {
-            "items": page_items,
-            "page": page,
-            "size": size,
-            "total": total,
-            "has_next": end_idx < total
-        })
+        body = {"items": [item for _, item in rows], "size": size, "has_next": has_next}
+        if total is not None:
+            body["page"] = page
+            body["total"] = total
+        if after or page == 1:
+            body["next_cursor"] = encode_cursor(keys[-1]) if keys and has_next else None
+        body["since_cursor"] = encode_since_cursor(arrival)
+        return body
+
+    def _handle_export_events(self, parsed):
+        """流式导出命中的事件（format=csv|ndjson），边读边写，内存占用与条数无关"""
+        qs = parse_qs(parsed.query)
+        fmt = qs.get('format', ['csv'])[0]
+        if fmt not in EXPORT_FORMATS:
+            return error_response(self, 400, 'INVALID_ARGUMENT', "parameter 'format' must be csv or ndjson", {"param": "format"})
+        filters = self._parse_event_filters(qs)
+        if filters is None:
+            return
+        
+        # HTTP/1.1 客户端用分块传输；HTTP/1.0 客户端直接写出，以关闭连接结束
+        chunked = self.request_version != 'HTTP/1.0'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        name = time.strftime('events-%Y%m%dT%H%M%SZ', time.gmtime()) + '.' + fmt
+        self.send_response(200)
+        self.send_header('Content-Type', EXPORT_FORMATS[fmt])
+        self.send_header('Content-Disposition', f'attachment; filename="{name}"')
+        self.send_header('Cache-Control', 'no-store')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        
+        def emit(data):
+            if not data:
+                return
+            if chunked:
+                self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+            else:
+                self.wfile.write(data)
+        
+        rows = export_events(*filters)
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        n = 0
+        try:
+            for ev in rows:
+                item = event_item(ev)
+                if writer:
+                    writer.writerow([json.dumps(item['fields'], ensure_ascii=False) if c == 'fields' else item[c]
+                                     for c in EXPORT_COLUMNS])
+                else:
+                    buf.write(json.dumps(item, ensure_ascii=False) + "\n")
+                n += 1
+                if buf.tell() >= EXPORT_CHUNK_BYTES:
+                    emit(buf.getvalue().encode('utf-8'))
+                    buf.seek(0)
+                    buf.truncate()
+            emit(buf.getvalue().encode('utf-8'))
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+            print(f"[EXPORT] 导出 {n} 条事件（{fmt}）: {self.client_address[0]}")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开：停止读取存储
+            print(f"[EXPORT] 客户端断开，已导出 {n} 条: {self.client_address[0]}")
+        except Exception as e:
+            # 响应头已发出，无法再返回错误码：不写结束分块直接断开，客户端据此识别导出不完整
+            print(f"[EXPORT] 读取存储失败，已导出 {n} 条后中止: {e}")
+            self.close_connection = True
+        finally:
+            rows.close()
 
     def _handle_get_config(self):
         """处理获取配置请求"""
@@ -243,14 +519,23 @@ class Handler(SimpleHTTPRequestHandler):
                 return error_response(self, 401, 'UNAUTHORIZED', 'invalid ingest token')
             
             # 写入事件
-            from ingest_manager import _write_event
+            from ingest_manager import _write_events
             from ingest_manager import _handle_alert
             from ingest_manager import _severity_for
             from config import SCHEMA_VERSION
+            from field_extractor import extract_fields
             import socket
             import hashlib
+            from data_store import dedupe_events
             
-            count = 0
+            recv_ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            # 每次上报（含空批次）都记为对应主机的心跳
+            reporters = {data.get('host_id')} | {ev.get('host_id') for ev in events if isinstance(ev, dict)}
+            try:
+                note_agent_heartbeat(sorted(h for h in reporters if isinstance(h, str) and h), recv_ts)
+            except Exception as e:
+                print(f"[HOSTS] 记录上报时间失败: {e}")
+            accepted = []
             for ev in events:
                 # 验证必要字段
                 if not isinstance(ev, dict):
@@ -265,7 +550,7 @@ class Handler(SimpleHTTPRequestHandler):
                     raw_id = (ev.get('host_id', socket.gethostname()) + 
                              ev.get('source_file', '') + 
                              str(ev.get('line_number', 0)) + 
-                             ev.get('detected_at', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())) + 
+                             ev.get('detected_at', recv_ts) + 
                              ev['message']).encode('utf-8', 'ignore')
                     ev['id'] = hashlib.sha256(raw_id).hexdigest()[:16]
                 
@@ -278,15 +563,27 @@ class Handler(SimpleHTTPRequestHandler):
                 
                 # 确保有 detected_at
                 if 'detected_at' not in ev:
-                    ev['detected_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                    ev['detected_at'] = recv_ts
                 
                 # 确保有 host_id
                 if 'host_id' not in ev:
-                    ev['host_id'] = socket.gethostname()
-                
-                # 写入事件
-                _write_event(ev)
+                    ev['host_id'] = data.get('host_id') or socket.gethostname()
+
+                # 确保有结构化字段（Agent 未提取时由服务端补齐）
+                if not isinstance(ev.get('fields'), dict):
+                    ev['fields'] = extract_fields(ev['message'])
                 
+                accepted.append(ev)
+            
+            # Agent 重试或重复上报的事件在写入、告警与推送前丢弃
+            valid = len(accepted)
+            accepted = dedupe_events(accepted, recv_ts)
+            
+            # 整批交给写线程，一次写入
+            _write_events(accepted)
+            
+            from sse_manager import publish_event
+            for ev in accepted:
                 # 处理告警
                 try:
                     _handle_alert(ev, cfg)
@@ -294,18 +591,17 @@ class Handler(SimpleHTTPRequestHandler):
                     pass
                 
                 # 通过 SSE 推送
-                from sse_manager import publish_event
                 try:
                     publish_event(ev)
                 except:
                     pass
-                
-                count += 1
+            count = len(accepted)
             
             return json_response(self, {
                 "status": "success",
                 "received": len(events),
-                "processed": count
+                "processed": count,
+                "duplicates": valid - count
             })
             
         except json.JSONDecodeError:
@@ -315,16 +611,30 @@ class Handler(SimpleHTTPRequestHandler):
 
     def _handle_list_hosts(self):
         """返回所有已注册的机器列表"""
-        hosts = set()
-        for ev in iter_anomalies():
-            host_id = ev.get('host_id')
-            if host_id:
-                hosts.add(host_id)
+        etag = _data_etag(host_version())
+        if not_modified(self, etag):
+            return
+        hosts = list_hosts()
         
         return json_response(self, {
-            "hosts": sorted(list(hosts)),
+            "hosts": hosts,
             "total": len(hosts)
-        })
+        }, etag=etag)
+
+    def _handle_hosts_stats(self, parsed):
+        """按主机统计：事件数（按级别、类型）、首次/最近事件时间与最近上报时间"""
+        qs = parse_qs(parsed.query)
+        window = qs.get('window', [None])[0]
+        # 带窗口时起点按整小时推移
+        etag = _data_etag(host_version(), time.strftime('%Y%m%d%H', time.gmtime()) if window else '')
+        if not_modified(self, etag):
+            return
+        items = host_stats(window)
+        return json_response(self, {
+            "items": items,
+            "total": len(items),
+            "generated_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }, etag=etag)
 
     def _handle_test_email(self):
         try:
@@ -372,6 +682,8 @@ class Handler(SimpleHTTPRequestHandler):
         parsed = urlparse(self.path)
         if parsed.path == '/api/v1/ingest':
             return self._handle_ingest()
+        if parsed.path == '/api/v1/events:batchGet':
+            return self._handle_batch_get_events()
         if parsed.path == '/api/v1/ai/generate':
             return self._handle_ai_generate()
         if parsed.path == '/api/v1/register':
@@ -400,7 +712,7 @@ class Handler(SimpleHTTPRequestHandler):
         except:
             return error_response(self, 400, 'INVALID_ARGUMENT', 'invalid json')
         
-        allowed = {"schema_version", "detection", "alerts", "ui", "security", "smtp"}
+        allowed = {"schema_version", "detection", "alerts", "ui", "security", "smtp", "syslog", "storage"}
         if set(cfg.keys()) - allowed:
             return error_response(self, 400, 'INVALID_ARGUMENT', 'unknown fields')
         
@@ -590,6 +902,9 @@ class Handler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps({"logged_out": True}).encode('utf-8'))
 
+def _on_sigterm(signum, frame):
+    raise KeyboardInterrupt()
+
 def run(host='0.0.0.0', port=8000):
     """启动服务器"""
     ensure_dirs()
@@ -605,10 +920,39 @@ def run(host='0.0.0.0', port=8000):
     else:
         print("ℹ️  本地检测循环已禁用（仅接收 Agent 上报）")
     
+    # 可选：内置 syslog 接收器（无 Agent 设备通过 syslog 转发）
+    try:
+        start_syslog_receiver(cfg)
+    except Exception as e:
+        print(f"❌ Syslog 接收器启动失败: {e}")
+    
+    # 静态文件启动时改写指纹并压缩一次，之后按 mtime 失效
+    try:
+        print(f"📦 已预压缩 {static_files.warm()} 个静态文件")
+    except Exception as e:
+        print(f"❌ 静态文件预压缩失败: {e}")
+    
+    # 主机登记表启动时加载，与存储不一致时按小时汇总重建
+    try:
+        print(f"🖥️  已登记 {len(list_hosts())} 台主机")
+    except Exception as e:
+        print(f"❌ 主机登记表加载失败: {e}")
+    
     httpd = ThreadingHTTPServer((host, port), Handler)
     print(f"服务器启动在 {host}:{port}")
     print(f"📡 Agent 上报接口: POST http://{host}:{port}/api/v1/ingest")
-    httpd.serve_forever()
+    # SIGTERM 与 Ctrl+C 一样走正常退出，确保写线程中积压的事件落盘
+    try:
+        signal.signal(signal.SIGTERM, _on_sigterm)
+    except:
+        pass
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 服务器停止，正在写出积压事件...")
+    finally:
+        httpd.server_close()
+        close_event_writer()
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,430 @@
+import os
+import json
+import sqlite3
+import argparse
+import threading
+
+import cold_tier
+from segment_store import add_host_rollup
+from event_item import encode_event, item_json
+from response_utils import RawJSON
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL,
+        detected_at TEXT,
+        host_id TEXT,
+        type TEXT,
+        severity TEXT,
+        source_file TEXT,
+        line_number INTEGER,
+        message TEXT,
+        body TEXT NOT NULL,
+        item_len INTEGER
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_events_detected_at ON events(detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_events_host ON events(host_id, detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_events_type ON events(type, detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_events_severity ON events(severity, detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_events_id ON events(id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_keyset ON events(detected_at, id, type)",
+    # 结构化字段（见 field_extractor）的倒排表，用于字段过滤与分组
+    """CREATE TABLE IF NOT EXISTS event_fields (
+        name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        PRIMARY KEY (name, value, seq)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_event_fields_seq ON event_fields(seq)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    # 小时汇总（主机 × 类型 × 级别），写入与删除时同步增减
+    """CREATE TABLE IF NOT EXISTS rollups (
+        hour TEXT NOT NULL,
+        host_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        last_at TEXT,
+        PRIMARY KEY (hour, host_id, type, severity)
+    ) WITHOUT ROWID""",
+]
+
+_ROLLUP_GROUP = ("SELECT substr(COALESCE(detected_at, ''), 1, 13), COALESCE(host_id, ''), COALESCE(type, ''), "
+                 "COALESCE(severity, ''), COUNT(*), MAX(detected_at) FROM events{where} GROUP BY 1, 2, 3, 4")
+
+# 允许排序的列（防止 SQL 注入）
+SORT_COLUMNS = {'detected_at', 'type', 'severity', 'host_id', 'source_file', 'line_number', 'id'}
+
+def _row(ev):
+    body, item_len = encode_event(ev)
+    return (
+        ev.get('id') or '',
+        ev.get('detected_at'),
+        ev.get('host_id'),
+        ev.get('type'),
+        ev.get('severity'),
+        ev.get('source_file'),
+        ev.get('line_number'),
+        ev.get('message'),
+        body,
+        item_len
+    )
+
+def _raw_rows(rows):
+    """(detected_at, id, type, body, item_len) 行转为 [(游标键, 列表项 JSON)]
+
+    body 由 json.dumps 生成（纯 ASCII），字符偏移即字节偏移；早期写入、没有 item_len 的行解码后重新编码。
+    """
+    out = []
+    for ts, eid, typ, body, n in rows:
+        key = (ts or '', eid or '', typ or '')
+        if n is None:
+            out.append((key, item_json(json.loads(body))))
+        else:
+            out.append((key, RawJSON((body[:n] + '}').encode('ascii'))))
+    return out
+
+class SQLiteEventStore:
+    """基于标准库 sqlite3 的事件存储（WAL 模式）
+
+    每个线程持有独立连接；写入按批在一个事务中完成。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        d = os.path.dirname(os.path.abspath(path))
+        if d:
+            os.makedirs(d, exist_ok=True)
+        conn = self._conn()
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        if 'item_len' not in [r[1] for r in conn.execute("PRAGMA table_info(events)")]:
+            # 早期建的库：新增列，已有的行保持 NULL，列表查询时回退到解码
+            conn.execute("ALTER TABLE events ADD COLUMN item_len INTEGER")
+        conn.commit()
+        if self.get_meta('rollups') is None:
+            # 早期建的库没有汇总表数据，按现有事件补建一次
+            with self._write_lock:
+                with conn:
+                    conn.execute("DELETE FROM rollups")
+                    conn.execute("INSERT INTO rollups (hour, host_id, type, severity, count, last_at) "
+                                 + _ROLLUP_GROUP.format(where=""))
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollups', '1')")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 写入 ----------
+    def append(self, events):
+        """批量追加事件"""
+        if not events:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for ev in events:
+                    cur = conn.execute(
+                        "INSERT INTO events (id, detected_at, host_id, type, severity, source_file, line_number, message, body, item_len) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _row(ev))
+                    fields = ev.get('fields')
+                    if isinstance(fields, dict) and fields:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO event_fields (name, value, seq) VALUES (?, ?, ?)",
+                            [(k, str(v), cur.lastrowid) for k, v in fields.items() if v is not None])
+                groups = {}
+                for ev in events:
+                    ts = ev.get('detected_at') or ''
+                    key = (ts[:13], ev.get('host_id') or '', ev.get('type') or '', ev.get('severity') or '')
+                    n, last = groups.get(key, (0, ''))
+                    groups[key] = (n + 1, max(last, ts))
+                conn.executemany(
+                    "INSERT INTO rollups (hour, host_id, type, severity, count, last_at) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (hour, host_id, type, severity) DO UPDATE SET count = count + excluded.count, "
+                    "last_at = MAX(COALESCE(last_at, ''), excluded.last_at)",
+                    [k + v for k, v in groups.items()])
+
+    def sync(self):
+        """WAL 模式下提交不逐次 fsync；做一次被动检查点，把 WAL 刷到磁盘"""
+        with self._write_lock:
+            self._conn().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def _unroll(self, conn, where, params):
+        """删除事件前从小时汇总中扣减对应计数"""
+        rows = conn.execute(_ROLLUP_GROUP.format(where=where), params).fetchall()
+        conn.executemany(
+            "UPDATE rollups SET count = count - ? WHERE hour = ? AND host_id = ? AND type = ? AND severity = ?",
+            [(r[4], r[0], r[1], r[2], r[3]) for r in rows])
+        conn.execute("DELETE FROM rollups WHERE count <= 0")
+
+    def delete_before(self, cutoff_iso):
+        """删除 detected_at 早于 cutoff 的事件，返回删除条数"""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._unroll(conn, " WHERE detected_at < ?", (cutoff_iso,))
+                conn.execute("DELETE FROM event_fields WHERE seq IN (SELECT seq FROM events WHERE detected_at < ?)", (cutoff_iso,))
+                cur = conn.execute("DELETE FROM events WHERE detected_at < ?", (cutoff_iso,))
+                return cur.rowcount
+
+    def trim_to(self, max_events):
+        """只保留最新的 max_events 条事件，返回删除条数"""
+        total = self.count()
+        if not max_events or total <= max_events:
+            return 0
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                victims = "SELECT seq FROM events ORDER BY detected_at ASC, seq ASC LIMIT ?"
+                n = total - max_events
+                self._unroll(conn, f" WHERE seq IN ({victims})", (n,))
+                conn.execute(f"DELETE FROM event_fields WHERE seq IN ({victims})", (n,))
+                cur = conn.execute(f"DELETE FROM events WHERE seq IN ({victims})", (n,))
+                return cur.rowcount
+
+    # ---------- 读取 ----------
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def get(self, eid):
+        row = self._conn().execute("SELECT body FROM events WHERE id = ? LIMIT 1", (eid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, eids):
+        """按 ID 批量读取 {id: 事件}（同一 ID 多行时取最早写入的一行）"""
+        eids = list(set(eids))
+        conn = self._conn()
+        res = {}
+        for i in range(0, len(eids), 500):
+            chunk = eids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT id, body FROM events WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY seq", chunk).fetchall()
+            for eid, body in rows:
+                if eid not in res:
+                    res[eid] = json.loads(body)
+        return res
+
+    def hosts(self):
+        rows = self._conn().execute(
+            "SELECT DISTINCT host_id FROM events WHERE host_id IS NOT NULL AND host_id != '' ORDER BY host_id").fetchall()
+        return [r[0] for r in rows]
+
+    def iter_events(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+                    field_filters=None):
+        """按写入顺序逐行读取（游标惰性取数，不把结果集读入内存）"""
+        where, params = self._where(start, end, severities, types, keyword, host_id, field_filters)
+        cur = self._conn().execute(f"SELECT body FROM events{where} ORDER BY seq", params)
+        for (body,) in cur:
+            try:
+                yield json.loads(body)
+            except ValueError:
+                continue
+
+    def events_after(self, seq, limit=500):
+        """返回 seq 之后的新事件 [(seq, ev)]，供 SSE 轮询"""
+        rows = self._conn().execute(
+            "SELECT seq, body FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)).fetchall()
+        return [(s, json.loads(b)) for s, b in rows]
+
+    def max_seq(self):
+        row = self._conn().execute("SELECT MAX(seq) FROM events").fetchone()
+        return row[0] or 0
+
+    def _where(self, start=None, end=None, severities=None, types=None, keyword=None,
+               host_id=None, field_filters=None):
+        clauses = []
+        params = []
+        if start:
+            clauses.append("detected_at >= ?")
+            params.append(start)
+        if end:
+            clauses.append("detected_at <= ?")
+            params.append(end)
+        if severities:
+            clauses.append(f"severity IN ({','.join('?' * len(severities))})")
+            params.extend(severities)
+        if types:
+            clauses.append(f"type IN ({','.join('?' * len(types))})")
+            params.extend(types)
+        if keyword:
+            clauses.append("(instr(message, ?) > 0 OR instr(source_file, ?) > 0)")
+            params.extend([keyword, keyword])
+        if host_id:
+            clauses.append("host_id = ?")
+            params.append(host_id)
+        for name, vals in (field_filters or {}).items():
+            vals = [str(v) for v in vals]
+            clauses.append(
+                f"seq IN (SELECT seq FROM event_fields WHERE name = ? AND value IN ({','.join('?' * len(vals))}))")
+            params.append(name)
+            params.extend(vals)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    def query(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+              field_filters=None, sort_key='detected_at', reverse=True, page=1, size=20, raw=False):
+        """分页查询，返回 (events, total)；raw=True 时 events 为 [(游标键, 列表项 JSON)]"""
+        where, params = self._where(start, end, severities, types, keyword, host_id, field_filters)
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM events{where}", params).fetchone()[0]
+        col = sort_key if sort_key in SORT_COLUMNS else 'detected_at'
+        order = 'DESC' if reverse else 'ASC'
+        offset = max(0, (page - 1) * size)
+        # 按时间排序时与游标分页的 (detected_at, id, type) 顺序一致，首页之后按页码翻也不会错位
+        tie = f"id {order}, type {order}" if col == 'detected_at' else f"seq {order}"
+        cols = "detected_at, id, type, body, item_len" if raw else "body"
+        rows = conn.execute(
+            f"SELECT {cols} FROM events{where} ORDER BY {col} {order}, {tie} LIMIT ? OFFSET ?",
+            params + [size, offset]).fetchall()
+        if raw:
+            return _raw_rows(rows), total
+        return [json.loads(r[0]) for r in rows], total
+
+    def keyset(self, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+               field_filters=None, cursor=None, reverse=True, size=20, raw=False):
+        """游标分页：按 (detected_at, id, type) 顺序返回游标之后的 size 条，返回 (events, has_next)"""
+        where, params = self._where(start, end, severities, types, keyword, host_id, field_filters)
+        if cursor:
+            op = '<' if reverse else '>'
+            where += (" AND " if where else " WHERE ") + f"(detected_at, id, type) {op} (?, ?, ?)"
+            params = params + list(cursor)
+        order = 'DESC' if reverse else 'ASC'
+        cols = "detected_at, id, type, body, item_len" if raw else "body"
+        rows = self._conn().execute(
+            f"SELECT {cols} FROM events{where} ORDER BY detected_at {order}, id {order}, type {order} LIMIT ?",
+            params + [size + 1]).fetchall()
+        events = _raw_rows(rows) if raw else [json.loads(r[0]) for r in rows]
+        return events[:size], len(events) > size
+
+    def since(self, seq, start=None, end=None, severities=None, types=None, keyword=None, host_id=None,
+              field_filters=None, size=20, raw=False):
+        """增量同步：按写入顺序返回 seq 之后写入、命中条件的 size 条
+
+        :return: (events, 新的 seq, has_next)；没有更多命中时新的 seq 至少推进到查询开始时的最大值
+        """
+        top = self.max_seq()
+        where, params = self._where(start, end, severities, types, keyword, host_id, field_filters)
+        where += (" AND " if where else " WHERE ") + "seq > ?"
+        cols = "seq, detected_at, id, type, body, item_len" if raw else "seq, body"
+        rows = self._conn().execute(f"SELECT {cols} FROM events{where} ORDER BY seq LIMIT ?",
+                                    params + [seq, size + 1]).fetchall()
+        more = len(rows) > size
+        rows = rows[:size]
+        if rows:
+            seq = rows[-1][0]
+        if not more:
+            seq = max(seq, top)
+        events = _raw_rows([r[1:] for r in rows]) if raw else [json.loads(r[1]) for r in rows]
+        return events, seq, more
+
+    def rollup_stats(self, start=None, host_id=None):
+        """按小时汇总求和（窗口按整小时对齐），返回结构同 SegmentStore.rollup_stats"""
+        clauses = []
+        params = []
+        if start:
+            clauses.append("hour >= ?")
+            params.append(start[:13])
+        if host_id:
+            clauses.append("host_id = ?")
+            params.append(host_id)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        res = {"total": 0, "by_severity": {}, "by_type": {}, "by_host": {}, "last_detection": None, "trend": {}}
+        rows = self._conn().execute(
+            f"SELECT hour, host_id, type, severity, count, last_at FROM rollups{where}", params).fetchall()
+        for hour, host, typ, sev, n, last in rows:
+            res["total"] += n
+            if sev:
+                res["by_severity"][sev] = res["by_severity"].get(sev, 0) + n
+            if typ:
+                res["by_type"][typ] = res["by_type"].get(typ, 0) + n
+            if host:
+                res["by_host"][host] = res["by_host"].get(host, 0) + n
+            if hour:
+                res["trend"][hour] = res["trend"].get(hour, 0) + n
+            if last and (res["last_detection"] is None or last > res["last_detection"]):
+                res["last_detection"] = last
+        return res
+
+    def host_rollups(self, start=None):
+        """按主机汇总小时桶，返回结构同 SegmentStore.host_rollups"""
+        where, params = (" WHERE hour >= ?", [start[:13]]) if start else ("", [])
+        rows = self._conn().execute(
+            f"SELECT host_id, type, severity, MIN(hour), SUM(count), MAX(last_at) FROM rollups{where} "
+            f"GROUP BY host_id, type, severity", params).fetchall()
+        res = {}
+        for host, typ, sev, hour, n, last in rows:
+            if host:
+                add_host_rollup(res, host, hour, typ, sev, n, last)
+        return res
+
+    def field_counts(self, start=None, host_id=None, group_fields=None):
+        """按结构化字段分组计数 {字段: {值: 条数}}"""
+        where, params = self._where(start=start, host_id=host_id)
+        conn = self._conn()
+        res = {}
+        for name in group_fields or []:
+            res[name] = dict(conn.execute(
+                f"SELECT f.value, COUNT(*) FROM event_fields f JOIN events e ON e.seq = f.seq "
+                f"WHERE f.name = ?{where.replace(' WHERE ', ' AND ')} GROUP BY f.value",
+                [name] + params).fetchall())
+        return res
+
+    # ---------- 迁移 ----------
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate_from_ndjson(self, ndjson_path, batch=5000):
+        """一次性从 NDJSON（含 .gz 冷段）导入事件，返回导入条数"""
+        n = 0
+        buf = []
+        if os.path.exists(ndjson_path):
+            with cold_tier.open_raw(ndjson_path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        buf.append(json.loads(line))
+                    except ValueError:
+                        continue
+                    if len(buf) >= batch:
+                        self.append(buf)
+                        n += len(buf)
+                        buf = []
+        if buf:
+            self.append(buf)
+            n += len(buf)
+        self.set_meta('migrated_from', os.path.abspath(ndjson_path))
+        return n
+
+def main():
+    from config import SQLITE_FILE
+    from data_store import list_segments
+    parser = argparse.ArgumentParser(description='将 NDJSON 事件一次性迁移到 SQLite 事件库')
+    parser.add_argument('--ndjson', nargs='*', help='源 NDJSON 文件，默认为 data/anomalies/ 下的全部日分区')
+    parser.add_argument('--db', default=SQLITE_FILE, help='目标 SQLite 文件')
+    args = parser.parse_args()
+    store = SQLiteEventStore(args.db)
+    paths = args.ndjson or [p for _, p in list_segments()]
+    n = 0
+    for p in paths:
+        n += store.migrate_from_ndjson(p)
+    print(f"迁移完成: {n} 条事件 -> {args.db}")
+
+if __name__ == '__main__':
+    main()
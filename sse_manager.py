@@ -2,7 +2,7 @@ import json
 import time
 import os
 import threading
-from config import ANOMALIES_FILE
+from data_store import get_sqlite_store, list_segments
 
 clients_lock = threading.Lock()
 clients = set()
@@ -65,29 +65,70 @@ def tailer_loop():
         return
     tailer_started = True
     
-    seen = set()
-    with open(ANOMALIES_FILE, 'r', encoding='utf-8') as f:
-        f.seek(0, os.SEEK_END)
+    store = get_sqlite_store()
+    if store is not None:
+        # SQLite 后端：按自增 seq 轮询新事件
+        last_seq = store.max_seq()
         while True:
-            pos = f.tell()
-            line = f.readline()
-            if not line:
+            try:
+                rows = store.events_after(last_seq)
+            except:
+                rows = []
+            for seq, ev in rows:
+                last_seq = seq
+                publish_event(ev)
+            if not rows:
                 time.sleep(1)
-                f.seek(pos)
+    
+    # NDJSON 后端：轮询各日分区的增长（事件按日志时间落盘，可能追加到较早的分区）
+    seen = set()
+    offsets = {}
+    for _, path in list_segments():
+        if path.endswith('.gz'):
+            continue
+        try:
+            offsets[path] = os.path.getsize(path)
+        except OSError:
+            pass
+    while True:
+        for _, path in list_segments():
+            # 冷段（.gz）只由后台压缩生成，不会有新事件
+            if path.endswith('.gz'):
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            pos = offsets.get(path, 0)
+            if size < pos:
+                # 分区被保留清理重写，从新的末尾继续
+                offsets[path] = size
                 continue
-            
-            line = line.strip()
-            if not line:
+            if size == pos:
                 continue
-            
             try:
-                ev = json.loads(line)
+                with open(path, 'rb') as f:
+                    f.seek(pos)
+                    data = f.read(size - pos)
+            except OSError:
+                continue
+            end = data.rfind(b'\n')
+            if end < 0:
+                continue
+            offsets[path] = pos + end + 1
+            for line in data[:end].split(b'\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ev = json.loads(line)
+                except:
+                    continue
                 eid = ev.get('id')
                 if eid and eid not in seen:
                     seen.add(eid)
                     publish_event(ev)
-            except:
-                continue
+        time.sleep(1)
 
 def add_client(client):
     """添加 SSE 客户端"""
@@ -0,0 +1,106 @@
+import os
+import re
+import gzip
+import hashlib
+import threading
+
+# 预压缩并按内容指纹缓存的静态文件类型
+STATIC_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.svg': 'image/svg+xml',
+    '.json': 'application/json; charset=utf-8',
+}
+
+# 引用处带当前指纹（?v=）时的缓存时长
+IMMUTABLE_MAX_AGE = 365 * 86400
+
+# HTML 与 JS 中对本站 .js/.css 的相对引用，如 src="./assets/a.js?v=2"、from"./api.js"
+_RE_REF = re.compile(r'''(["'])((?:\.{1,2}/|/(?!/))[^"'?#\s]+\.(?:js|css))(?:\?v=[^"'#\s]*)?\1''')
+
+class _Entry:
+    def __init__(self, body, deps):
+        self.body = body
+        self.gz = gzip.compress(body, compresslevel=9, mtime=0)
+        self.version = hashlib.sha1(body).hexdigest()[:12]
+        # 强 ETag 按编码区分：gzip 与原文是不同的字节序列
+        self.etag = f'"{self.version}"'
+        self.gz_etag = f'"{self.version}-gz"'
+        self.deps = deps
+
+class StaticCache:
+    """web 目录静态文件的预压缩与指纹缓存
+
+    HTML 与 JS 中对本站脚本、样式的引用在返回时改写为 ``?v=<内容指纹>``（被引用文件
+    变化时指纹随之变化，引用它的文件指纹也变化），带当前指纹的请求可以长期缓存。
+    每个文件只在内容变化（mtime 或依赖变化）后重新改写和压缩一次，gzip 结果常驻内存。
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def _stale(self, path, entry):
+        for dep, mt in entry.deps.items():
+            try:
+                if os.path.getmtime(dep) != mt:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def get(self, path, _seen=None):
+        """返回文件的缓存项（已改写、已压缩）；不在 web 目录下或类型不支持时返回 None"""
+        path = os.path.realpath(path)
+        if not path.startswith(self.root + os.sep) or os.path.splitext(path)[1] not in STATIC_TYPES:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and not self._stale(path, entry):
+                return entry
+            try:
+                mt = os.path.getmtime(path)
+                with open(path, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                self._entries.pop(path, None)
+                return None
+            deps = {path: mt}
+            if path.endswith(('.html', '.js')):
+                seen = (_seen or set()) | {path}
+                body = self._rewrite(path, body, deps, seen)
+            entry = _Entry(body, deps)
+            self._entries[path] = entry
+            return entry
+
+    def _rewrite(self, path, body, deps, seen):
+        base = os.path.dirname(path)
+
+        def repl(m):
+            ref = m.group(2)
+            target = os.path.join(self.root, ref.lstrip('/')) if ref.startswith('/') else os.path.join(base, ref)
+            target = os.path.realpath(target)
+            if target in seen:
+                return m.group(0)
+            dep = self.get(target, seen)
+            if dep is None:
+                return m.group(0)
+            deps.update(dep.deps)
+            return f"{m.group(1)}{ref}?v={dep.version}{m.group(1)}"
+
+        try:
+            text = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return body
+        return _RE_REF.sub(repl, text).encode('utf-8')
+
+    def warm(self):
+        """启动时预先改写并压缩全部静态文件，返回文件数"""
+        n = 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if self.get(os.path.join(dirpath, name)) is not None:
+                    n += 1
+        return n
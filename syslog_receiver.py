@@ -0,0 +1,298 @@
+import re
+import time
+import socket
+import queue
+import asyncio
+import threading
+
+from config import read_config
+from ingest_manager import _match_types, _build_events, _write_events, _handle_alert
+from data_store import dedupe_events
+from log_time import log_time_iso
+
+# RFC5424: <PRI>VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID [SD] MSG
+_RE_5424 = re.compile(
+    r'<(\d{1,3})>(\d{1,2}) (\S+) (\S+) (\S+) (\S+) (\S+) (-|(?:\[.*?\])+) ?(.*)', re.DOTALL
+)
+# RFC3164: <PRI>Mmm dd hh:mm:ss HOSTNAME TAG: MSG
+_RE_3164 = re.compile(
+    r'<(\d{1,3})>([A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}) (\S+) (.*)', re.DOTALL
+)
+_RE_TAG = re.compile(r'([^:\[\s]+)(?:\[\d+\])?:')
+
+# 单条 TCP 帧上限，防止异常客户端撑爆缓冲区
+MAX_FRAME = 64 * 1024
+UDP_RCVBUF = 8 * 1024 * 1024
+
+def parse_syslog_message(data):
+    """解析一条 syslog 报文
+
+    :param data: 已解码的报文文本
+    :return: (hostname, app, timestamp_text, message)；无法识别头部时 hostname/app/timestamp 为 None
+    """
+    m = _RE_5424.match(data)
+    if m:
+        ts = m.group(3)
+        host = m.group(4)
+        app = m.group(5)
+        msg = m.group(9)
+        if msg.startswith('\ufeff'):
+            msg = msg[1:]
+        return (None if host == '-' else host, None if app == '-' else app,
+                None if ts == '-' else ts, msg)
+    m = _RE_3164.match(data)
+    if m:
+        rest = m.group(4)
+        tm = _RE_TAG.match(rest)
+        return m.group(3), (tm.group(1) if tm else None), m.group(2), rest
+    if data.startswith('<'):
+        end = data.find('>')
+        if 0 < end <= 4:
+            data = data[end + 1:]
+    return None, None, None, data
+
+class _SyslogDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self.receiver.submit(data, addr[0])
+
+class _SyslogStreamProtocol(asyncio.Protocol):
+    """TCP syslog：同时支持 octet-counting（RFC6587）与换行分帧"""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.buf = bytearray()
+        self.peer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        self.peer = peer[0] if peer else None
+
+    def data_received(self, data):
+        buf = self.buf
+        buf += data
+        while buf:
+            if buf[0:1].isdigit():
+                sp = buf.find(b' ', 0, 8)
+                if sp < 0:
+                    if len(buf) >= 8:
+                        # 不是合法的长度前缀，按换行分帧处理
+                        if not self._take_line():
+                            break
+                        continue
+                    break
+                try:
+                    n = int(buf[:sp])
+                except ValueError:
+                    n = -1
+                if n < 0 or n > MAX_FRAME:
+                    if not self._take_line():
+                        break
+                    continue
+                if len(buf) < sp + 1 + n:
+                    break
+                self.receiver.submit(bytes(buf[sp + 1:sp + 1 + n]), self.peer)
+                del buf[:sp + 1 + n]
+            else:
+                if not self._take_line():
+                    break
+        if len(buf) > MAX_FRAME:
+            self.receiver.submit(bytes(buf[:MAX_FRAME]), self.peer)
+            del buf[:]
+
+    def _take_line(self):
+        nl = self.buf.find(b'\n')
+        if nl < 0:
+            return False
+        frame = bytes(self.buf[:nl]).rstrip(b'\r')
+        del self.buf[:nl + 1]
+        if frame:
+            self.receiver.submit(frame, self.peer)
+        return True
+
+    def connection_lost(self, exc):
+        if self.buf.strip():
+            self.receiver.submit(bytes(self.buf), self.peer)
+        self.buf = bytearray()
+
+class SyslogReceiver:
+    """内置 syslog 接收器（UDP/TCP），作为无 Agent 的摄取来源
+
+    网络收包在单个 asyncio 事件循环线程中完成，不为每个发送方创建线程；
+    报文按批交给处理线程，统一解析、检测并通过常规事件路径写入。
+    """
+
+    def __init__(self, host='0.0.0.0', udp_port=5514, tcp_port=5514, batch_size=1000,
+                 flush_interval=0.2, queue_max=256):
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches = queue.Queue(maxsize=queue_max)
+        self.pending = []
+        self.loop = None
+        self.udp_sock = None
+        self.tcp_sock = None
+        self.stats = {"received": 0, "dropped": 0, "events": 0, "batches": 0}
+        self._cfg = {}
+        self._cfg_ts = 0
+
+    # ---------- 网络侧（事件循环线程） ----------
+    def submit(self, data, peer):
+        """收到一条原始报文"""
+        self.pending.append((data, peer))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = []
+        self.stats["received"] += len(batch)
+        try:
+            self.batches.put_nowait(batch)
+        except queue.Full:
+            # 处理跟不上时丢弃整批（UDP 语义），避免阻塞收包
+            self.stats["dropped"] += len(batch)
+
+    def _tick(self):
+        self._flush()
+        self.loop.call_later(self.flush_interval, self._tick)
+
+    def _bind(self, kind, port):
+        """同步创建并绑定套接字，端口被占用或地址无效时直接抛出 OSError"""
+        family, _, proto, _, addr = socket.getaddrinfo(self.host, port, type=kind)[0]
+        sock = socket.socket(family, kind, proto)
+        try:
+            if kind == socket.SOCK_STREAM:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            else:
+                # 放大内核接收缓冲区，吸收突发流量
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+                except OSError:
+                    pass
+            sock.bind(addr)
+            if kind == socket.SOCK_STREAM:
+                # start() 返回后即可接受连接，事件循环就绪前到达的连接在队列中等待
+                sock.listen(128)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        if self.udp_sock is not None:
+            await self.loop.create_datagram_endpoint(lambda: _SyslogDatagramProtocol(self), sock=self.udp_sock)
+        if self.tcp_sock is not None:
+            await self.loop.create_server(lambda: _SyslogStreamProtocol(self), sock=self.tcp_sock)
+        self.loop.call_later(self.flush_interval, self._tick)
+        while True:
+            await asyncio.sleep(3600)
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            print(f"❌ Syslog 接收循环异常退出: {e}")
+
+    # ---------- 处理侧（工作线程） ----------
+    def _config(self):
+        now = time.time()
+        if now - self._cfg_ts > 5:
+            try:
+                self._cfg = read_config()
+            except:
+                pass
+            self._cfg_ts = now
+        return self._cfg
+
+    def process_batch(self, batch):
+        """解析并检测一批报文，命中的事件一次性写入"""
+        cfg = self._config()
+        det = cfg.get('detection', {})
+        enabled = det.get('enabled_detectors', [])
+        search_mode = det.get('search_mode', 'mixed')
+        recv_ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        events = []
+        untimed = []
+        for data, peer in batch:
+            try:
+                text = data.decode('utf-8', 'ignore').rstrip('\r\n\x00')
+            except:
+                continue
+            host, app, ts_text, msg = parse_syslog_message(text)
+            types = _match_types(msg, enabled, search_mode)
+            if not types:
+                continue
+            host_id = host or peer or 'unknown'
+            detected_at = log_time_iso(f"syslog://{host_id}", ts_text, None) if ts_text else None
+            source = f"syslog://{app}" if app else "syslog"
+            if detected_at:
+                events.extend(_build_events(msg, types, source, 0, host_id, detected_at, recv_ts))
+            else:
+                # 报文没有可解析的时间：每条报文只收到一次，不存在重扫，相同内容是新的事件，不做去重
+                untimed.extend(_build_events(msg, types, source, 0, host_id, recv_ts, recv_ts))
+        events = dedupe_events(events, recv_ts) + untimed
+        if events:
+            _write_events(events)
+            for ev in events:
+                try:
+                    _handle_alert(ev, cfg)
+                except:
+                    pass
+        self.stats["events"] += len(events)
+        self.stats["batches"] += 1
+        return events
+
+    def _worker(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                print(f"[SYSLOG] 批处理失败: {e}")
+
+    def start(self):
+        """绑定端口并启动接收线程与处理线程
+
+        绑定在调用线程中同步完成，端口被占用等错误直接抛给调用方，不会只在后台线程中丢失。
+        """
+        try:
+            if self.udp_port:
+                self.udp_sock = self._bind(socket.SOCK_DGRAM, self.udp_port)
+            if self.tcp_port:
+                self.tcp_sock = self._bind(socket.SOCK_STREAM, self.tcp_port)
+        except:
+            for sock in (self.udp_sock, self.tcp_sock):
+                if sock is not None:
+                    sock.close()
+            self.udp_sock = self.tcp_sock = None
+            raise
+        if self.udp_sock is not None:
+            print(f"📡 Syslog UDP 接收: {self.host}:{self.udp_sock.getsockname()[1]}")
+        if self.tcp_sock is not None:
+            print(f"📡 Syslog TCP 接收: {self.host}:{self.tcp_sock.getsockname()[1]}")
+        threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._run, daemon=True).start()
+
+def start_syslog_receiver(cfg):
+    """根据配置启动 syslog 接收器，未启用时返回 None"""
+    sc = cfg.get('syslog', {}) or {}
+    if not sc.get('enabled'):
+        return None
+    receiver = SyslogReceiver(
+        host=sc.get('host', '0.0.0.0'),
+        udp_port=int(sc.get('udp_port', 5514) or 0),
+        tcp_port=int(sc.get('tcp_port', 5514) or 0),
+        batch_size=int(sc.get('batch_size', 1000)),
+        flush_interval=float(sc.get('flush_ms', 200)) / 1000.0
+    )
+    receiver.start()
+    return receiver
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import shutil
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 仓库根目录下的平铺模块；app 夹具在临时副本中重新导入它们
+MODULES = {f[:-3] for f in os.listdir(REPO) if f.endswith('.py')}
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+def _purge():
+    for name in MODULES:
+        sys.modules.pop(name, None)
+
+class App:
+    """临时目录中的一份服务端副本：data/ 与 config/ 都在临时目录下，互不影响"""
+
+    def __init__(self, root):
+        self.root = root
+        import config
+        config.ensure_dirs()
+        self.config = config
+        self.data_store = __import__('data_store')
+        self.httpd = None
+
+    def set_storage(self, **kw):
+        cfg = self.config.read_config()
+        cfg.setdefault('storage', {}).update(kw)
+        self.config.write_config(cfg)
+        # 配置按 mtime 缓存，同一秒内改写时强制重读
+        self.data_store._storage_cache["mtime"] = None
+
+    def serve(self):
+        """在后台线程启动 HTTP 服务，返回基地址"""
+        server = __import__('server')
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), server.Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def close(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    root = tmp_path / 'app'
+    root.mkdir()
+    for f in os.listdir(REPO):
+        if f.endswith('.py'):
+            shutil.copy(os.path.join(REPO, f), root / f)
+    shutil.copytree(os.path.join(REPO, 'web'), root / 'web')
+    _purge()
+    monkeypatch.syspath_prepend(str(root))
+    a = App(root)
+    try:
+        yield a
+    finally:
+        a.close()
+        _purge()
+
+def make_event(i, ts, **kw):
+    ev = {"schema_version": "1.0", "id": "%016x" % i, "type": "oom", "severity": "major",
+          "message": f"Out of memory: Killed process {i} (java)", "source_file": "/var/log/messages",
+          "line_number": i, "detected_at": ts, "host_id": "h1", "processed": False}
+    ev.update(kw)
+    return ev
+
+def read_json(resp):
+    return json.loads(resp.read().decode('utf-8'))
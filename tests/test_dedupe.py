@@ -0,0 +1,154 @@
+import os
+
+import pytest
+
+from conftest import make_event
+from dedupe import DedupeFilter, fingerprint
+
+SCAN = "2025-03-01T10:20:30Z"
+MSG = "Out of memory: Killed process 42 (java)"
+
+def ev_(i, ts, **kw):
+    kw.setdefault('message', MSG)
+    return make_event(i, ts, **kw)
+
+def test_timestamp_less_lines_keep_position():
+    # 日志行没有时间，detected_at 回退为扫描时间：不同行的同一消息不是重复
+    a = ev_(1, SCAN, message="disk full", line_number=10)
+    b = ev_(2, SCAN, message="disk full", line_number=20)
+    assert fingerprint(a, SCAN) != fingerprint(b, SCAN)
+    # 同一行在之后重扫：指纹不随扫描时间变化
+    later = "2025-03-01T12:00:00Z"
+    again = ev_(3, later, message="disk full", line_number=10)
+    assert fingerprint(again, later) == fingerprint(a, SCAN)
+
+def test_timestamp_less_without_line_uses_hour_bucket():
+    a = ev_(1, SCAN, line_number=None)
+    same_hour = ev_(2, "2025-03-01T10:59:00Z", line_number=None)
+    next_hour = ev_(3, "2025-03-01T11:00:05Z", line_number=None)
+    assert fingerprint(a, SCAN) == fingerprint(same_hour, same_hour["detected_at"])
+    assert fingerprint(a, SCAN) != fingerprint(next_hour, next_hour["detected_at"])
+
+def test_log_time_ignores_line_number():
+    # 日志自带时间时按时间去重，偏移丢失后行号变化也能识别
+    a = ev_(1, "2025-03-01T09:00:00Z", line_number=10)
+    b = ev_(2, "2025-03-01T09:00:00Z", line_number=99)
+    assert fingerprint(a, SCAN) == fingerprint(b, SCAN)
+
+def test_save_merges_other_process_state(tmp_path):
+    path = str(tmp_path / 'dedupe.bin')
+    fa = [fingerprint(ev_(i, "2025-03-01T09:00:%02dZ" % i), SCAN) for i in range(20)]
+    fb = [fingerprint(ev_(i, "2025-03-02T09:00:%02dZ" % i), SCAN) for i in range(20)]
+    server = DedupeFilter(window=100, capacity=1000)
+    backend = DedupeFilter(window=100, capacity=1000)
+    assert server.load(path) is False
+    for fp in fa:
+        server.add(fp)
+    for fp in fb:
+        backend.add(fp)
+    server.save(path)
+    backend.save(path)
+    assert all(fp in backend for fp in fa)
+    reloaded = DedupeFilter(window=100, capacity=1000)
+    assert reloaded.load(path)
+    assert all(fp in reloaded for fp in fa + fb)
+    assert reloaded.bloom.count == 40
+
+def test_merge_keeps_window(tmp_path):
+    path = str(tmp_path / 'dedupe.bin')
+    a = DedupeFilter(window=5, capacity=1000)
+    b = DedupeFilter(window=5, capacity=1000)
+    fps = [fingerprint(ev_(i, "2025-03-01T09:00:%02dZ" % i), SCAN) for i in range(10)]
+    for fp in fps[:5]:
+        a.add(fp)
+    for fp in fps[5:]:
+        b.add(fp)
+    a.save(path)
+    b.save(path)
+    # 精确集合保留本进程的最近指纹，其余仍由 Bloom 过滤器记忆
+    assert list(b.recent) == fps[5:]
+    assert all(fp in b for fp in fps)
+
+def test_mismatched_params_ignored(tmp_path):
+    path = str(tmp_path / 'dedupe.bin')
+    a = DedupeFilter(window=10, capacity=1000)
+    a.add(fingerprint(ev_(1, SCAN), None))
+    a.save(path)
+    assert DedupeFilter(window=10, capacity=5000).load(path) is False
+
+def test_recorded_only_after_write(app):
+    ds = app.data_store
+    ev = ev_(1, "2025-03-01T09:00:00Z")
+    assert ds.dedupe_events([ev], SCAN) == [ev]
+    # 尚未写入：同一内容的并发提交仍按重复处理
+    assert ds.dedupe_events([ev_(2, "2025-03-01T09:00:00Z", line_number=1)], SCAN) == []
+    ds.append_events([ev])
+    f = ds._get_dedupe_filter()
+    assert fingerprint(ev, SCAN) in f
+    assert not ds._dedupe_pending
+    assert ds.dedupe_events([ev_(3, "2025-03-01T09:00:00Z", line_number=1)], SCAN) == []
+
+def test_failed_write_not_recorded(app):
+    ds = app.data_store
+    ev = ev_(1, "2025-03-01T09:00:00Z")
+    assert ds.dedupe_events([ev], SCAN) == [ev]
+
+    def fail(evs):
+        raise OSError("disk full")
+    append, ds._append = ds._append, fail
+    try:
+        with pytest.raises(OSError):
+            ds.append_events([ev])
+    finally:
+        ds._append = append
+    # 写入失败后重扫：事件不被当作重复
+    retry = ev_(2, "2025-03-01T09:00:00Z", line_number=1)
+    assert ds.dedupe_events([retry], SCAN) == [retry]
+    ds.append_events([retry])
+    assert ds.query_events(None, None, None, None, None)[1] == 1
+
+def test_unwritten_pending_expires(app, monkeypatch):
+    ds = app.data_store
+    ev = ev_(1, "2025-03-01T09:00:00Z")
+    assert ds.dedupe_events([ev], SCAN) == [ev]
+    monkeypatch.setattr(ds, 'DEDUPE_PENDING_TTL', -1)
+    again = ev_(2, "2025-03-01T09:00:00Z", line_number=1)
+    assert ds.dedupe_events([again], SCAN) == [again]
+
+def _scan(im, fp, offsets, scan_ts):
+    im._scan_file(fp, offsets, ['oom'], 'keyword', scan_ts, {})
+    im.flush_events()
+
+def _stored(ds):
+    items = ds.query_events(None, None, None, None, None)[0]
+    return sorted(ev['line_number'] for ev in items)
+
+def test_ingest_line_numbers_absolute(app, tmp_path):
+    import ingest_manager as im
+    fp = str(tmp_path / 'messages')
+    line = "kernel: Out of memory: Killed process 42 (java)\n"
+    with open(fp, 'w') as f:
+        f.write("boot ok\n" + line)
+    offsets = {}
+    _scan(im, fp, offsets, SCAN)
+    # 下一轮追加的同一消息（无日志时间）是新的一行，不被当作重复
+    with open(fp, 'a') as f:
+        f.write(line)
+    _scan(im, fp, offsets, "2025-03-01T10:25:00Z")
+    assert offsets[fp]["lines"] == 3
+    assert _stored(app.data_store) == [2, 3]
+    # 偏移丢失后从头重扫：行号不变，全部识别为重复
+    _scan(im, fp, {}, "2025-03-01T11:00:00Z")
+    assert _stored(app.data_store) == [2, 3]
+
+def test_ingest_legacy_int_offset(app, tmp_path):
+    import ingest_manager as im
+    fp = str(tmp_path / 'messages')
+    head = "boot ok\nkernel: Out of memory: Killed process 1 (java)\n"
+    with open(fp, 'w') as f:
+        f.write(head + "kernel: Out of memory: Killed process 2 (java)\n")
+    # 旧版偏移文件只记录字节偏移
+    offsets = {fp: len(head.encode())}
+    _scan(im, fp, offsets, SCAN)
+    assert offsets[fp] == {"offset": os.path.getsize(fp), "lines": 3}
+    assert _stored(app.data_store) == [3]
@@ -0,0 +1,84 @@
+import time
+import urllib.request
+import urllib.error
+
+from conftest import make_event, read_json
+
+def _get(url, etag=None):
+    req = urllib.request.Request(url, headers={'If-None-Match': etag} if etag else {})
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, resp.headers.get('ETag'), read_json(resp)
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), None
+
+def _now(offset=0):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + offset))
+
+def test_read_endpoints_return_304_until_store_changes(app):
+    import ingest_manager
+    # 尚未扫描时 last_scan 取当前时间，逐秒变化
+    ingest_manager.last_scan_ts = '2026-01-01T00:00:00Z'
+    base = app.serve()
+    app.data_store.append_events([make_event(1, _now(-60))])
+    for path in ('/api/v1/stats', '/api/v1/events?size=5', '/api/v1/hosts'):
+        status, etag, body = _get(base + path)
+        assert status == 200 and etag.startswith('W/"')
+        assert _get(base + path, etag)[0] == 304
+    status, etag, _ = _get(base + '/api/v1/stats')
+    app.data_store.append_events([make_event(2, _now(-30))])
+    status, new_etag, body = _get(base + '/api/v1/stats', etag)
+    assert status == 200 and new_etag != etag
+    assert body['total_anomalies'] == 2
+
+def test_stats_etag_tracks_scan_time(app):
+    import ingest_manager
+    base = app.serve()
+    app.data_store.append_events([make_event(1, _now(-60))])
+    ingest_manager.last_scan_ts = '2026-01-01T00:00:00Z'
+    _, etag, body = _get(base + '/api/v1/stats')
+    assert body['last_scan'] == '2026-01-01T00:00:00Z'
+    assert _get(base + '/api/v1/stats', etag)[0] == 304
+    # 扫描推进但没有新数据：响应体中的 last_scan 变了，不能 304
+    ingest_manager.last_scan_ts = '2026-01-01T00:00:05Z'
+    status, new_etag, body = _get(base + '/api/v1/stats', etag)
+    assert status == 200 and new_etag != etag
+    assert body['last_scan'] == '2026-01-01T00:00:05Z'
+
+def test_generation_tracks_foreign_writes(app):
+    ds = app.data_store
+    gen = ds.store_generation()
+    ds.append_events([make_event(1, _now())])
+    assert ds.store_generation() != gen
+    gen = ds.store_generation()
+    # 其他进程推进代数：直接改写代数文件
+    with open(ds.GENERATION_FILE, 'w', encoding='utf-8') as f:
+        f.write('999999 0')
+    assert ds.store_generation() != gen
+
+def _static(url, gzip=False, etag=None):
+    headers = {}
+    if gzip:
+        headers['Accept-Encoding'] = 'gzip'
+    if etag:
+        headers['If-None-Match'] = etag
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b''
+
+def test_static_etag_per_encoding(app):
+    base = app.serve()
+    status, plain, body = _static(base + '/index.html')
+    assert status == 200 and plain.get('Content-Encoding') is None
+    status, gz, gz_body = _static(base + '/index.html', gzip=True)
+    assert status == 200 and gz['Content-Encoding'] == 'gzip'
+    assert gz['ETag'] == plain['ETag'][:-1] + '-gz"'
+    assert plain['Vary'] == gz['Vary'] == 'Accept-Encoding'
+    # 每种编码只与自己的 ETag 匹配
+    status, headers, _ = _static(base + '/index.html', gzip=True, etag=gz['ETag'])
+    assert status == 304 and headers['ETag'] == gz['ETag'] and headers['Vary'] == 'Accept-Encoding'
+    assert _static(base + '/index.html', etag=plain['ETag'])[0] == 304
+    assert _static(base + '/index.html', etag=gz['ETag'])[0] == 200
+    assert _static(base + '/index.html', gzip=True, etag=plain['ETag'])[0] == 200
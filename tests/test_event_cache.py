@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from conftest import make_event
+from event_cache import ColumnarEventCache
+from event_item import event_key
+from segment_store import SegmentStore
+
+def ts(i):
+    return "2025-03-01T%02d:%02d:%02dZ" % (i // 3600 % 24, i // 60 % 60, i % 60)
+
+@pytest.fixture
+def store(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    return SegmentStore(str(data / 'anomalies'), str(data), str(data / 'index.bin'), str(data / 'meta'),
+                        max_segment_bytes=64 * 1024)
+
+def test_codes_widen_past_uint16(store):
+    n = 70000
+    evs = [make_event(i, ts(i % 86400), host_id='h%d' % i) for i in range(n)]
+    for i in range(0, n, 10000):
+        store.append(evs[i:i + 10000])
+    cache = ColumnarEventCache(store, 1 << 30)
+    res = cache.stats()
+    assert cache.host.dtype == np.uint32
+    assert res["total"] == n and len(res["by_host"]) == n
+    assert cache.stats(host_id='h69999')["total"] == 1
+    events, total = cache.query(host_id='h65537')
+    assert total == 1 and events[0]['id'] == '%016x' % 65537
+
+def _hid(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()[:16]
+
+def _ties(store):
+    # 同一秒内大量事件（含同一行命中多个类型、非规范格式的时间），前后各有其他秒；id 与实际一样取哈希前缀
+    evs = [make_event(i, ts(100 + i // 10), id=_hid(i)) for i in range(50)]
+    evs += [make_event(1000 + i // 2, ts(107), id=_hid(1000 + i // 2), type=('oom', 'panic')[i % 2])
+            for i in range(300)]
+    evs += [make_event(5000 + i, "2025-03-01T00:01:47.500Z", id=_hid(5000 + i)) for i in range(3)]
+    store.append(evs)
+    return evs
+
+@pytest.mark.parametrize('reverse', [True, False])
+def test_keyset_ties_bounded_and_complete(store, reverse):
+    evs = _ties(store)
+    cache = ColumnarEventCache(store, 1 << 30)
+    read = []
+    orig = cache._read
+
+    def counting(locs, raw=False):
+        read.append(len(locs))
+        return orig(locs, raw)
+    cache._read = counting
+    size = 7
+    got = []
+    cursor = None
+    while True:
+        page, more = cache.keyset(cursor=cursor, reverse=reverse, size=size)
+        got += page
+        if not more:
+            break
+        cursor = event_key(page[-1])
+    assert [event_key(ev) for ev in got] == sorted((event_key(ev) for ev in evs), reverse=reverse)
+    # 同一秒内只回读排在前面的若干行（同一 id 的两个类型、非规范格式的 3 行另计），而不是该秒的全部 300 行
+    assert max(read) <= 2 * (size + 2) + 2 + 3
+
+def test_keyset_raw_matches_decoded(store):
+    _ties(store)
+    cache = ColumnarEventCache(store, 1 << 30)
+    page, _ = cache.keyset(size=20)
+    cursor = event_key(page[-1])
+    raw, _ = cache.keyset(cursor=cursor, size=20, raw=True)
+    dec, _ = cache.keyset(cursor=cursor, size=20)
+    assert [k for k, _ in raw] == [event_key(ev) for ev in dec]
+
+def test_budget_counts_memory(store):
+    for d in range(6):
+        store.append([make_event(d * 1000 + i, "2025-03-%02dT00:00:%02dZ" % (d + 1, i % 60))
+                      for i in range(2000)])
+    full = ColumnarEventCache(store, 1 << 30)
+    full.refresh()
+    assert full.uncovered_until is None
+    budget = full.memory_bytes() // 2
+    cache = ColumnarEventCache(store, budget)
+    cache.refresh()
+    assert cache.memory_bytes() <= budget
+    assert cache.uncovered_until is not None
+    assert not cache.covers(None)
+    day = int(cache.uncovered_until[-2:])
+    assert cache.covers("2025-03-%02dT00:00:00Z" % (day + 1))
+    assert not cache.covers("2025-03-%02dT23:59:59Z" % day)
+    # 移出的段不会在每次刷新时重新加载
+    loads = []
+    orig = cache._load
+    cache._load = lambda *a: loads.append(a) or orig(*a)
+    cache.refresh()
+    assert loads == []
+    # 放宽预算后重新覆盖全部段
+    cache.max_bytes = 1 << 30
+    cache.refresh()
+    assert cache.uncovered_until is None
+    assert cache.stats()["total"] == 12000
+
+def test_rewritten_segment_reloaded(store):
+    store.append([make_event(i, ts(i)) for i in range(5)])
+    cache = ColumnarEventCache(store, 1 << 30)
+    assert cache.stats()["total"] == 5
+    # 段被改写为更大的新文件（写临时文件后改名）：大小没有变小，inode 变了
+    (_, path), = store.segments()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for i in range(100, 110):
+            f.write(json.dumps(make_event(i, ts(i), host_id='rewritten')) + "\n")
+    os.replace(tmp, path)
+    res = cache.stats()
+    assert res["total"] == 10 and res["by_host"] == {'rewritten': 10}
+
+def test_last_detection_keeps_original_text(store):
+    store.append([make_event(1, "2025-03-01T10:00:00Z"), make_event(2, "2025-03-01T10:00:00.750Z"),
+                  make_event(3, "2025-03-01T09:59:59.999Z")])
+    cache = ColumnarEventCache(store, 1 << 30)
+    res = cache.stats()
+    assert res["last_detection"] == "2025-03-01T10:00:00.750Z"
+    assert cache.stats(host_id='nobody')["last_detection"] is None
@@ -0,0 +1,120 @@
+import json
+import time
+import random
+import urllib.request
+from collections import Counter
+
+import pytest
+
+from conftest import make_event
+from heavy_hitters import SpaceSaving, HeavyHitters, merge_top, message_template
+
+def _stream(seed, n, universe):
+    # 长尾分布：少数项出现很多次，大量项只出现几次
+    rnd = random.Random(seed)
+    weights = [1.0 / (i + 1) ** 1.1 for i in range(universe)]
+    return rnd.choices(['v%d' % i for i in range(universe)], weights, k=n)
+
+def _check_bounds(s, truth):
+    floor = s.floor()
+    for item, n in truth.items():
+        rec = s.counts.get(item)
+        if rec is None:
+            assert n <= floor
+        else:
+            c, e = rec
+            assert c - e <= n <= c
+    assert s.n == sum(truth.values())
+    assert floor <= s.n / s.capacity
+
+@pytest.mark.parametrize('seed', range(5))
+def test_space_saving_bounds(seed):
+    items = _stream(seed, 20000, 2000)
+    s = SpaceSaving(50)
+    for item in items:
+        s.add(item)
+    truth = Counter(items)
+    _check_bounds(s, truth)
+    # 真实次数超过 n / capacity 的项一定被跟踪
+    assert all(item in s.counts for item, n in truth.items() if n > s.n / s.capacity)
+    assert len(s.counts) == 50
+
+def test_space_saving_exact_below_capacity():
+    s = SpaceSaving(10)
+    for item in 'aabbbcdddd':
+        s.add(item)
+    assert s.floor() == 0
+    assert {k: tuple(v) for k, v in s.counts.items()} == {'a': (2, 0), 'b': (3, 0), 'c': (1, 0), 'd': (4, 0)}
+
+def test_dump_load_roundtrip():
+    items = _stream(7, 5000, 500)
+    s = SpaceSaving(20)
+    for item in items:
+        s.add(item)
+    t = SpaceSaving.load(20, s.dump())
+    assert t.counts == s.counts and t.n == s.n and t.floor() == s.floor()
+    # 恢复后继续计数仍满足误差界
+    more = _stream(8, 5000, 500)
+    for item in more:
+        t.add(item)
+    _check_bounds(t, Counter(items + more))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_merge_top_bounds(seed):
+    parts = [_stream(seed * 10 + i, 4000, 800) for i in range(6)]
+    summaries = []
+    for part in parts:
+        s = SpaceSaving(40)
+        for item in part:
+            s.add(item)
+        summaries.append(s)
+    truth = Counter(x for part in parts for x in part)
+    items, total, floor = merge_top(summaries, 1000)
+    assert total == sum(truth.values())
+    assert floor == sum(s.floor() for s in summaries)
+    listed = set()
+    for item, est, err in items:
+        listed.add(item)
+        assert est - err <= truth[item] <= est
+        assert err <= floor
+    # 未出现在任何摘要中的项真实次数不超过各摘要 floor 之和
+    assert all(n <= floor for item, n in truth.items() if item not in listed)
+    # 前几名与真实排名一致（头部项远高于误差）
+    top, _, _ = merge_top(summaries, 3)
+    assert [v for v, _, _ in top] == [v for v, _ in truth.most_common(3)]
+
+def test_heavy_hitters_window(tmp_path):
+    hh = HeavyHitters(str(tmp_path / 'topk.json'), capacity=8)
+    now = time.time()
+    hour = lambda h: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now - h * 3600))
+    evs = [make_event(i, hour(i % 3), host_id='h%d' % (i % 2)) for i in range(60)]
+    hh.rebuild(evs, 1)
+    res = hh.top('host_id', limit=5)
+    assert res["total"] == 60 and res["max_error"] == 0 and res["complete"]
+    assert {x["value"]: x["count"] for x in res["items"]} == {'h0': 30, 'h1': 30}
+    recent = hh.top('host_id', hour(0)[:13] + ':00:00Z', limit=5)
+    assert recent["total"] == 20
+    tmpl = hh.top('message_template', limit=1)["items"][0]
+    assert tmpl["value"] == message_template(evs[0]['message']) and tmpl["count"] == 60
+    # 写入代数对不上时不登记，等待重建
+    hh.note_events([make_event(100, hour(0))], 5, 6)
+    assert hh.top('host_id')["total"] == 60
+    hh.note_events([make_event(100, hour(0))], 1, 2)
+    assert hh.top('host_id')["total"] == 61
+    hh.save()
+    again = HeavyHitters(str(tmp_path / 'topk.json'), capacity=8)
+    assert again.load() and again.gen == 2
+    assert again.top('host_id') == hh.top('host_id')
+
+def test_stats_top_endpoint(app):
+    now = time.time()
+    ts = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now - 60))
+    app.data_store.append_events([make_event(i, ts, source_file='/var/log/f%d' % (i % 3)) for i in range(30)])
+    base = app.serve()
+    with urllib.request.urlopen(base + '/api/v1/stats/top?dim=source_file&limit=2&window=PT24H') as resp:
+        body = json.loads(resp.read())
+    assert body["total"] == 30 and body["max_error"] == 0
+    assert [x["count"] for x in body["items"]] == [10, 10]
+    # 后续写入随写入路径增量登记
+    app.data_store.append_events([make_event(100, ts, source_file='/var/log/f9')])
+    assert app.data_store.top_values('source_file', 'PT24H', 10)["total"] == 31
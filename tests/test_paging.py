@@ -0,0 +1,117 @@
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+import pytest
+
+from conftest import make_event, read_json
+
+def _iso(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+
+def _events(base, **params):
+    with urllib.request.urlopen(base + '/api/v1/events?' + urlencode(params)) as resp:
+        return read_json(resp)
+
+def _seed(app, n=57):
+    now = time.time() - 3600
+    evs = []
+    for i in range(n):
+        # 同一秒内多条、同一行命中多个类型（id 相同），覆盖游标的完整键
+        ev = make_event(i // 2, _iso(now - (i // 3) * 60), type='oom' if i % 2 else 'panic',
+                        severity='critical' if i % 5 == 0 else 'major')
+        evs.append(ev)
+    app.data_store.append_events(evs)
+    return {(e['id'], e['type']) for e in evs}
+
+@pytest.fixture(params=['ndjson', 'sqlite'])
+def backend_app(app, request):
+    app.set_storage(backend=request.param)
+    return app
+
+def test_keyset_pages_match_page_based(backend_app):
+    expected = _seed(backend_app)
+    base = backend_app.serve()
+    by_page = []
+    page = 1
+    while True:
+        body = _events(base, size=10, page=page, sort='detected_at:desc')
+        by_page += body['items']
+        if not body['has_next']:
+            break
+        page += 1
+    body = _events(base, size=10)
+    by_cursor = body['items']
+    while body['next_cursor']:
+        body = _events(base, size=10, after=body['next_cursor'])
+        by_cursor += body['items']
+    keys = [(e['detected_at'], e['id'], e['type']) for e in by_cursor]
+    assert keys == sorted(keys, reverse=True) and len(set(keys)) == len(keys)
+    assert {(e['id'], e['type']) for e in by_cursor} == expected
+    assert {(e['id'], e['type']) for e in by_page} == expected
+    assert [e['detected_at'] for e in by_page] == [e['detected_at'] for e in by_cursor]
+
+def test_since_delivers_late_events(backend_app):
+    _seed(backend_app, 10)
+    base = backend_app.serve()
+    cursor = _events(base, size=5)['since_cursor']
+    body = _events(base, since=cursor)
+    assert body['items'] == [] and not body['has_next']
+    # 日志时间比已有事件都早一小时的迟到事件
+    late = make_event(1000, _iso(time.time() - 3 * 3600), type='fs_error')
+    backend_app.data_store.append_events([late])
+    body = _events(base, since=body['next_cursor'])
+    assert [e['id'] for e in body['items']] == [late['id']]
+    assert _events(base, since=body['next_cursor'])['items'] == []
+
+def test_since_applies_filters_and_size(backend_app):
+    base = backend_app.serve()
+    cursor = _events(base)['since_cursor']
+    now = time.time()
+    backend_app.data_store.append_events(
+        [make_event(i, _iso(now - i), severity='critical' if i % 2 else 'minor') for i in range(9)])
+    seen = []
+    while True:
+        body = _events(base, since=cursor, size=2, severity='critical')
+        seen += [e['id'] for e in body['items']]
+        cursor = body['next_cursor']
+        if not body['has_next']:
+            break
+    assert seen == ['%016x' % i for i in (1, 3, 5, 7)]
+    assert _events(base, since=cursor, severity='critical')['items'] == []
+
+def test_invalid_since_cursor(backend_app):
+    base = backend_app.serve()
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _events(base, since='not-a-cursor')
+    assert e.value.code == 400
+
+def test_uncoercible_field_filter_rejected(app):
+    base = app.serve()
+    for path in ('/api/v1/events?pid=abc', '/api/v1/events/export?pid=1&pid=x&format=ndjson'):
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(base + path)
+        assert e.value.code == 400
+        assert read_json(e.value)['details'] == {"param": "pid"}
+    app.data_store.append_events([make_event(1, _iso(time.time() - 60), fields={"pid": 42})])
+    assert [ev['id'] for ev in _events(base, pid='42')['items']] == ['%016x' % 1]
+
+def test_export_read_error_truncates_response(app, capsys):
+    import http.client
+    server = __import__('server')
+    evs = [make_event(i, "2025-03-01T09:00:%02dZ" % i) for i in range(3)]
+
+    def failing(*filters):
+        yield from evs
+        raise OSError("segment unreadable")
+    base = app.serve()
+    with urllib.request.urlopen(base + '/api/v1/events/export?format=ndjson') as resp:
+        assert len(resp.read().splitlines()) == 0
+    server.export_events = failing
+    # 响应头已发出后读取出错：不发送结束分块，客户端得到不完整的响应
+    with pytest.raises(http.client.IncompleteRead):
+        with urllib.request.urlopen(base + '/api/v1/events/export?format=ndjson') as resp:
+            resp.read()
+    out = capsys.readouterr().out
+    assert '读取存储失败' in out and '客户端断开' not in out
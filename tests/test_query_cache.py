@@ -0,0 +1,155 @@
+import time
+import threading
+
+import pytest
+
+from conftest import make_event
+from query_cache import QueryCache
+
+def _gate():
+    """阻塞在 compute 中直到放行，记录调用次数"""
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(threading.get_ident())
+        release.wait(5)
+        return {"n": len(calls)}
+    return compute, calls, release
+
+def _run(n, fn):
+    out = [None] * n
+    errors = []
+
+    def worker(i):
+        try:
+            out[i] = fn()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, out, errors
+
+def _wait_for(cond):
+    deadline = time.time() + 5
+    while not cond():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+def test_concurrent_misses_compute_once():
+    cache = QueryCache()
+    compute, calls, release = _gate()
+    threads, out, errors = _run(8, lambda: cache.get('k', 1, compute))
+    _wait_for(lambda: cache.stats()["coalesced"] == 7)
+    assert len(calls) == 1
+    release.set()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert all(v is out[0] for v in out) and out[0] == {"n": 1}
+    s = cache.stats()
+    assert (s["misses"], s["coalesced"], s["hits"]) == (1, 7, 0)
+    assert cache.get('k', 1, compute) is out[0]
+    assert len(calls) == 1
+
+def test_new_generation_not_coalesced_with_old():
+    cache = QueryCache()
+    compute, calls, release = _gate()
+    old = threading.Thread(target=lambda: cache.get('k', 1, compute))
+    old.start()
+    _wait_for(lambda: len(calls) == 1)
+    # 写入后到达的请求不等待旧代数的计算
+    threads, out, _ = _run(1, lambda: cache.get('k', 2, compute))
+    _wait_for(lambda: len(calls) == 2)
+    release.set()
+    old.join()
+    threads[0].join()
+    assert cache.stats()["coalesced"] == 0
+
+def test_generation_and_valid():
+    cache = QueryCache()
+    n = []
+    compute = lambda: n.append(1) or len(n)
+    assert cache.get('k', 1, compute) == 1
+    assert cache.get('k', 2, compute) == 2
+    # valid(旧代数) 为真时沿用旧结果，并记为当前代数
+    assert cache.get('k', 3, compute, valid=lambda gen: gen == 2) == 2
+    assert cache.get('k', 3, compute) == 2
+    assert len(n) == 2
+
+def test_leader_error_followers_recompute():
+    cache = QueryCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append('leader')
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    def ok():
+        calls.append('follower')
+        return 42
+    leader, _, lead_errors = _run(1, lambda: cache.get('k', 1, failing))
+    started.wait(5)
+    threads, out, errors = _run(3, lambda: cache.get('k', 1, ok))
+    _wait_for(lambda: cache.stats()["coalesced"] == 3)
+    release.set()
+    for t in leader + threads:
+        t.join()
+    assert isinstance(lead_errors[0], RuntimeError)
+    assert out == [42, 42, 42] and not errors
+    assert calls.count('follower') == 3
+
+def test_budget_and_entry_limit():
+    cache = QueryCache(max_bytes=4000, max_entries=3)
+    for i in range(5):
+        cache.get(i, 1, lambda: {"i": i})
+    s = cache.stats()
+    assert s["entries"] == 3 and s["evictions"] == 2
+    n = []
+    cache.get(4, 1, lambda: n.append(1))
+    cache.get(0, 1, lambda: n.append(1))
+    assert n == [1]  # 最久未用的已淘汰，最近的仍命中
+    # 超过预算四分之一的结果不缓存
+    big = "x" * 2000
+    cache.get('big', 1, lambda: big)
+    assert cache.get('big', 1, lambda: 'recomputed') == 'recomputed'
+    assert cache.stats()["bytes"] <= 4000
+
+@pytest.mark.parametrize('backend', ['ndjson', 'sqlite'])
+def test_cached_query_invalidated_by_append(app, backend):
+    app.set_storage(backend=backend)
+    ds = app.data_store
+    ds.append_events([make_event(1, "2025-03-01T09:00:00Z")])
+    n = []
+
+    def count():
+        n.append(1)
+        return ds.query_events(None, None, None, None, None)[1]
+    assert ds.cached_query(('t',), count) == 1
+    assert ds.cached_query(('t',), count) == 1
+    ds.append_events([make_event(2, "2025-03-01T09:00:01Z")])
+    assert ds.cached_query(('t',), count) == 2
+    assert len(n) == 2
+
+def test_cached_query_with_end_survives_later_writes(app):
+    ds = app.data_store
+    ds.append_events([make_event(1, "2025-03-01T09:00:00Z")])
+    end = "2025-03-01T09:30:00Z"
+    n = []
+
+    def count():
+        n.append(1)
+        return ds.query_events(None, end, None, None, None)[1]
+    assert ds.cached_query(('h',), count, end) == 1
+    # 之后写入的事件都晚于 end：历史查询的结果仍然有效
+    ds.append_events([make_event(2, "2025-03-01T10:00:00Z")])
+    assert ds.cached_query(('h',), count, end) == 1
+    assert len(n) == 1
+    ds.append_events([make_event(3, "2025-03-01T09:10:00Z")])
+    assert ds.cached_query(('h',), count, end) == 2
+    assert len(n) == 2
@@ -0,0 +1,82 @@
+import json
+import time
+import urllib.request
+
+import pytest
+
+from conftest import make_event, read_json
+from response_utils import RawJSON, encode_json
+from event_item import encode_event, event_item, event_key, item_prefix_len, raw_item
+
+MESSAGES = [
+    'Out of memory: Killed process 1 (java)',
+    'quote " and backslash \\ and tab \t',
+    '中文消息 ✓   separator',
+    'looks like "detected_at": "2020-01-01T00:00:00Z", "host_id": "x"',
+    '\x00raw\x00',
+]
+
+def _events():
+    evs = []
+    for i, msg in enumerate(MESSAGES):
+        evs.append(make_event(i, "2025-03-01T09:00:%02dZ" % i, message=msg, fields={"pid": i, "comm": "j\"ava"}))
+    evs.append(make_event(90, None, message=None, source_file=None, line_number=None, host_id=None))
+    evs.append(make_event(91, "2025-03-01T09:01:00Z", type='a"b', id='q"\\id'))
+    return evs
+
+@pytest.mark.parametrize('ev', _events())
+def test_raw_item_matches_json_dumps(ev):
+    text, n = encode_event(ev)
+    line = text.encode('utf-8')
+    assert json.loads(line) == dict(ev, fields=ev.get('fields') or {})
+    assert item_prefix_len(line, json.loads(line)) == n
+    key, item = raw_item(line + b'\n', n)
+    assert key == event_key(ev)
+    assert bytes(item) == json.dumps(event_item(ev)).encode('utf-8')
+
+def test_legacy_layout_not_spliced():
+    ev = make_event(1, "2025-03-01T09:00:00Z")
+    # 早期版本写入：字段顺序不同
+    line = json.dumps(ev).encode('utf-8')
+    assert item_prefix_len(line, json.loads(line)) == -1
+
+def _with_raw(obj):
+    """把对象中的每个列表项替换为等价的 RawJSON"""
+    return {k: [RawJSON(json.dumps(x).encode('utf-8')) for x in v] if k == 'items' else v for k, v in obj.items()}
+
+@pytest.mark.parametrize('obj', [
+    {"items": [event_item(ev) for ev in _events()], "total": 7, "page": 1, "next_cursor": None},
+    {"items": [], "total": 0},
+    {"items": [{"a": 1}], "note": "\x00raw\x00"},  # 数据本身含占位字符串：走逐层拼接
+    {"items": [["x", {"y": [1, 2.5, None, True]}]], "nested": {"k": ["\x00raw\x00", 3]}},
+])
+def test_encode_json_equivalent_to_dumps(obj):
+    expected = json.dumps(obj).encode('utf-8')
+    assert encode_json(obj) == expected
+    assert encode_json(_with_raw(obj)) == expected
+
+def test_top_level_raw():
+    assert encode_json(RawJSON(b'{"a": 1}')) == b'{"a": 1}'
+    assert encode_json([RawJSON(b'1'), "\x00raw\x00", RawJSON(b'null')]) == json.dumps([1, "\x00raw\x00", None]).encode()
+
+@pytest.mark.parametrize('backend', ['ndjson', 'sqlite'])
+def test_listing_equals_decoded_events(app, backend):
+    app.set_storage(backend=backend)
+    now = time.time() - 600
+    evs = [make_event(i, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now + i)), message=MESSAGES[i % len(MESSAGES)])
+           for i in range(25)]
+    app.data_store.append_events(evs)
+    base = app.serve()
+    expected = sorted((event_item(ev) for ev in evs), key=lambda x: (x['detected_at'], x['id'], x['type']), reverse=True)
+    got = []
+    url = base + '/api/v1/events?size=10'
+    while True:
+        with urllib.request.urlopen(url) as resp:
+            body = read_json(resp)
+        got += body['items']
+        if not body['next_cursor']:
+            break
+        url = base + '/api/v1/events?size=10&after=' + body['next_cursor']
+    assert got == expected
+    with urllib.request.urlopen(base + '/api/v1/events?size=10&page=2') as resp:
+        assert read_json(resp)['items'] == expected[10:20]
@@ -0,0 +1,51 @@
+import os
+import json
+import importlib.util
+
+from conftest import REPO
+
+def _result_manager(app, tmp_path):
+    # backend 按仓库根目录的平铺模块导入 data_store 等，app 夹具已把临时副本放在 sys.path 最前
+    spec = importlib.util.spec_from_file_location('date_generator', os.path.join(REPO, 'backend', 'date_generator.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    rm = mod.ResultManager()
+    rm.summary_file = str(tmp_path / 'summary.json')
+    return rm
+
+def _result(line, ts, typ='oom'):
+    return {"type": typ, "severity": "high", "file": "/var/log/messages", "line_number": line,
+            "message": f"{ts} web1 kernel: Out of memory: Killed process {line} (java)"}
+
+def test_duplicates_not_printed_or_counted(app, tmp_path, capsys):
+    rm = _result_manager(app, tmp_path)
+    first = [_result(1, "2025-03-01T10:00:00Z"), _result(2, "2025-03-01T10:00:05Z", 'panic')]
+    for r in first:
+        rm.add_result(r)
+    # 重扫同一日志：结果被去重丢弃
+    for r in first:
+        rm.add_result(dict(r))
+    rm.flush()
+    out = capsys.readouterr().out
+    assert out.count('[OOM]') == 1 and out.count('[PANIC]') == 1
+    assert rm.get_statistics(['oom', 'panic']) == {'oom': 1, 'panic': 1}
+    assert len(rm.results) == 2
+    with open(rm.summary_file, encoding='utf-8') as f:
+        s = json.load(f)
+    assert s['total_anomalies'] == 2
+    assert app.data_store.query_events(None, None, None, None, None)[1] == 2
+
+def test_last_detection_is_latest_log_time(app, tmp_path):
+    rm = _result_manager(app, tmp_path)
+    # 日志自带时间与扫描顺序不一致
+    for line, ts in ((1, "2025-03-01T10:00:09Z"), (2, "2025-03-01T10:00:01Z"), (3, "2025-03-01T10:00:05Z")):
+        rm.add_result(_result(line, ts))
+    rm.flush()
+    with open(rm.summary_file, encoding='utf-8') as f:
+        assert json.load(f)['last_detection'] == "2025-03-01T10:00:09Z"
+    # 之后合并的一批更早：摘要中的最新时间不倒退
+    rm.add_result(_result(4, "2025-03-01T09:00:00Z"))
+    rm.flush()
+    with open(rm.summary_file, encoding='utf-8') as f:
+        s = json.load(f)
+    assert s['last_detection'] == "2025-03-01T10:00:09Z" and s['total_anomalies'] == 4
@@ -0,0 +1,174 @@
+import os
+import json
+import gzip
+import calendar
+
+import pytest
+
+from conftest import make_event
+import cold_tier
+from segment_store import SegmentStore, iter_file
+
+def ts(day, i=0):
+    return "2025-03-%02dT%02d:%02d:%02dZ" % (day, i // 3600 % 24, i // 60 % 60, i % 60)
+
+@pytest.fixture
+def store(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    return SegmentStore(str(data / 'anomalies'), str(data), str(data / 'index.bin'), str(data / 'meta'),
+                        max_segment_bytes=4096)
+
+def all_events(store):
+    return sorted(((ev['id'], ev['type']) for ev in store.iter_events()))
+
+def day_start(day):
+    return calendar.timegm((2025, 3, day, 0, 0, 0))
+
+# ---------- 迁移 ----------
+def test_migrate_legacy_keeps_every_type_of_a_line(store, tmp_path):
+    legacy = tmp_path / 'anomalies.ndjson'
+    rows = [make_event(1, ts(1, 10)), make_event(1, ts(1, 10), type='panic', severity='critical'),
+            make_event(2, ts(2, 20)), make_event(1, ts(1, 10))]
+    legacy.write_text("".join(json.dumps(ev) + "\n" for ev in rows), encoding='utf-8')
+    assert store.migrate_legacy(str(legacy)) == 3
+    assert all_events(store) == [('%016x' % 1, 'oom'), ('%016x' % 1, 'panic'), ('%016x' % 2, 'oom')]
+    # 再次迁移：已有的 (id, type) 不重复导入
+    assert store.migrate_legacy(str(legacy)) == 0
+    assert store.count() == 3
+
+# ---------- 保留 ----------
+def test_retention_drops_whole_segments_and_compacts_boundary(store):
+    evs = [make_event(d * 1000 + i, ts(d, i * 60)) for d in (1, 2, 3) for i in range(30)]
+    for i in range(0, len(evs), 10):
+        store.append(evs[i:i + 10])
+    assert len(store.segments()) > 3  # 段大小上限使每天滚动成多个段
+    before, after = store.apply_retention(day_start(2), 45)
+    assert (before, after) == (90, 45)
+    assert store.count() == 45
+    left = sorted(ev['detected_at'] for ev in store.iter_events())
+    # 过期的第 1 天整段删除，保留第 2、3 天中最新的 45 条
+    assert left == sorted(ev['detected_at'] for ev in evs)[-45:]
+    # 被删除与被压缩段中的 ID 不再能按 ID 读取，保留的仍可读取
+    assert store.get('%016x' % 1000) is None
+    assert store.get(evs[-1]['id'])['detected_at'] == evs[-1]['detected_at']
+    assert store.get(evs[45]['id'])['detected_at'] == evs[45]['detected_at']
+
+def test_retention_append_after_compaction(store):
+    store.append([make_event(i, ts(1, i)) for i in range(40)])
+    store.apply_retention(day_start(1), 10)
+    store.append([make_event(100 + i, ts(1, 100 + i)) for i in range(5)])
+    assert store.count() == 15
+    assert len(list(store.iter_events())) == 15
+
+# ---------- 日分区 ----------
+def test_events_routed_to_day_partitions(store):
+    store.append([make_event(1, ts(3, 5)), make_event(2, ts(1, 5)), make_event(3, ts(2, 5)),
+                  make_event(4, ts(1, 7200))])
+    assert [day for day, _ in store.segments()] == ['2025-03-01', '2025-03-02', '2025-03-03']
+    assert [day for day, _ in store.segments(ts(2), ts(2, 86399))] == ['2025-03-02']
+    assert [day for day, _ in store.segments(ts(2, 3600))] == ['2025-03-02', '2025-03-03']
+    for day, path in store.segments():
+        assert all(ev['detected_at'][:10] == day for ev in iter_file(path))
+    assert sorted(ev['id'] for ev in store.iter_events(ts(1), ts(1, 86399))) == ['%016x' % 2, '%016x' % 4]
+
+def test_retention_by_age_removes_day_files(store):
+    for d in (1, 2, 3):
+        store.append([make_event(d * 10 + i, ts(d, i)) for i in range(5)])
+    old = [p for day, p in store.segments() if day < '2025-03-03']
+    assert store.apply_retention(day_start(3), 0) == (15, 5)
+    assert not any(os.path.exists(p) for p in old)
+    assert [day for day, _ in store.segments()] == ['2025-03-03']
+
+# ---------- 小时汇总 ----------
+def brute_stats(evs, start=None):
+    res = {"total": 0, "by_severity": {}, "by_type": {}, "by_host": {}, "last_detection": None, "trend": {}}
+    for ev in evs:
+        if start and ev['detected_at'][:13] < start[:13]:
+            continue
+        res["total"] += 1
+        for key, field in (("by_severity", 'severity'), ("by_type", 'type'), ("by_host", 'host_id')):
+            res[key][ev[field]] = res[key].get(ev[field], 0) + 1
+        hour = ev['detected_at'][:13]
+        res["trend"][hour] = res["trend"].get(hour, 0) + 1
+        res["last_detection"] = max(res["last_detection"] or '', ev['detected_at'])
+    return res
+
+def sample(n, day=1):
+    types = ('oom', 'panic', 'disk')
+    return [make_event(day * 1000 + i, ts(day, i * 97), type=types[i % 3], host_id='h%d' % (i % 4),
+                       severity=('critical', 'major')[i % 2]) for i in range(n)]
+
+def test_rollups_match_events(store):
+    evs = sample(200) + sample(50, day=2)
+    for i in range(0, len(evs), 25):
+        store.append(evs[i:i + 25])
+    assert store.rollup_stats() == brute_stats(evs)
+    start = ts(1, 3 * 3600 + 1800)
+    assert store.rollup_stats(start) == brute_stats(evs, start)
+    one = store.rollup_stats(host_id='h1')
+    assert one["total"] == sum(1 for ev in evs if ev['host_id'] == 'h1')
+    hosts = store.host_rollups()
+    assert {h: r["total"] for h, r in hosts.items()} == brute_stats(evs)["by_host"]
+
+def test_rollups_follow_other_process_and_compaction(store, tmp_path):
+    evs = sample(100)
+    store.append(evs[:50])
+    assert store.rollup_stats()["total"] == 50
+    # 另一个进程追加：按字节水位只补算新增部分
+    data = tmp_path / 'data'
+    other = SegmentStore(str(data / 'anomalies'), str(data), str(data / 'index.bin'), str(data / 'meta'),
+                         max_segment_bytes=4096)
+    other.append(evs[50:])
+    assert store.rollup_stats() == brute_stats(evs)
+    store.apply_retention(day_start(1), 30)
+    kept = sorted(evs, key=lambda ev: ev['detected_at'])[-30:]
+    assert store.rollup_stats() == brute_stats(kept)
+
+# ---------- 冷段 ----------
+def line_offsets(data):
+    out = []
+    off = 0
+    for line in data.split(b'\n')[:-1]:
+        out.append((off, len(line)))
+        off += len(line) + 1
+    return out
+
+def test_read_range_across_gzip_members(tmp_path, monkeypatch):
+    monkeypatch.setattr(cold_tier, 'BLOCK_BYTES', 1000)
+    src = tmp_path / '2025-03-01.ndjson'
+    data = "".join(json.dumps(make_event(i, ts(1, i))) + "\n" for i in range(60)).encode('utf-8')
+    src.write_bytes(data)
+    dst = str(src) + cold_tier.COLD_SUFFIX
+    hdr = cold_tier.compress(str(src), dst, {"events": 60, "bytes": len(data), "hours": {}})
+    assert len(hdr['blocks']) > 3
+    assert gzip.decompress(open(dst, 'rb').read()) == data
+    locs = line_offsets(data)
+    for off, length in locs:
+        assert cold_tier.read_range(dst, off, length) == data[off:off + length]
+    # 跨成员块边界的范围
+    b = hdr['blocks'][1][0]
+    assert cold_tier.read_range(dst, b - 10, 20) == data[b - 10:b + 10]
+    assert list(cold_tier.read_ranges(dst, locs)) == [data[o:o + n] for o, n in locs]
+
+def test_compress_cold_keeps_reads_and_rollups(store, monkeypatch):
+    monkeypatch.setattr(cold_tier, 'BLOCK_BYTES', 1000)
+    evs = sample(60) + sample(20, day=2) + sample(10, day=3)
+    for i in range(0, len(evs), 10):
+        store.append(evs[i:i + 10])
+    before = sorted(json.dumps(ev, sort_keys=True) for ev in store.iter_events())
+    stats = store.rollup_stats()
+    done = store.compress_cold('2025-03-03')
+    assert done and all(gz < raw for _, raw, gz in done)
+    assert [cold_tier.is_cold(p) for day, p in store.segments()] == [day < '2025-03-03' for day, p in store.segments()]
+    assert sorted(json.dumps(ev, sort_keys=True) for ev in store.iter_events()) == before
+    assert store.rollup_stats() == stats
+    assert store.count() == 90
+    for ev in evs:
+        assert store.get(ev['id']) == dict(ev, fields={})
+    # 时间范围外的冷段按头信息跳过
+    assert {ev['detected_at'][:10] for ev in store.iter_events(ts(3), None)} == {'2025-03-03'}
+    # 冷段之后仍可保留清理
+    store.apply_retention(day_start(1), 50)
+    assert store.count() == 50
+    assert store.rollup_stats() == brute_stats(sorted(evs, key=lambda ev: ev['detected_at'])[-50:])
@@ -0,0 +1,60 @@
+import time
+import socket
+
+import pytest
+
+def _free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def test_bind_error_raised_from_start(app):
+    from syslog_receiver import SyslogReceiver
+    busy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    busy.bind(('127.0.0.1', 0))
+    busy.listen(1)
+    try:
+        port = busy.getsockname()[1]
+        receiver = SyslogReceiver(host='127.0.0.1', udp_port=_free_port(), tcp_port=port)
+        with pytest.raises(OSError):
+            receiver.start()
+        # 已绑定的 UDP 套接字随之关闭
+        assert receiver.udp_sock is None and receiver.tcp_sock is None
+    finally:
+        busy.close()
+
+def test_receives_after_start(app):
+    from syslog_receiver import SyslogReceiver
+    port = _free_port()
+    receiver = SyslogReceiver(host='127.0.0.1', udp_port=port, tcp_port=port, flush_interval=0.05)
+    receiver.start()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tcp = socket.create_connection(('127.0.0.1', port))
+    try:
+        udp.sendto(b'<11>Mar  1 10:00:00 web1 kernel: hello over udp', ('127.0.0.1', port))
+        tcp.sendall(b'<11>Mar  1 10:00:01 web1 kernel: hello over tcp\n')
+        deadline = time.time() + 5
+        while receiver.stats["batches"] < 1 or receiver.stats["received"] < 2:
+            assert time.time() < deadline
+            time.sleep(0.05)
+    finally:
+        udp.close()
+        tcp.close()
+    assert receiver.stats["received"] == 2
+
+def test_timestamp_less_repeats_not_deduped(app):
+    from syslog_receiver import SyslogReceiver
+    from data_store import flush_events
+    receiver = SyslogReceiver(host='127.0.0.1', udp_port=0, tcp_port=0)
+    msg = b'<11>kernel: Out of memory: Killed process 42 (java)'
+    # 没有时间的同一报文先后到达两次：各自是一次新的事件
+    assert len(receiver.process_batch([(msg, '10.0.0.1')])) == 1
+    assert len(receiver.process_batch([(msg, '10.0.0.1')])) == 1
+    # 带时间的重复报文（如客户端重传）仍去重
+    timed = b'<11>Mar  1 10:00:00 web1 kernel: Out of memory: Killed process 42 (java)'
+    assert len(receiver.process_batch([(timed, '10.0.0.1')])) == 1
+    assert receiver.process_batch([(timed, '10.0.0.1')]) == []
+    flush_events()
+    assert app.data_store.query_events(None, None, None, None, None)[1] == 3
@@ -0,0 +1,368 @@
+import os
+import re
+import json
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+
+import cold_tier
+
+# 词元：连续的 \w 字符（字母、数字、下划线，中文连写视为一个词元）
+_RE_TOKEN = re.compile(r'\w+')
+
+# 已加载倒排表的默认内存预算
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# 候选行超过段内行数的这个比例时，顺序读整段比逐行定位更快
+SCAN_RATIO = 0.5
+
+# 追加部分的词元数超过该值时并入词表，避免逐个比较
+FOLD_TERMS = 20000
+
+def fragments(keyword):
+    """关键字拆成词元片段 [(片段, 左侧是词边界, 右侧是词边界)]
+
+    关键字是原文的子串，每个片段必定落在原文的某个词元内：两侧在关键字内紧邻非词字符的
+    片段与词元完全相同；位于关键字开头的片段可以是词元的后缀，位于结尾的可以是前缀，
+    两端都不受限的只能按子串匹配。
+    """
+    if not keyword:
+        return []
+    return [(m.group(), m.start() > 0, m.end() < len(keyword)) for m in _RE_TOKEN.finditer(keyword)]
+
+def _event_terms(ev):
+    terms = set(_RE_TOKEN.findall(ev.get('message') or ''))
+    terms.update(_RE_TOKEN.findall(ev.get('source_file') or ''))
+    return terms
+
+class _Postings:
+    """单个段的倒排表：词元 → 行号；行号对应事件行的 (原始偏移, 长度)
+
+    已合并部分保存为词表字节串 ``\\n词元\\n词元\\n`` 加各词元在倒排数组中的区间，
+    片段查找直接在词表上做子串搜索；之后追加的行先记在 delta 字典中，保存时合并。
+    """
+
+    def __init__(self, ino=None):
+        self.ino = ino
+        self.watermark = 0
+        self.offs = array('Q')
+        self.lens = array('I')
+        self.vocab = b'\n'
+        self.starts = array('I')
+        self.p_off = array('I')
+        self.p_cnt = array('I')
+        self.post = array('I')
+        self.delta = {}
+        self.dirty = False
+
+    def nbytes(self):
+        arrays = (self.offs, self.lens, self.starts, self.p_off, self.p_cnt, self.post)
+        return (len(self.vocab) + sum(len(a) * a.itemsize for a in arrays)
+                + sum(len(t) + 64 + len(r) * 4 for t, r in self.delta.items()))
+
+    def add(self, off, length, ev):
+        row = len(self.offs)
+        self.offs.append(off)
+        self.lens.append(length)
+        for t in _event_terms(ev):
+            rows = self.delta.get(t)
+            if rows is None:
+                rows = self.delta[t] = array('I')
+            rows.append(row)
+        self.watermark = off + length
+        self.dirty = True
+
+    def terms(self):
+        """全部词元 → 行号数组（合并 delta）"""
+        out = {}
+        if len(self.vocab) > 1:
+            for k, t in enumerate(self.vocab[1:-1].decode('utf-8').split('\n')):
+                a = self.p_off[k]
+                out[t] = self.post[a:a + self.p_cnt[k]]
+        for t, rows in self.delta.items():
+            out[t] = out[t] + rows if t in out else rows
+        return out
+
+    def fold(self):
+        """把 delta 并入词表与倒排数组"""
+        if not self.delta:
+            return
+        terms = self.terms()
+        vocab = [b'\n']
+        starts = array('I')
+        p_off = array('I')
+        p_cnt = array('I')
+        post = array('I')
+        pos = 1
+        for t in sorted(terms):
+            raw = t.encode('utf-8')
+            starts.append(pos)
+            vocab.append(raw + b'\n')
+            pos += len(raw) + 1
+            p_off.append(len(post))
+            p_cnt.append(len(terms[t]))
+            post.extend(terms[t])
+        self.vocab = b''.join(vocab)
+        self.starts, self.p_off, self.p_cnt, self.post = starts, p_off, p_cnt, post
+        self.delta = {}
+
+    def _rows(self, frag, left, right):
+        """包含片段的全部词元的行号并集"""
+        out = set()
+        pat = (b'\n' if left else b'') + frag.encode('utf-8') + (b'\n' if right else b'')
+        vocab = self.vocab
+        starts = self.starts
+        skip = 1 if left else 0
+        i = vocab.find(pat)
+        while i >= 0:
+            k = bisect.bisect_right(starts, i + skip) - 1
+            a = self.p_off[k]
+            out.update(self.post[a:a + self.p_cnt[k]])
+            if k + 1 >= len(starts):
+                break
+            # 同一词元只取一次，从下一个词元前的分隔符继续
+            i = vocab.find(pat, starts[k + 1] - 1)
+        if self.delta:
+            if left and right:
+                out.update(self.delta.get(frag, ()))
+            else:
+                for t, rows in self.delta.items():
+                    if (t.startswith(frag) if left else t.endswith(frag) if right else frag in t):
+                        out.update(rows)
+        return out
+
+    def candidates(self, frags):
+        """所有片段都命中的行号集合（长片段更有选择性，先求）"""
+        rows = None
+        for frag, left, right in sorted(frags, key=lambda f: -len(f[0])):
+            hit = self._rows(frag, left, right)
+            rows = hit if rows is None else rows & hit
+            if not rows:
+                break
+        return rows or set()
+
+    def dump(self, f):
+        head = {"ino": self.ino, "watermark": self.watermark, "rows": len(self.offs),
+                "terms": len(self.starts), "vocab": len(self.vocab), "post": len(self.post)}
+        f.write(json.dumps(head).encode('utf-8') + b"\n")
+        for part in (self.offs, self.lens):
+            f.write(part.tobytes())
+        f.write(self.vocab)
+        for part in (self.starts, self.p_off, self.p_cnt, self.post):
+            f.write(part.tobytes())
+
+    @classmethod
+    def load(cls, f):
+        head = json.loads(f.readline())
+        p = cls(head.get('ino'))
+        p.watermark = int(head['watermark'])
+
+        def take(arr, n):
+            raw = f.read(n * arr.itemsize)
+            if len(raw) != n * arr.itemsize:
+                raise ValueError('truncated')
+            arr.frombytes(raw)
+            return arr
+
+        take(p.offs, head['rows'])
+        take(p.lens, head['rows'])
+        p.vocab = f.read(head['vocab'])
+        if len(p.vocab) != head['vocab']:
+            raise ValueError('truncated')
+        for arr in (p.starts, p.p_off, p.p_cnt):
+            take(arr, head['terms'])
+        take(p.post, head['post'])
+        return p
+
+class TokenIndex:
+    """按段维护的关键字倒排索引：``message`` 与 ``source_file`` 的词元 → 行位置
+
+    每段一个索引文件（索引目录下的 ``段文件名.tok``），记录已索引的字节水位与段文件 inode：
+    追加时同步登记，其他进程追加的部分在查询时按水位补扫，段被删除、压缩改写或替换
+    （inode 变化）时丢弃重建。偏移均为原始字节偏移，热段转为冷段后沿用。
+    关键字查询只给出候选行，调用方仍需按子串逐条校验。
+    """
+
+    def __init__(self, index_dir, data_dir, max_bytes=None):
+        """
+        :param index_dir: 索引文件目录
+        :param data_dir: 段名相对的 data 目录
+        :param max_bytes: 常驻内存的倒排表总大小上限，超出时最久未用的段写回文件后卸载
+        """
+        self.index_dir = index_dir
+        self.data_dir = data_dir
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self._lock = threading.RLock()
+        self._segs = OrderedDict()
+
+    def _seg_path(self, rel):
+        return os.path.join(self.data_dir, rel)
+
+    def _file(self, rel):
+        return os.path.join(self.index_dir, os.path.basename(rel) + '.tok')
+
+    @staticmethod
+    def _ino(path):
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    def _load(self, rel):
+        try:
+            with open(self._file(rel), 'rb') as f:
+                return _Postings.load(f)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write(self, rel, p):
+        p.fold()
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = self._file(rel)
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                p.dump(f)
+            os.replace(tmp, path)
+            p.dirty = False
+        except OSError as e:
+            print(f"[TOKENS] 保存倒排索引失败 {os.path.basename(rel)}: {e}")
+
+    def _scan(self, path, p):
+        """从水位开始为段中的完整行建立倒排"""
+        try:
+            with cold_tier.open_raw(path) as f:
+                f.seek(p.watermark)
+                off = p.watermark
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    if raw.strip():
+                        try:
+                            ev = json.loads(raw)
+                        except ValueError:
+                            ev = None
+                        if isinstance(ev, dict):
+                            p.add(off, len(raw), ev)
+                    off += len(raw)
+                if off != p.watermark:
+                    p.watermark = off
+                    p.dirty = True
+        except (OSError, EOFError):
+            pass
+
+    def _get(self, rel):
+        """与段文件一致的倒排表：必要时从文件加载、补扫新增部分或整段重建"""
+        path = self._seg_path(rel)
+        ino = self._ino(path)
+        if ino is None:
+            self._segs.pop(rel, None)
+            return None
+        p = self._segs.get(rel)
+        if p is None:
+            p = self._load(rel)
+        size = cold_tier.raw_size(path)
+        if p is None or p.ino != ino or (size is not None and size < p.watermark):
+            p = _Postings(ino)
+            p.dirty = True
+        if size is None or size > p.watermark:
+            self._scan(path, p)
+        self._segs[rel] = p
+        self._segs.move_to_end(rel)
+        self._evict()
+        return p
+
+    def _evict(self):
+        total = sum(p.nbytes() for p in self._segs.values())
+        while total > self.max_bytes and len(self._segs) > 1:
+            rel, p = self._segs.popitem(last=False)
+            if p.dirty:
+                self._write(rel, p)
+            total -= p.nbytes()
+
+    def note_appended(self, rel, items):
+        """记录刚追加到段 rel 的事件
+
+        :param items: [(偏移, 长度, 事件)]
+        """
+        if not items:
+            return
+        with self._lock:
+            p = self._segs.get(rel)
+            if p is None:
+                if items[0][0] != 0:
+                    # 未加载的旧段，查询时按水位补扫
+                    return
+                p = self._segs[rel] = _Postings(self._ino(self._seg_path(rel)))
+            if p.watermark != items[0][0]:
+                return
+            for off, length, ev in items:
+                p.add(off, length, ev)
+            self._evict()
+
+    def lookup(self, rel, keyword):
+        """段内可能包含关键字的行 [(原始偏移, 长度)]，按偏移升序
+
+        关键字没有可索引的词元，或候选行过多（顺序读整段更快）时返回 None。
+        """
+        frags = fragments(keyword)
+        if not frags:
+            return None
+        with self._lock:
+            p = self._get(rel)
+            if p is None:
+                return None
+            if len(p.delta) > FOLD_TERMS:
+                p.fold()
+            rows = p.candidates(frags)
+            if len(rows) > len(p.offs) * SCAN_RATIO:
+                return None
+            return [(p.offs[r], p.lens[r]) for r in sorted(rows)]
+
+    def save(self):
+        """把有改动的倒排表写回索引文件"""
+        with self._lock:
+            for rel, p in list(self._segs.items()):
+                if p.dirty:
+                    self._write(rel, p)
+
+    def drop_segments(self, rels):
+        """段被删除或压缩改写：丢弃其倒排，改写的段在下次查询时重建"""
+        with self._lock:
+            for rel in rels:
+                self._segs.pop(rel, None)
+                try:
+                    os.remove(self._file(rel))
+                except OSError:
+                    pass
+
+    def rename_segment(self, old, new):
+        """段被压缩为冷段：偏移不变，沿用倒排并记录新文件的 inode"""
+        with self._lock:
+            p = self._segs.pop(old, None) or self._load(old)
+            try:
+                os.remove(self._file(old))
+            except OSError:
+                pass
+            if p is None:
+                return
+            p.ino = self._ino(self._seg_path(new))
+            self._segs[new] = p
+            self._write(new, p)
+
+    def prune(self, live):
+        """删除已不存在的段遗留的索引文件
+
+        :param live: 现存段名（相对 data 目录）
+        """
+        names = set(os.path.basename(rel) + '.tok' for rel in live)
+        with self._lock:
+            for rel in [r for r in self._segs if r not in live]:
+                self._segs.pop(rel, None)
+            try:
+                for name in os.listdir(self.index_dir):
+                    if name.endswith('.tok') and name not in names:
+                        os.remove(os.path.join(self.index_dir, name))
+            except OSError:
+                pass
@@ -1,10 +1,12 @@
-import{getStats,getEvents,getConfig,connectSSE,fmtTime,sevPill,safe,toast,state,getAISuggestions,getHosts,generateAI}from"./api.js?v=2";
+import{getStats,getEvents,getConfig,getDashboard,connectSSE,fmtTime,sevPill,safe,toast,state,getAISuggestions,getHosts,generateAI}from"./api.js?v=2";
 let chart;
 let lastChartSig=null;
 let latestIds=new Set();
 let currentHostId="";
-async function loadHosts(){const sel=document.getElementById("host-filter");if(!sel)return;try{const res=await getHosts();const hosts=res?.hosts||[];sel.innerHTML='<option value="">全部机器</option>';hosts.forEach(h=>{const opt=document.createElement("option");opt.value=h;opt.textContent=h;sel.appendChild(opt)});sel.value=currentHostId}catch(e){console.error("加载机器列表失败",e)}}
-async function load(){const hostId=document.getElementById("host-filter")?.value||"";currentHostId=hostId;try{const s=await getStats(undefined,hostId);document.getElementById("metric-total").textContent=String(s.total_anomalies??0);document.getElementById("metric-critical").textContent=String((s.by_severity?.critical)||0);document.getElementById("metric-last").textContent=s.last_detection?fmtTime(s.last_detection):"-";document.getElementById("metric-last-scan").textContent=s.last_scan?fmtTime(s.last_scan):"-";const labels=Object.keys(s.by_type||{});const data=Object.values(s.by_type||{});renderChart(labels,data)}catch(e){toast(e.message||"加载统计失败","error")}
+function renderHosts(hosts){const sel=document.getElementById("host-filter");if(!sel)return;sel.innerHTML='<option value="">全部机器</option>';(hosts||[]).forEach(h=>{const opt=document.createElement("option");opt.value=h;opt.textContent=h;sel.appendChild(opt)});sel.value=currentHostId}
+async function loadHosts(){if(!document.getElementById("host-filter"))return;try{const res=await getHosts();renderHosts(res?.hosts||[])}catch(e){console.error("加载机器列表失败",e)}}
+function renderStats(s){document.getElementById("metric-total").textContent=String(s.total_anomalies??0);document.getElementById("metric-critical").textContent=String((s.by_severity?.critical)||0);document.getElementById("metric-last").textContent=s.last_detection?fmtTime(s.last_detection):"-";document.getElementById("metric-last-scan").textContent=s.last_scan?fmtTime(s.last_scan):"-";const labels=Object.keys(s.by_type||{});const data=Object.values(s.by_type||{});renderChart(labels,data)}
+async function load(){const hostId=document.getElementById("host-filter")?.value||"";currentHostId=hostId;try{const s=await getStats(undefined,hostId);renderStats(s)}catch(e){toast(e.message||"加载统计失败","error")}
 const params={page:1,size:10,sort:"detected_at:desc"};if(hostId)params.host_id=hostId;try{const res=await getEvents(params);renderLatest(res.items||[])}catch(e){toast(e.message||"加载事件失败","error")}}
 function renderChart(labels,data){const ctx=document.getElementById("typeChart");if(!ctx)return;const pairs=(labels||[]).map((l,i)=>[l,data?.[i]??0]).sort((a,b)=>String(a[0]).localeCompare(String(b[0])));const sig=JSON.stringify(pairs);if(lastChartSig&&lastChartSig===sig)return;lastChartSig=sig;const d={labels,datasets:[{label:"类型",data,backgroundColor:["#3a86ff","#ff006e","#fb5607","#8338ec","#3a506b","#06d6a0"]}]};if(chart){chart.data=d;chart.update();return}chart=new Chart(ctx,{type:"pie",data:d,options:{plugins:{legend:{labels:{color:"#e0e6f8"}}},onClick:(e,elements)=>{if(elements&&elements.length>0){const idx=elements[0].index;const type=labels[idx];openDrawer(type)}},onHover:(event,chartElement)=>{event.native.target.style.cursor=chartElement[0]?'pointer':'default'}}})}
 let drawerChart=null;async function openDrawer(type){const drawer=document.getElementById("type-drawer");const overlay=document.getElementById("drawer-overlay");const title=document.getElementById("drawer-title");if(!drawer||!overlay)return;title.textContent=`${type} 详情`;drawer.classList.add("show");overlay.classList.add("show");try{const hostId=document.getElementById("host-filter")?.value||"";const params={types:type,size:200,sort:"detected_at:desc"};if(hostId)params.host_id=hostId;const res=await getEvents(params);const items=res.items||[];renderDrawerChart(items);renderDrawerList(items.slice(0,10))}catch(e){console.error("加载详情失败",e);toast("加载详情失败","error")}}
@@ -16,14 +18,15 @@ function renderDrawerList(items){const tbody=document.getElementById("drawer-lis
 document.getElementById("drawer-close")?.addEventListener("click",closeDrawer);document.getElementById("drawer-overlay")?.addEventListener("click",closeDrawer);
 function renderLatest(items){const tbody=document.getElementById("latest-body");if(!tbody)return;tbody.innerHTML="";items.forEach(it=>{latestIds.add(it.id);const tr=document.createElement("tr");tr.innerHTML=`<td>${fmtTime(it.detected_at)}</td><td>${sevPill(it.severity)}</td><td>${safe(it.type)}</td><td>${safe(it.message)}</td><td>${safe(it.host_id||"")}</td><td>${safe(it.source_file)}:${safe(it.line_number)}</td>`;tbody.appendChild(tr)})}
 function onSSEAnomaly(e){if(!e||!e.id)return;const hostId=document.getElementById("host-filter")?.value||"";if(hostId&&e.host_id!==hostId)return;const tbody=document.getElementById("latest-body");if(!tbody)return;if(latestIds.has(e.id))return;latestIds.add(e.id);const tr=document.createElement("tr");tr.innerHTML=`<td>${fmtTime(e.detected_at)}</td><td>${sevPill(e.severity)}</td><td>${safe(e.type)}</td><td>${safe(e.message)}</td><td>${safe(e.host_id||"")}</td><td>${safe(e.source_file||"")}</td>`;tbody.prepend(tr);tbody.querySelectorAll("tr").forEach((row,i)=>{if(i>9)row.remove()})}
-async function loadAISuggestions(){const wrap=document.getElementById("ai-list");if(!wrap)return;wrap.innerHTML="<div style=\"color:#a7b1c9\">正在加载 AI 建议...</div>";try{const res=await getAISuggestions({limit:1});const items=res?.items||[];if(!items.length){wrap.innerHTML="<div style=\"color:#a7b1c9\">暂无 AI 建议</div>";return}let md=items[0].markdown||items[0].content||"";md=md.replace(/^\s*={10,}\s*$/gm, "").trim();let html;if(typeof window!=="undefined"&&window.marked){html=window.marked.parse(md);}else{html=`<pre style=\"white-space:pre-wrap\">${safe(md)}</pre>`;}wrap.innerHTML=html;}catch(e){wrap.innerHTML=`<div style="color:#ff6b6b">加载 AI 建议失败：${safe(e.message||"未知错误")}</div>`;}}
+function renderAI(res){const wrap=document.getElementById("ai-list");if(!wrap)return;const items=res?.items||[];if(!items.length){wrap.innerHTML="<div style=\"color:#a7b1c9\">暂无 AI 建议</div>";return}let md=items[0].markdown||items[0].content||"";md=md.replace(/^\s*={10,}\s*$/gm, "").trim();let html;if(typeof window!=="undefined"&&window.marked){html=window.marked.parse(md);}else{html=`<pre style=\"white-space:pre-wrap\">${safe(md)}</pre>`;}wrap.innerHTML=html;}
+async function loadAISuggestions(){const wrap=document.getElementById("ai-list");if(!wrap)return;wrap.innerHTML="<div style=\"color:#a7b1c9\">正在加载 AI 建议...</div>";try{const res=await getAISuggestions({limit:1});renderAI(res)}catch(e){wrap.innerHTML=`<div style="color:#ff6b6b">加载 AI 建议失败：${safe(e.message||"未知错误")}</div>`;}}
 document.getElementById("btn-refresh").addEventListener("click",()=>{load()});
 const aiBtn=document.getElementById("btn-ai-refresh");if(aiBtn){aiBtn.disabled=true}
 const genBtn=document.getElementById("btn-ai-generate");if(genBtn){genBtn.addEventListener("click",async()=>{const wrap=document.getElementById("ai-list");if(wrap){wrap.innerHTML='<div class="loading"><span class="spinner"></span><span>正在生成 AI 建议...</span></div>'}try{genBtn.disabled=true;await generateAI({window:"PT24H"});await loadAISuggestions()}catch(e){if(wrap){wrap.innerHTML=`<div class="error">生成失败：${safe(e.message||"未知错误")}</div>`}}finally{genBtn.disabled=false}})}
 const hostFilter=document.getElementById("host-filter");if(hostFilter){hostFilter.addEventListener("change",()=>{load()})}
 document.addEventListener("sse:anomaly",ev=>onSSEAnomaly(ev.detail));
 connectSSE();
-loadHosts();
-load();
-loadAISuggestions();
-getConfig().then(c=>{const sec=(c.ui?.auto_refresh_sec)||30;setInterval(()=>{load()},sec*1000);setInterval(()=>{loadHosts()},sec*5000)}).catch(()=>{setInterval(()=>{load()},30000);setInterval(()=>{loadHosts()},60000)})
+function startRefresh(c){const sec=(c?.ui?.auto_refresh_sec)||30;setInterval(()=>{load()},sec*1000);setInterval(()=>{loadHosts()},sec*5000)}
+// 首屏数据（统计、最新事件、主机、配置、AI 建议）一次请求取回，失败时退回逐项加载
+async function bootstrap(){try{const d=await getDashboard({size:10});state.config=d.config;renderHosts(d.hosts);renderStats(d.stats);renderLatest(d.events?.items||[]);renderAI(d.ai_suggestions);startRefresh(d.config)}catch(e){loadHosts();load();loadAISuggestions();getConfig().then(startRefresh).catch(()=>{setInterval(()=>{load()},30000);setInterval(()=>{loadHosts()},60000)})}}
+bootstrap();